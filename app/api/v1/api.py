@@ -1,8 +1,8 @@
 from fastapi import APIRouter
 from fastapi.staticfiles import StaticFiles
 
-from app.api.v1.endpoints import (admin, billing, denominations, products,
-                                  static)
+from app.api.v1.endpoints import (admin, billing, carts, denominations,
+                                  products, static)
 
 api_router = APIRouter()
 
@@ -13,6 +13,8 @@ api_router.include_router(products.router, prefix="/products", tags=["products"]
 
 api_router.include_router(billing.router, prefix="/bills", tags=["billing"])
 
+api_router.include_router(carts.router, prefix="/carts", tags=["carts"])
+
 api_router.include_router(
     denominations.router, prefix="/denominations", tags=["denominations"]
 )
@@ -1,12 +1,19 @@
+import asyncio
 from pathlib import Path
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
+from app.core.admission import admission_controller
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.retry import retry_stats
 from app.db.session import get_db
+from app.db.slow_query import slow_query_log
+from app.services.low_stock import low_stock_tracker
 from app.models.models import Denomination, Product
 from app.schemas.schemas import Denomination as DenominationSchema
 from app.schemas.schemas import Product as ProductSchema
@@ -37,15 +44,13 @@ async def admin_denominations(request: Request):
     return templates.TemplateResponse("admin_denominations.html", {"request": request})
 
 
-@router.get("/admin/stats", response_class=HTMLResponse)
+@router.get("/admin/stats")
 async def admin_stats(request: Request, db: Session = Depends(get_db)):
     """Get admin dashboard statistics"""
     try:
         # Get products statistics
         total_products = db.query(Product).count()
-        low_stock_products = (
-            db.query(Product).filter(Product.available_stocks < 10).count()
-        )
+        low_stock_products = low_stock_tracker.count(db)
 
         # Get denominations statistics
         total_denominations = db.query(Denomination).count()
@@ -102,3 +107,55 @@ async def admin_stats(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(
             status_code=500, detail=f"Error fetching admin stats: {str(e)}"
         )
+
+
+@router.get("/admin/events")
+async def admin_events(request: Request):
+    """Stream dashboard deltas as server-sent events"""
+    subscription = event_bus.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), timeout=settings.SSE_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Comment frame keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield event.encode()
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/admin/admission")
+async def admission_metrics():
+    """Admission control counters: in-flight, queued and rejected requests"""
+    return admission_controller.metrics()
+
+
+@router.get("/admin/retries")
+async def retry_metrics():
+    """Transactions re-run after version conflicts, serialization failures or deadlocks"""
+    return retry_stats.snapshot()
+
+
+@router.get("/admin/slow-queries")
+def slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    order_by: str = Query("total", pattern="^(total|max)$"),
+):
+    """Top statement fingerprints by total or max time over recent queries"""
+    return {
+        "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+        "queries": slow_query_log.top(limit, order_by),
+    }
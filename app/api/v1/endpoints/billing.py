@@ -1,19 +1,35 @@
+import logging
+import zlib
 from datetime import datetime
-from typing import List
+from decimal import Decimal
+from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi import (APIRouter, BackgroundTasks, Depends, HTTPException,
+                     Query, Request, Response, status)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
-from app.core.exceptions import (CustomerNotFoundError, EmailError,
-                                 InsufficientPaymentError,
-                                 InsufficientStockError, ProductNotFoundError)
+from app.core.config import settings
+from app.core.exceptions import (BillNotFoundError, CustomerNotFoundError,
+                                 EmailError, InsufficientPaymentError,
+                                 InsufficientStockError, InvalidCursorError,
+                                 ProductNotFoundError, ReceiptQueueFullError)
 from app.db.session import get_db
 from app.models.models import BillDenomination, Denomination
-from app.schemas.schemas import (Bill, BillCreate, BillResponse,
-                                 CustomerPurchaseHistory, MessageResponse)
+from app.schemas.schemas import (Bill, BillCreate, BillQuote,
+                                 BillQuoteRequest, BillResponse,
+                                 BillSearchResult,
+                                 CustomerAnalytics, CustomerPurchaseHistory,
+                                 MessageResponse, SyncBatch, SyncResult)
+from app.schemas.serializers import FastJSONResponse, dumps, serialize_bill
 from app.services.billing_service import BillingService
+from app.services.receipts import receipt_renderer
+from app.services.sync_service import SyncService
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 @router.post("/", response_model=BillResponse, status_code=status.HTTP_201_CREATED)
@@ -26,8 +42,13 @@ async def create_bill(
         bill_obj, balance_denominations = await billing_service.create_bill(
             bill, background_tasks
         )
-        bill_obj.customer_email = bill.customer_email
-        return BillResponse(bill=bill_obj, balance_denominations=balance_denominations)
+        return FastJSONResponse(
+            status_code=status.HTTP_201_CREATED,
+            content={
+                "bill": serialize_bill(bill_obj, bill.customer_email),
+                "balance_denominations": balance_denominations,
+            },
+        )
     except (
         InsufficientStockError,
         InsufficientPaymentError,
@@ -37,8 +58,60 @@ async def create_bill(
     except EmailError as e:
         # Don't fail the bill creation if email fails
         # Log the error and continue
-        print(f"Email sending failed: {str(e)}")
-        return BillResponse(bill=bill_obj, balance_denominations=balance_denominations)
+        logger.error("Email sending failed: %s", str(e))
+        return FastJSONResponse(
+            status_code=status.HTTP_201_CREATED,
+            content={
+                "bill": serialize_bill(bill_obj, bill.customer_email),
+                "balance_denominations": balance_denominations,
+            },
+        )
+
+
+@router.post("/quote", response_model=BillQuote)
+async def quote_bill(quote: BillQuoteRequest, db: Session = Depends(get_db)):
+    """Price a cart and compute change without creating a bill"""
+    billing_service = BillingService(db)
+    return billing_service.quote_bill(quote)
+
+
+def _read_sync_body(body: bytes, encoding: str) -> bytes:
+    limit = settings.SYNC_MAX_BODY_BYTES
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, limit + 1)
+        except zlib.error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid gzip body"
+            )
+    elif encoding not in ("", "identity"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported content encoding: {encoding}",
+        )
+    if len(body) > limit:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Sync batch too large",
+        )
+    return body
+
+
+@router.post("/sync", response_model=SyncResult)
+async def sync_bills(
+    request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+):
+    """Apply a batch of bills recorded offline by an edge till"""
+    body = _read_sync_body(
+        await request.body(), request.headers.get("content-encoding", "").lower()
+    )
+    try:
+        batch = SyncBatch.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    sync_service = SyncService(db)
+    return await sync_service.apply_batch(batch, background_tasks)
 
 
 @router.get("/customer/{email}", response_model=CustomerPurchaseHistory)
@@ -46,22 +119,105 @@ async def get_customer_bills(email: str, db: Session = Depends(get_db)):
     """Get all bills for a customer"""
     try:
         billing_service = BillingService(db)
-        bills = billing_service.get_customer_bills(email)
-        return CustomerPurchaseHistory(customer_email=email, bills=bills)
+        bills = billing_service.get_customer_bill_documents(email)
+        # Splice the cached documents together instead of re-encoding them
+        content = (
+            b'{"customer_email":' + dumps(email) + b',"bills":[' + b",".join(bills) + b"]}"
+        )
+        return Response(content=content, media_type="application/json")
     except CustomerNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 
+@router.get("/customer/{email}/analytics", response_model=CustomerAnalytics)
+async def get_customer_analytics(email: str, db: Session = Depends(get_db)):
+    """Get a customer's spend summary, top products and monthly spend"""
+    try:
+        billing_service = BillingService(db)
+        return Response(
+            content=billing_service.get_customer_analytics(email),
+            media_type="application/json",
+        )
+    except CustomerNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.get("/search", response_model=BillSearchResult)
+async def search_bills(
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    min_total: Optional[Decimal] = None,
+    max_total: Optional[Decimal] = None,
+    product_id: Optional[str] = None,
+    mail_sent: Optional[bool] = None,
+    register_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=settings.BILL_SEARCH_MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    """Find bills by date, rounded total, product, email status or till,
+    newest first; pass next_cursor back as cursor for the next page"""
+    try:
+        billing_service = BillingService(db)
+        bills, next_cursor, scan_capped = billing_service.search_bill_documents(
+            created_from=created_from,
+            created_to=created_to,
+            min_total=min_total,
+            max_total=max_total,
+            product_id=product_id,
+            mail_sent=mail_sent,
+            register_id=register_id,
+            cursor=cursor,
+            limit=limit,
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Splice the cached documents together instead of re-encoding them
+    content = (
+        b'{"bills":[' + b",".join(bills) + b'],"next_cursor":' + dumps(next_cursor)
+        + b',"scan_capped":' + dumps(scan_capped) + b"}"
+    )
+    return Response(content=content, media_type="application/json")
+
+
 @router.get("/{bill_id}", response_model=Bill)
 async def get_bill(bill_id: int, db: Session = Depends(get_db)):
     """Get a specific bill by ID"""
     try:
         billing_service = BillingService(db)
-        return billing_service.get_bill(bill_id)
-    except CustomerNotFoundError as e:
+        return Response(
+            content=billing_service.get_bill_document(bill_id),
+            media_type="application/json",
+        )
+    except BillNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 
+@router.get("/{bill_id}/receipt.pdf", response_class=FileResponse)
+async def get_bill_receipt(bill_id: int, db: Session = Depends(get_db)):
+    """Get a bill's PDF receipt, rendered once in a worker process"""
+    path = receipt_renderer.cached(bill_id)
+    if path is None:
+        try:
+            billing_service = BillingService(db)
+            receipt = billing_service.get_receipt_data(bill_id)
+            path = await receipt_renderer.render(bill_id, receipt)
+        except BillNotFoundError as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+        except ReceiptQueueFullError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": "1"},
+            )
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=f"receipt-{bill_id}.pdf",
+        content_disposition_type="inline",
+    )
+
+
 @router.post("/test-email", response_model=MessageResponse)
 async def test_email(
     email: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
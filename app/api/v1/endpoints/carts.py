@@ -0,0 +1,89 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.core.exceptions import (CartConflictError, CartNotFoundError,
+                                 InsufficientPaymentError,
+                                 InsufficientStockError, ProductNotFoundError)
+from app.db.session import get_db
+from app.schemas.schemas import (BillResponse, Cart, CartCheckout, CartCreate,
+                                 CartItemsUpdate, MessageResponse)
+from app.schemas.serializers import FastJSONResponse, serialize_bill
+from app.services.cart_service import CartService
+
+router = APIRouter()
+
+
+@router.post("/", response_model=Cart, status_code=status.HTTP_201_CREATED)
+def create_cart(cart: CartCreate, db: Session = Depends(get_db)):
+    """Open a new cart"""
+    try:
+        return CartService(db).create_cart(cart.items).to_dict()
+    except ProductNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.get("/{cart_id}", response_model=Cart)
+def get_cart(cart_id: str, db: Session = Depends(get_db)):
+    """Get a cart with its running totals"""
+    try:
+        return CartService(db).get_cart(cart_id).to_dict()
+    except CartNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.patch("/{cart_id}/items", response_model=Cart)
+def update_cart_items(
+    cart_id: str, update: CartItemsUpdate, db: Session = Depends(get_db)
+):
+    """Set quantities for the given lines; quantity 0 removes a line"""
+    try:
+        return CartService(db).update_items(cart_id, update.items).to_dict()
+    except (CartNotFoundError, ProductNotFoundError) as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except CartConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@router.delete("/{cart_id}", response_model=MessageResponse)
+def delete_cart(cart_id: str, db: Session = Depends(get_db)):
+    """Abandon a cart"""
+    try:
+        CartService(db).delete_cart(cart_id)
+        return {"detail": "Cart deleted successfully"}
+    except CartNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.post(
+    "/{cart_id}/checkout",
+    response_model=BillResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def checkout_cart(
+    cart_id: str,
+    checkout: CartCheckout,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    """Turn a cart into a bill at the prices locked into the cart"""
+    try:
+        bill_obj, balance_denominations = await CartService(db).checkout(
+            cart_id, checkout, background_tasks
+        )
+    except CartNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except CartConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except (
+        InsufficientStockError,
+        InsufficientPaymentError,
+        ProductNotFoundError,
+    ) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return FastJSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content={
+            "bill": serialize_bill(bill_obj, checkout.customer_email),
+            "balance_denominations": balance_denominations,
+        },
+    )
@@ -1,11 +1,16 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.services.product_service import ProductService
-from app.schemas.schemas import Product, ProductCreate, ProductUpdate, MessageResponse
-from app.core.exceptions import ProductNotFoundError, DatabaseError
+from app.services.product_service import ProductService, read_import_rows
+from app.schemas.schemas import (BulkStockResult, BulkStockUpdate, Product,
+                                 ProductCreate, ProductImportReport,
+                                 ProductUpdate, MessageResponse, RankedProduct,
+                                 StockMovement, StockMovementCreate, StockOnHand)
+from app.core.exceptions import ProductNotFoundError, DatabaseError, ValidationError
 
 router = APIRouter()
 
@@ -24,15 +29,54 @@ async def create_product(
             detail=str(e)
         )
 
+@router.post("/import", response_model=ProductImportReport)
+async def import_products(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """Bulk import products from a CSV or NDJSON upload"""
+    try:
+        product_service = ProductService(db)
+        rows = read_import_rows(file.file, file.filename or "")
+        # Large catalogs take a while; keep the event loop free meanwhile
+        return await run_in_threadpool(product_service.import_products, rows)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unreadable import file: {str(e)}"
+        )
+    except DatabaseError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.post("/stock/bulk", response_model=BulkStockResult)
+async def bulk_update_stock(
+    update: BulkStockUpdate,
+    db: Session = Depends(get_db)
+):
+    """Adjust stock for many products in one request"""
+    try:
+        product_service = ProductService(db)
+        return product_service.bulk_update_stock(update.adjustments)
+    except (ValidationError, DatabaseError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.get("/", response_model=List[Product])
 async def get_products(
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """Get list of products with pagination"""
+    """Get list of products in id order; page with ``after_id`` (the last id
+    seen) so pages stay stable while the catalog changes"""
     product_service = ProductService(db)
-    return product_service.get_products(skip=skip, limit=limit)
+    return product_service.get_products(skip=skip, limit=limit, after_id=after_id)
 
 @router.get("/search", response_model=List[Product])
 async def search_products(
@@ -45,6 +89,39 @@ async def search_products(
     product_service = ProductService(db)
     return product_service.search_products(query, skip=skip, limit=limit)
 
+@router.get("/low-stock", response_model=List[Product])
+async def get_low_stock_products(
+    db: Session = Depends(get_db)
+):
+    """Get products below their reorder threshold"""
+    product_service = ProductService(db)
+    return product_service.get_low_stock_products()
+
+@router.get("/top", response_model=List[RankedProduct])
+async def get_top_products(
+    limit: int = 10,
+    db: Session = Depends(get_db)
+):
+    """Best-selling products over the recent window"""
+    product_service = ProductService(db)
+    return product_service.get_top_products(limit=limit)
+
+@router.get("/{id}/related", response_model=List[RankedProduct])
+async def get_related_products(
+    id: int,
+    limit: int = 5,
+    db: Session = Depends(get_db)
+):
+    """Products most often bought together with this one"""
+    try:
+        product_service = ProductService(db)
+        return product_service.get_related_products(id, limit=limit)
+    except ProductNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+
 @router.get("/{id}", response_model=Product)
 async def get_product(
     id: str,
@@ -121,4 +198,58 @@ async def update_stock(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
-        )
\ No newline at end of file
+        )
+
+@router.post("/{id}/movements", response_model=Product)
+async def record_stock_movement(
+    id: int,
+    stock_movement: StockMovementCreate,
+    db: Session = Depends(get_db)
+):
+    """Receive, return or adjust stock, recording the movement"""
+    try:
+        product_service = ProductService(db)
+        return product_service.record_stock_movement(id, stock_movement)
+    except ProductNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except (ValidationError, DatabaseError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/{id}/movements", response_model=List[StockMovement])
+async def get_stock_movements(
+    id: int,
+    limit: int = 100,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """A product's stock movements, newest first; page with before_id"""
+    try:
+        product_service = ProductService(db)
+        return product_service.get_stock_movements(id, limit=limit, before_id=before_id)
+    except ProductNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+
+@router.get("/{id}/stock", response_model=StockOnHand)
+async def get_stock_at(
+    id: int,
+    at: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Stock on hand per the movement ledger, now or at a point in time"""
+    try:
+        product_service = ProductService(db)
+        return product_service.get_stock_at(id, at)
+    except ProductNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
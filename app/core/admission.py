@@ -0,0 +1,232 @@
+"""Admission control in front of the database-backed routes.
+
+Every worker has a fixed number of pooled DB connections. Rather than let
+requests pile up on the pool's checkout timeout, requests are admitted
+against per-class concurrency limits and a shared capacity sized to the
+pool. Waiters queue by priority (bill creation first) in bounded queues;
+anything that would overflow a queue, or waits too long, gets a fast 503
+with ``Retry-After``.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+
+BILLS = "bills"
+WRITES = "writes"
+READS = "reads"
+
+_API = settings.API_V1_STR
+_DB_PREFIXES = tuple(
+    f"{_API}/{name}"
+    for name in ("bills", "carts", "products", "denominations", "admin/stats")
+)
+_CHECKOUT = re.compile(rf"^{re.escape(_API)}/carts/[^/]+/checkout$")
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Map a request to its admission class, or None to let it straight through"""
+    if not path.startswith(_DB_PREFIXES):
+        return None
+    if method == "POST" and (path == f"{_API}/bills/" or _CHECKOUT.match(path)):
+        return BILLS
+    if method in ("GET", "HEAD"):
+        return READS
+    return WRITES
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, route_class: str, reason: str):
+        self.route_class = route_class
+        self.reason = reason
+        super().__init__(f"Server busy ({reason}) for {route_class} requests")
+
+
+@dataclass
+class RouteClass:
+    name: str
+    priority: int  # Lower is admitted first
+    limit: int
+    max_queue: int
+    in_flight: int = 0
+    queued: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def metrics(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(1000 * self.wait_seconds / self.admitted, 2)
+            if self.admitted
+            else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait_seconds, 2),
+        }
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    route_class: RouteClass = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class AdmissionController:
+    """Priority admission against per-class limits and a shared capacity.
+
+    All state is touched from the event loop only, so no locking is needed.
+    """
+
+    def __init__(self, capacity: int, classes: List[RouteClass], max_wait: float):
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.classes = {c.name: c for c in classes}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    def _can_run(self, route_class: RouteClass) -> bool:
+        return self.in_flight < self.capacity and route_class.in_flight < route_class.limit
+
+    def _take_slot(self, route_class: RouteClass) -> None:
+        self.in_flight += 1
+        route_class.in_flight += 1
+        route_class.admitted += 1
+
+    def _record_wait(self, route_class: RouteClass, waited: float) -> None:
+        route_class.wait_seconds += waited
+        route_class.max_wait_seconds = max(route_class.max_wait_seconds, waited)
+
+    async def acquire(self, name: str) -> None:
+        route_class = self.classes[name]
+        # Anyone still queued is blocked on capacity or their own class limit,
+        # so taking a free slot here never overtakes a runnable waiter
+        if self._can_run(route_class):
+            self._take_slot(route_class)
+            return
+        if route_class.queued >= route_class.max_queue:
+            route_class.rejected += 1
+            raise AdmissionRejected(name, "queue full")
+
+        waiter = _Waiter(
+            route_class.priority,
+            next(self._seq),
+            route_class,
+            asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._waiters, waiter)
+        route_class.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as we gave up; hand the slot back
+                self.release(name)
+            else:
+                waiter.future.cancel()
+                route_class.queued -= 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            route_class.timed_out += 1
+            route_class.rejected += 1
+            raise AdmissionRejected(name, "queue timeout")
+        self._record_wait(route_class, time.monotonic() - started)
+
+    def release(self, name: str) -> None:
+        route_class = self.classes[name]
+        self.in_flight -= 1
+        route_class.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        blocked = []
+        while self._waiters and self.in_flight < self.capacity:
+            waiter = heapq.heappop(self._waiters)
+            if waiter.future.done():
+                continue  # Timed out or disconnected
+            if waiter.route_class.in_flight >= waiter.route_class.limit:
+                blocked.append(waiter)
+                continue
+            waiter.route_class.queued -= 1
+            # Reserve the slot now so later wakes in this pass see it taken
+            self._take_slot(waiter.route_class)
+            waiter.future.set_result(None)
+        for waiter in blocked:
+            heapq.heappush(self._waiters, waiter)
+
+    def metrics(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": sum(c.queued for c in self.classes.values()),
+            "classes": {name: c.metrics() for name, c in self.classes.items()},
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that gates requests through an AdmissionController"""
+
+    def __init__(self, app: ASGIApp, controller: "AdmissionController"):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(name)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": str(e)},
+                headers={
+                    "Retry-After": str(math.ceil(settings.ADMISSION_RETRY_AFTER_SECONDS))
+                },
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
+
+
+def _build_controller() -> AdmissionController:
+    classes: Tuple[RouteClass, ...] = (
+        RouteClass(BILLS, 0, settings.ADMISSION_BILLS_LIMIT, settings.ADMISSION_BILLS_QUEUE),
+        RouteClass(WRITES, 1, settings.ADMISSION_WRITES_LIMIT, settings.ADMISSION_WRITES_QUEUE),
+        RouteClass(READS, 2, settings.ADMISSION_READS_LIMIT, settings.ADMISSION_READS_QUEUE),
+    )
+    return AdmissionController(
+        capacity=settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+        classes=list(classes),
+        max_wait=settings.ADMISSION_MAX_WAIT_SECONDS,
+    )
+
+
+admission_controller = _build_controller()
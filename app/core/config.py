@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional
 
 from pydantic import EmailStr
 from pydantic_settings import BaseSettings
@@ -10,6 +10,11 @@ class Settings(BaseSettings):
     VERSION: str = "1.0.0"
     DESCRIPTION: str = "A FastAPI-based billing system with PostgreSQL"
     API_V1_STR: str = "/api/v1"
+    DEBUG: bool = False
+
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: Dict[str, str] = {}  # Per-logger overrides, e.g. {"app.db": "DEBUG"}
 
     # Security
     SECRET_KEY: str
@@ -17,6 +22,21 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # Seconds to wait for a pooled connection
+    # e.g. "REPEATABLE READ" or "SERIALIZABLE"; None keeps the driver default
+    DB_ISOLATION_LEVEL: Optional[str] = None
+    # Re-runs of a service transaction that hit a version conflict,
+    # serialization failure or deadlock
+    RETRY_MAX_ATTEMPTS: int = 4
+    RETRY_BASE_DELAY_SECONDS: float = 0.005
+    RETRY_MAX_DELAY_SECONDS: float = 0.2
+    SQL_INSTRUMENTATION: bool = False  # Per-request query counts and N+1 warnings
+    N_PLUS_ONE_THRESHOLD: int = 5  # Repeats of one statement shape in a request
+    SLOW_QUERY_LOG: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 100.0  # Plans are captured above this
+    SLOW_QUERY_RING_SIZE: int = 10_000  # Recent statements aggregated by /admin/slow-queries
 
     # CORS
     ALLOWED_ORIGINS: List[str] = [
@@ -37,6 +57,89 @@ class Settings(BaseSettings):
     # Denominations
     DEFAULT_DENOMINATIONS: List[int] = [500, 200, 100, 50, 20, 10, 5, 2, 1]
 
+    # Inventory
+    LOW_STOCK_THRESHOLD: int = 10  # Default reorder threshold for new products
+    PRODUCT_IMPORT_CHUNK_SIZE: int = 5000
+    PRODUCT_IMPORT_MAX_ERRORS: int = 1000  # Errors listed in an import report
+    STOCK_BULK_CHUNK_SIZE: int = 1000  # Rows per UPDATE ... FROM (VALUES ...)
+    # Movements newer than this may belong to transactions still in flight
+    # and are left for the next compaction
+    STOCK_COMPACTION_SETTLE_SECONDS: int = 60
+    STOCK_MOVEMENT_RETENTION_DAYS: Optional[int] = None  # Pruned once compacted; None keeps all
+
+    # Catalog price cache
+    CATALOG_CACHE_MAX_ENTRIES: int = 100_000
+    CATALOG_VERSION_POLL_SECONDS: float = 1.0  # Used when LISTEN/NOTIFY is unavailable
+
+    # Advisory drawer view used by bill quotes
+    DRAWER_CACHE_TTL_SECONDS: float = 2.0
+
+    # Low-stock set behind the dashboard count, reloaded in case peer events were lost
+    LOW_STOCK_TTL_SECONDS: float = 10.0
+
+    # Serialised bill documents kept in memory per worker
+    BILL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Customer email -> id lookups kept in memory per worker
+    CUSTOMER_CACHE_MAX_ENTRIES: int = 100_000
+
+    # Bill search
+    BILL_SEARCH_MAX_LIMIT: int = 200  # Bills per page
+    BILL_SEARCH_MAX_SCAN: int = 10_000  # Bills examined per query; the rest via next_cursor
+
+    # PDF receipts, rendered in worker processes and kept on disk
+    RECEIPT_CACHE_DIR: Optional[str] = None  # Defaults to <tmp>/billing-receipts
+    RECEIPT_CACHE_MAX_FILES: Optional[int] = 50_000  # Oldest deleted past this; None keeps all
+    RECEIPT_WORKERS: int = 2
+    RECEIPT_QUEUE_SIZE: int = 32  # Renders queued or running before requests get a 503
+    RECEIPT_EMAIL_ATTACHMENT: bool = False  # Attach the receipt PDF to bill emails
+
+    # Per-customer purchase analytics
+    ANALYTICS_CACHE_MAX_ENTRIES: int = 10_000
+    ANALYTICS_TOP_PRODUCTS: int = 10
+    ANALYTICS_MONTHS: int = 24  # Most recent months of spend returned
+
+    # Top sellers and frequently bought together
+    POPULARITY_WINDOW_HOURS: int = 7 * 24
+    POPULARITY_BUCKET_SECONDS: int = 3600
+    POPULARITY_TOP_CAPACITY: int = 50  # Ranked products kept; the most /products/top returns
+    POPULARITY_RELATED_CAPACITY: int = 20  # Co-purchased products kept per product
+    POPULARITY_CHECKPOINT_SECONDS: float = 300.0
+
+    # Admin dashboard events
+    EVENT_QUEUE_SIZE: int = 100  # Pending deltas per subscriber before a resync
+    SSE_HEARTBEAT_SECONDS: int = 15
+
+    # Admission control; in-flight requests are also capped at pool size + overflow
+    ADMISSION_BILLS_LIMIT: int = 12
+    ADMISSION_BILLS_QUEUE: int = 50
+    ADMISSION_WRITES_LIMIT: int = 6
+    ADMISSION_WRITES_QUEUE: int = 20
+    ADMISSION_READS_LIMIT: int = 4  # Admin and history reads
+    ADMISSION_READS_QUEUE: int = 10
+    ADMISSION_MAX_WAIT_SECONDS: float = 2.0  # Queued longer than this gets a 503
+    ADMISSION_RETRY_AFTER_SECONDS: float = 1.0
+
+    # Multi-process serving
+    INIT_DB_ON_STARTUP: bool = True  # The prefork launcher does this once itself
+    INVALIDATION_SOCKET_DIR: Optional[str] = None  # Shared by workers on one box
+
+    # Offline-first till: bills commit to the local DATABASE_URL and are
+    # pushed to CENTRAL_URL from an outbox when the link is up
+    EDGE_MODE: bool = False
+    REGISTER_ID: Optional[str] = None
+    CENTRAL_URL: Optional[str] = None  # e.g. http://billing.internal:8000
+    EDGE_SYNC_BATCH_SIZE: int = 200
+    EDGE_SYNC_INTERVAL_SECONDS: float = 5.0
+    EDGE_SYNC_MAX_BACKOFF_SECONDS: float = 300.0
+    EDGE_CATALOG_REFRESH_SECONDS: float = 60.0
+    SYNC_MAX_BODY_BYTES: int = 32 * 1024 * 1024  # Decompressed size accepted by /bills/sync
+
+    # Server-side carts
+    CART_MAX_CARTS: int = 10_000  # Carts held in memory; older ones reload from the journal
+    CART_TTL_SECONDS: int = 2 * 60 * 60
+    CART_JOURNAL_PATH: str = "data/carts.sqlite3"
+
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Event:
+    """A compact delta pushed to dashboard subscribers"""
+
+    type: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    remote: bool = field(default=False, compare=False)  # Replayed from another worker
+
+    def encode(self) -> str:
+        """Encode the event as a server-sent events frame"""
+        return f"event: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n"
+
+
+RESYNC = Event("resync")
+
+
+class Subscription:
+    """Bounded per-subscriber queue fed by the event bus.
+
+    Publishers may run on any thread; the consumer awaits on the event loop
+    it subscribed from. When the queue overflows the pending deltas are
+    dropped and the consumer receives a single ``resync`` event instead.
+    """
+
+    def __init__(self, maxsize: int, loop: asyncio.AbstractEventLoop):
+        self.maxsize = maxsize
+        self._loop = loop
+        self._queue: Deque[Event] = deque()
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self._overflowed = False
+
+    def deliver(self, event: Event) -> None:
+        with self._lock:
+            if self._overflowed:
+                return
+            if len(self._queue) >= self.maxsize:
+                self._queue.clear()
+                self._overflowed = True
+            else:
+                self._queue.append(event)
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self) -> Event:
+        while True:
+            with self._lock:
+                if self._overflowed:
+                    self._overflowed = False
+                    return RESYNC
+                if self._queue:
+                    return self._queue.popleft()
+                self._ready.clear()
+            await self._ready.wait()
+
+
+class EventBus:
+    """In-process pub/sub bus used by the service layer"""
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self._subscribers: Set[Subscription] = set()
+        self._listeners: List[Callable[[Event], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[Event], None]) -> None:
+        """Register an in-process callback run synchronously on every publish"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def subscribe(self, maxsize: Optional[int] = None) -> Subscription:
+        """Register a subscriber on the running event loop"""
+        subscription = Subscription(maxsize or self.maxsize, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, type: str, **data: Any) -> None:
+        """Push an event to every subscriber without blocking the publisher"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        if not subscribers and not listeners:
+            return
+
+        self._deliver(Event(type, data), subscribers, listeners)
+
+    def dispatch(self, event: Event) -> None:
+        """Deliver an already built event, e.g. one replayed from another worker"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        self._deliver(event, subscribers, listeners)
+
+    def _deliver(
+        self, event: Event, subscribers: List[Subscription], listeners: List[Callable]
+    ) -> None:
+        type = event.type
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Event listener failed for %s", type)
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # The subscriber's event loop is gone
+                self.unsubscribe(subscription)
+
+
+event_bus = EventBus(maxsize=settings.EVENT_QUEUE_SIZE)
+
+
+def _publish_threshold_crossing(
+    id: int,
+    product_id: str,
+    previous: Optional[int],
+    current: int,
+    threshold: int,
+    previous_threshold: Optional[int] = None,
+) -> None:
+    """``low_stock`` when a product drops under its reorder threshold and
+    ``stock_recovered`` when it climbs back to it.
+
+    An unknown previous level counts as a crossing so the change is not lost.
+    """
+    was_low = None
+    if previous is not None:
+        was_low = previous < (threshold if previous_threshold is None else previous_threshold)
+    is_low = current < threshold
+    if was_low is is_low:
+        return
+    event_bus.publish(
+        "low_stock" if is_low else "stock_recovered",
+        id=id,
+        product_id=product_id,
+        available_stocks=current,
+        reorder_threshold=threshold,
+    )
+
+
+def publish_stock_change(
+    id: int,
+    product_id: str,
+    previous: int,
+    current: int,
+    threshold: int,
+    previous_threshold: Optional[int] = None,
+) -> None:
+    """Publish a stock delta and any reorder-threshold crossing"""
+    if previous != current:
+        event_bus.publish(
+            "stock_changed", id=id, product_id=product_id, available_stocks=current
+        )
+    _publish_threshold_crossing(id, product_id, previous, current, threshold, previous_threshold)
+
+
+def publish_stock_levels(changes: List[Tuple[int, str, Optional[int], int, int]]) -> None:
+    """Publish a batch of stock levels as one event, plus any threshold crossings.
+
+    Each change is (id, product_id, previous, current, reorder_threshold).
+    """
+    if not changes:
+        return
+    event_bus.publish(
+        "stock_levels",
+        levels=[
+            {"id": id, "product_id": product_id, "available_stocks": current}
+            for id, product_id, _, current, _ in changes
+        ],
+    )
+    for id, product_id, previous, current, threshold in changes:
+        _publish_threshold_crossing(id, product_id, previous, current, threshold)
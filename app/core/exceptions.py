@@ -68,6 +68,42 @@ class BillNotFoundError(BillingSystemException):
         super().__init__(self.message)
 
 
+class CartNotFoundError(BillingSystemException):
+    """Raised when a cart does not exist or has expired"""
+
+    def __init__(self, cart_id: str):
+        self.cart_id = cart_id
+        self.message = f"Cart not found with ID: {cart_id}"
+        super().__init__(self.message)
+
+
+class CartConflictError(BillingSystemException):
+    """Raised when a cart changed or went to checkout in another request"""
+
+    def __init__(self, cart_id: str):
+        self.cart_id = cart_id
+        self.message = f"Cart {cart_id} was changed or checked out by another request"
+        super().__init__(self.message)
+
+
+class InvalidCursorError(BillingSystemException):
+    """Raised when a pagination cursor cannot be decoded"""
+
+    def __init__(self, cursor: str):
+        self.cursor = cursor
+        self.message = f"Invalid cursor: {cursor}"
+        super().__init__(self.message)
+
+
+class ReceiptQueueFullError(BillingSystemException):
+    """Raised when too many receipts are already waiting to be rendered"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.message = f"Receipt rendering is busy ({limit} pending); retry shortly"
+        super().__init__(self.message)
+
+
 class EmailError(BillingSystemException):
     """Raised when there is an error sending email"""
 
@@ -0,0 +1,203 @@
+"""Cross-process invalidation between workers on the same box.
+
+Each worker binds a Unix datagram socket in a shared directory; a broadcast
+is one ``sendto`` per peer socket found there. Caches subscribe to topics
+and drop or patch their own copies when a peer reports a change. Local
+dashboard events are forwarded too, so every worker's drawer view and SSE
+stream sees changes made by the others. Broadcasts made inside ``batch()``,
+such as everything one bill publishes, go out together as one datagram.
+
+Delivery is best effort: a peer whose queue is full misses the message.
+Nothing whose correctness depends on it may rely on the channel alone;
+carts, for one, check their journal revision on every access.
+
+When no socket directory is configured (single-process mode) broadcasting
+is a no-op.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.core.events import RESYNC, Event, event_bus
+
+logger = logging.getLogger(__name__)
+
+# Keep well under the default AF_UNIX datagram limit
+_MAX_DATAGRAM = 60 * 1024
+# Rescan for peers at least this often even if the directory looks unchanged,
+# in case its mtime is too coarse to show a worker that just started
+_PEER_RESCAN_SECONDS = 5.0
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+class InvalidationChannel:
+    def __init__(self):
+        self.directory: Optional[str] = None
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._sock: Optional[socket.socket] = None
+        self._path: Optional[str] = None
+        self._pid: Optional[int] = None
+        self._peers: List[str] = []
+        self._peers_mtime: Optional[int] = None
+        self._peers_scanned = 0.0
+        self._batch: ContextVar[Optional[List[bytes]]] = ContextVar("batch", default=None)
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        self._handlers[topic].append(handler)
+
+    def start(self, directory: str) -> None:
+        """Bind this process's socket and start receiving peer broadcasts"""
+        if self._sock is not None and self._pid == os.getpid():
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._pid = os.getpid()
+        self.directory = directory
+        self._path = os.path.join(directory, f"{self._pid}.sock")
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self._path)
+        self._sock = sock
+        threading.Thread(
+            target=self._receive, args=(sock,), name="invalidation", daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+        if self._path and self._pid == os.getpid() and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    @property
+    def active(self) -> bool:
+        return self._sock is not None
+
+    def broadcast(self, topic: str, **data: Any) -> bool:
+        """Send a change to every other worker without blocking the caller.
+
+        Returns False if the message was too large to send.
+        """
+        if self._sock is None:
+            return True
+        message = json.dumps({"topic": topic, "data": data}, default=str).encode()
+        if len(message) > _MAX_DATAGRAM - 64:
+            return False
+        batch = self._batch.get()
+        if batch is not None:
+            batch.append(message)
+        else:
+            self._send([message])
+        return True
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Hold this context's broadcasts and send them as one datagram on exit"""
+        if self._batch.get() is not None:
+            yield  # The outermost batch sends
+            return
+        messages: List[bytes] = []
+        token = self._batch.set(messages)
+        try:
+            yield
+        finally:
+            self._batch.reset(token)
+            self._send(messages)
+
+    def _send(self, messages: List[bytes]) -> None:
+        sock = self._sock
+        if sock is None or not messages:
+            return
+        prefix = b'{"pid": %d, "messages": [' % self._pid
+        datagrams, chunk, size = [], [], len(prefix) + 2
+        for message in messages:
+            if chunk and size + len(message) + 1 > _MAX_DATAGRAM:
+                datagrams.append(chunk)
+                chunk, size = [], len(prefix) + 2
+            chunk.append(message)
+            size += len(message) + 1
+        datagrams.append(chunk)
+        payloads = [prefix + b", ".join(chunk) + b"]}" for chunk in datagrams]
+
+        for path in self._peer_paths():
+            for payload in payloads:
+                try:
+                    sock.sendto(payload, socket.MSG_DONTWAIT, path)
+                    self.sent += 1
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The worker is gone; clear its socket so nobody tries it again
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    self._peers_mtime = None
+                    break
+                except BlockingIOError:
+                    self.dropped += 1
+                    logger.warning("Invalidation queue full for %s", os.path.basename(path))
+
+    def _peer_paths(self) -> List[str]:
+        """Other workers' sockets, rescanned only when the directory changes"""
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        now = time.monotonic()
+        if mtime != self._peers_mtime or now - self._peers_scanned > _PEER_RESCAN_SECONDS:
+            self._peers = [
+                entry.path
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".sock") and entry.path != self._path
+            ]
+            self._peers_mtime, self._peers_scanned = mtime, now
+        return self._peers
+
+    def _receive(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                payload = sock.recv(_MAX_DATAGRAM)
+            except OSError:
+                return  # Socket closed by stop()
+            try:
+                envelope = json.loads(payload)
+            except ValueError:
+                continue
+            if envelope.get("pid") == self._pid:
+                continue
+            for message in envelope["messages"]:
+                self.received += 1
+                for handler in self._handlers.get(message["topic"], []):
+                    try:
+                        handler(message["data"])
+                    except Exception:
+                        logger.exception("Invalidation handler failed for %s", message["topic"])
+
+
+invalidation_channel = InvalidationChannel()
+
+
+def _forward_event(event: Event) -> None:
+    if event.remote or not invalidation_channel.active:
+        return
+    if not invalidation_channel.broadcast("event", type=event.type, data=event.data):
+        # Peers can't get the delta itself; make their dashboards reload
+        invalidation_channel.broadcast("event", type=RESYNC.type, data={})
+
+
+def _replay_event(data: Dict[str, Any]) -> None:
+    event_bus.dispatch(Event(data["type"], data["data"], remote=True))
+
+
+event_bus.add_listener(_forward_event)
+invalidation_channel.subscribe("event", _replay_event)
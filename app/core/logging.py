@@ -0,0 +1,121 @@
+"""Structured JSON logging that never blocks the request path.
+
+Records are handed to a QueueHandler and written to stdout by a listener
+thread, one JSON object per line. The current request id and bill id are
+attached from contextvars when the record is created, so they survive the
+hop to the listener thread.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+bill_id_var: ContextVar[Optional[int]] = ContextVar("bill_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the request and bill being handled"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.bill_id = bill_id_var.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging() -> None:
+    """Route the ``app`` loggers through a queue to a stdout JSON writer"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger("app")
+    logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.propagate = False
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+
+class RequestContextMiddleware:
+    """Assign a request id, echo it back and log each request's timing"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.logger = logging.getLogger("app.request")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id")
+        request_id = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex
+        request_token = request_id_var.set(request_id)
+        bill_token = bill_id_var.set(None)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.logger.info(
+                "request",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                },
+            )
+            bill_id_var.reset(bill_token)
+            request_id_var.reset(request_token)
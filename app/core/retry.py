@@ -0,0 +1,134 @@
+"""Re-run service transactions that lost an optimistic-concurrency race.
+
+Product and Denomination rows carry a version column, so a flush that
+updates a row someone else changed since it was read raises StaleDataError
+instead of silently overwriting their change. The same retry covers
+serialization failures and deadlocks at REPEATABLE READ/SERIALIZABLE and
+SQLite's busy errors. The whole method is re-run after a rollback, so it
+re-reads current rows; nothing it publishes happens before its commit.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Postgres serialization_failure / deadlock_detected
+_RETRYABLE_PGCODES = {"40001": "serialization", "40P01": "deadlock"}
+
+
+def retry_reason(error: BaseException) -> Optional[str]:
+    """Why ``error`` is worth retrying, or None.
+
+    Services wrap database errors in their own exceptions, so the whole
+    cause/context chain is searched.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, StaleDataError):
+            return "stale"
+        if isinstance(error, DBAPIError):
+            reason = _RETRYABLE_PGCODES.get(getattr(error.orig, "pgcode", None))
+            if reason:
+                return reason
+            if "database is locked" in str(error.orig):
+                return "locked"
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class RetryStats:
+    def __init__(self):
+        self.retries: Counter = Counter()
+        self.exhausted: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, name: str, reason: str, exhausted: bool) -> None:
+        with self._lock:
+            (self.exhausted if exhausted else self.retries)[f"{name}:{reason}"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {"retries": dict(self.retries), "exhausted": dict(self.exhausted)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.retries.clear()
+            self.exhausted.clear()
+
+
+retry_stats = RetryStats()
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter keeps colliding transactions from retrying in lockstep
+    cap = min(
+        settings.RETRY_MAX_DELAY_SECONDS,
+        settings.RETRY_BASE_DELAY_SECONDS * 2 ** attempt,
+    )
+    return random.uniform(0, cap)
+
+
+def retry_on_conflict(method: F) -> F:
+    """Retry a service method (sync or async) whose transaction lost a race.
+
+    The service must keep its session on ``self.db``; it is rolled back
+    before each new attempt.
+    """
+    name = method.__qualname__
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        reason = retry_reason(error)
+        if reason is None:
+            return False
+        exhausted = attempt + 1 >= settings.RETRY_MAX_ATTEMPTS
+        retry_stats.record(name, reason, exhausted)
+        if exhausted:
+            logger.warning("giving up after conflicts", extra={"method": name, "reason": reason})
+            return False
+        self.db.rollback()
+        return True
+
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return await method(self, *args, **kwargs)
+                except Exception as e:
+                    if not should_retry(self, e, attempt):
+                        raise
+                await asyncio.sleep(_backoff(attempt))
+                attempt += 1
+
+        return async_wrapper  # type: ignore[return-value]
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return method(self, *args, **kwargs)
+            except Exception as e:
+                if not should_retry(self, e, attempt):
+                    raise
+            time.sleep(_backoff(attempt))
+            attempt += 1
+
+    return wrapper  # type: ignore[return-value]
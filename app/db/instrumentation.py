@@ -0,0 +1,135 @@
+"""Opt-in per-request SQL instrumentation.
+
+Counts statements and DB time for the current request through SQLAlchemy
+cursor events, and flags statement shapes that repeat within one request,
+which is what an N+1 looks like from the database side.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Type
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# Expanded IN lists and multi-row VALUES vary in length with the cart size
+_PARAM_LIST = re.compile(r"\?(?:\s*,\s*\?)+|%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+")
+_VALUES_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+
+
+def statement_shape(statement: str) -> str:
+    """Normalise a statement so calls differing only in parameter counts match"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _PARAM_LIST.sub("?, ...", shape)
+    return _VALUES_LIST.sub(r"\1, ...", shape)
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+    statements: List[str] = field(default_factory=list)
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Statement shapes issued at least ``threshold`` times"""
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+# Capture windows opened by tests, which see queries from every thread
+_captures: List[QueryStats] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current.get()
+    targets = _captures if stats is None else [stats, *_captures]
+    if not targets:
+        return
+    shape = statement_shape(statement)
+    for target in targets:
+        target.count += 1
+        target.seconds += elapsed
+        target.shapes[shape] += 1
+        target.statements.append(statement)
+
+
+def install(engine: Type[Engine] = Engine) -> None:
+    """Attach the cursor listeners; the default covers every engine"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Count queries run in the current context (a request, or a task it spawns)"""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def capture_queries() -> Iterator[QueryStats]:
+    """Count every query in the process while the block runs (for tests)"""
+    install()
+    stats = QueryStats()
+    _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        _captures.remove(stats)
+
+
+class QueryCountMiddleware:
+    """Tracks queries per request, reporting N+1 shapes and debug headers"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        install()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_with_headers(message: Message) -> None:
+                if message["type"] == "http.response.start" and settings.DEBUG:
+                    headers = MutableHeaders(scope=message)
+                    headers["X-DB-Queries"] = str(stats.count)
+                    headers["X-DB-Time"] = f"{stats.seconds * 1000:.2f}ms"
+                await send(message)
+
+            await self.app(scope, receive, send_with_headers)
+
+        for shape, n in stats.repeated(settings.N_PLUS_ONE_THRESHOLD).items():
+            logger.warning(
+                "Possible N+1",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "repeats": n,
+                    "statement": shape,
+                },
+            )
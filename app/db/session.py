@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
 
@@ -7,11 +8,53 @@ from app.core.config import settings
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,  # Enable connection pool "pre-ping" feature
-    pool_size=5,  # Set the pool size
-    max_overflow=10,  # Maximum number of connections to allow over the pool size
-    pool_timeout=30,  # Timeout for getting a connection from the pool
+    pool_size=settings.DB_POOL_SIZE,  # Set the pool size
+    max_overflow=settings.DB_MAX_OVERFLOW,  # Maximum number of connections to allow over the pool size
+    pool_timeout=settings.DB_POOL_TIMEOUT,  # Timeout for getting a connection from the pool
+    **({"isolation_level": settings.DB_ISOLATION_LEVEL} if settings.DB_ISOLATION_LEVEL else {}),
 )
 
+
+
+def configure_sqlite(engine: Engine) -> None:
+    """Let SQLite write transactions take the write lock when they begin.
+
+    pysqlite only opens a transaction at the first INSERT/UPDATE, so the
+    stock and drawer reads before it run outside any transaction, and SQLite
+    ignores FOR UPDATE. Two concurrent checkouts could then both read the
+    same stock and one decrement would be lost. Transactions opened with
+    ``begin_write`` start with BEGIN IMMEDIATE, which serialises writers the
+    way the row locks do on Postgres; everything else uses a plain BEGIN, so
+    reads don't queue behind the write lock.
+    """
+
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        if conn.get_execution_options().get("sqlite_begin_immediate"):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            conn.exec_driver_sql("BEGIN")
+
+
+def begin_write(db: Session) -> None:
+    """Open the session's next transaction as a write transaction.
+
+    On SQLite that takes the database write lock up front. A transaction
+    that is already open is left as it is; should it then lose the lock to
+    another writer it fails with "database is locked", which
+    retry_on_conflict retries.
+    """
+    if not db.in_transaction() and db.get_bind().dialect.name == "sqlite":
+        db.connection(execution_options={"sqlite_begin_immediate": True})
+
+
+if engine.dialect.name == "sqlite":
+    configure_sqlite(engine)
+
 # Create SessionLocal class with custom settings
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,146 @@
+"""Slow-query log keyed by statement fingerprint.
+
+The cursor hook only timestamps the statement and drops a (statement, elapsed)
+pair into a fixed-size ring; slot assignment is a single atomic store under
+the GIL, so writers never take a lock. Fingerprinting, aggregation and
+EXPLAIN all happen when the table is read.
+"""
+import itertools
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.db.instrumentation import statement_shape
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_MAX_SLOW_SAMPLES = 1000
+
+
+def fingerprint(statement: str) -> str:
+    """Strip literals and parameter list lengths so equivalent statements group"""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    return statement_shape(shape)
+
+
+class SlowQueryLog:
+    def __init__(self, size: int, threshold_seconds: float):
+        self.size = size
+        self.threshold = threshold_seconds
+        self._ring: List[Optional[Tuple[str, float]]] = [None] * size
+        self._next = itertools.count()
+        # First slow occurrence per fingerprint, as (statement, parameters,
+        # engine), kept until its plan is captured
+        self._slow_samples: Dict[str, Tuple[str, Any, Any]] = {}
+        self._plans: Dict[str, str] = {}
+        self._fingerprints: Dict[str, str] = {}
+
+    def record(self, statement: str, elapsed: float, parameters: Any, engine: Engine) -> None:
+        self._ring[next(self._next) % self.size] = (statement, elapsed)
+        if elapsed < self.threshold or len(self._slow_samples) >= _MAX_SLOW_SAMPLES:
+            return
+        if statement.startswith("EXPLAIN"):
+            return  # Our own, from _plan
+        key = self._fingerprint(statement)
+        if key in self._plans or key in self._slow_samples:
+            return
+        if isinstance(parameters, list):  # executemany: any row shows the plan
+            parameters = parameters[0] if parameters else None
+        self._slow_samples[key] = (statement, parameters, engine)
+
+    def _fingerprint(self, statement: str) -> str:
+        found = self._fingerprints.get(statement)
+        if found is None:
+            if len(self._fingerprints) > 10 * self.size:
+                self._fingerprints.clear()
+            found = self._fingerprints[statement] = fingerprint(statement)
+        return found
+
+    def top(self, limit: int = 20, order_by: str = "total") -> List[Dict[str, Any]]:
+        """Aggregate the samples currently in the ring, slowest fingerprints first"""
+        stats: Dict[str, Dict[str, Any]] = {}
+        for sample in list(self._ring):
+            if sample is None:
+                continue
+            statement, elapsed = sample
+            key = self._fingerprint(statement)
+            entry = stats.get(key)
+            if entry is None:
+                entry = stats[key] = {
+                    "fingerprint": key,
+                    "count": 0,
+                    "slow_count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "statement": statement,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed * 1000
+            if elapsed >= self.threshold:
+                entry["slow_count"] += 1
+            if elapsed * 1000 > entry["max_ms"]:
+                entry["max_ms"] = elapsed * 1000
+                entry["statement"] = statement
+
+        key = "max_ms" if order_by == "max" else "total_ms"
+        rows = sorted(stats.values(), key=lambda e: e[key], reverse=True)[:limit]
+        for entry in rows:
+            entry["mean_ms"] = round(entry["total_ms"] / entry["count"], 3)
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["max_ms"] = round(entry["max_ms"], 3)
+            del entry["statement"]
+            entry["plan"] = self._plan(entry["fingerprint"])
+        return rows
+
+    def _plan(self, key: str) -> Optional[str]:
+        """EXPLAIN the first slow occurrence of a fingerprint, once"""
+        if key in self._plans:
+            return self._plans[key]
+        sample = self._slow_samples.pop(key, None)
+        if sample is None:
+            return None
+        # The sampled text, whose parameters fit it; the slowest statement in
+        # the ring may be another variant of the fingerprint
+        statement, parameters, engine = sample
+        explain = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+        try:
+            with engine.connect() as conn:
+                rows = conn.exec_driver_sql(f"{explain} {statement}", parameters or ())
+                plan = "\n".join(" ".join(str(c) for c in row) for row in rows)
+        except Exception as e:
+            plan = f"EXPLAIN failed: {str(e)}"
+        self._plans[key] = plan
+        return plan
+
+    def clear(self) -> None:
+        self._ring = [None] * self.size
+        self._slow_samples.clear()
+        self._plans.clear()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._slow_query_started = time.perf_counter()
+
+
+def install(log: SlowQueryLog, engine: Type[Engine] = Engine) -> None:
+    """Time every cursor execution into ``log``"""
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is not None:
+            log.record(statement, time.perf_counter() - started, parameters, conn.engine)
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+slow_query_log = SlowQueryLog(
+    size=settings.SLOW_QUERY_RING_SIZE,
+    threshold_seconds=settings.SLOW_QUERY_THRESHOLD_MS / 1000,
+)
@@ -1,25 +1,48 @@
+import logging
+import socket
+
+import httpx
+
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from sqlalchemy.orm.exc import StaleDataError
 
 from app.api.v1.api import api_router
+from app.core.admission import AdmissionMiddleware, admission_controller
 from app.core.config import settings
+from app.core.invalidation import invalidation_channel
+from app.core.logging import RequestContextMiddleware, setup_logging
 from app.core.exceptions import (BillingSystemException, BillNotFoundError,
-                                 CustomerNotFoundError, DatabaseError,
-                                 EmailError, InsufficientPaymentError,
+                                 CartConflictError, CartNotFoundError,
+                                 CustomerNotFoundError,
+                                 DatabaseError, EmailError,
+                                 InsufficientPaymentError,
                                  InsufficientStockError,
                                  InvalidDenominationError,
                                  MismatchPaymentError, ProductNotFoundError,
                                  ValidationError)
-from app.db.session import engine
+from app.db.instrumentation import QueryCountMiddleware
+from app.db.session import SessionLocal, engine
+from app.db.slow_query import install as install_slow_query_log
+from app.db.slow_query import slow_query_log
 from app.models.models import Base
+from app.schemas.serializers import FastJSONResponse
+from app.services.catalog_cache import catalog_cache
+from app.services.edge_sync import EdgeSync
+from app.services.popularity import popularity_index
+from app.services.receipts import receipt_renderer
 from scripts.seed_data import main
 
+setup_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description=settings.DESCRIPTION,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=FastJSONResponse,
 )
 
 # CORS middleware configuration
@@ -31,18 +54,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shed load with fast 503s before requests queue on the DB pool
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# Query counts per request; X-DB-Queries/X-DB-Time headers in debug mode
+if settings.SQL_INSTRUMENTATION:
+    app.add_middleware(QueryCountMiddleware)
+
+# Time every statement for the slow-query table
+if settings.SLOW_QUERY_LOG:
+    install_slow_query_log(slow_query_log)
+
+# Outermost, so the request id covers everything below it
+app.add_middleware(RequestContextMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
+def init_db():
+    # Create tables if they don't exist
+    Base.metadata.create_all(bind=engine)
+    logger.info("Database tables created or verified on startup")
+    # Seed the products and denomoinations for testing purpose; an edge
+    # till copies both from the central server instead
+    if not settings.EDGE_MODE:
+        main()
+
+
 # Create database tables on startup
 @app.on_event("startup")
 async def create_tables():
-    # Create tables if they don't exist
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created or verified on startup")
-    # Seed the products and denomoinations for testing purpose
-    main()
+    if settings.INIT_DB_ON_STARTUP:
+        init_db()
+    # Follow price changes made by other workers
+    catalog_cache.start_listener(engine)
+    if settings.INVALIDATION_SOCKET_DIR:
+        invalidation_channel.start(settings.INVALIDATION_SOCKET_DIR)
+    # Top sellers and co-purchases resume from their last checkpoint
+    popularity_index.start(SessionLocal)
+    if settings.EDGE_MODE and settings.CENTRAL_URL:
+        app.state.edge_sync = EdgeSync(
+            SessionLocal,
+            httpx.Client(base_url=settings.CENTRAL_URL, timeout=10.0),
+            settings.REGISTER_ID or socket.gethostname(),
+        )
+        app.state.edge_sync.start()
+
+
+@app.on_event("shutdown")
+async def stop_invalidation():
+    invalidation_channel.stop()
+    edge_sync = getattr(app.state, "edge_sync", None)
+    if edge_sync is not None:
+        edge_sync.stop()
+    popularity_index.stop(SessionLocal)
+    receipt_renderer.shutdown()
 
 
 # ---------- Custom Exception Handlers ----------
@@ -54,6 +121,8 @@ def register_exception_handlers(app: FastAPI):
         BillingSystemException: 500,
         CustomerNotFoundError: 404,
         BillNotFoundError: 404,
+        CartNotFoundError: 404,
+        CartConflictError: 409,
         DatabaseError: 500,
         EmailError: 500,
         MismatchPaymentError: 400,
@@ -72,6 +141,15 @@ def register_exception_handlers(app: FastAPI):
                 content={"detail": str(exc)},
             )
 
+    @app.exception_handler(StaleDataError)
+    async def conflict_handler(request: Request, exc: StaleDataError):
+        # retry_on_conflict gave up; the client can safely try again
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "The request conflicted with concurrent updates; retry it"},
+            headers={"Retry-After": "1"},
+        )
+
     # Catch-all for any unhandled exceptions
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
@@ -1,11 +1,13 @@
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import (Boolean, Column, DateTime, Float, ForeignKey, Integer,
-                        String, UniqueConstraint)
+from sqlalchemy import (BigInteger, Boolean, Column, DateTime, Float,
+                        ForeignKey, Index, Integer, LargeBinary, String,
+                        UniqueConstraint)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
+from app.core.config import settings
 from app.db.base_class import Base
 
 
@@ -16,14 +18,80 @@ class Product(Base):
     name = Column(String(255), nullable=False)
     product_id = Column(String(50), unique=True, nullable=False, index=True)
     available_stocks = Column(Integer, nullable=False)
+    # Stock below this is low; the product needs reordering
+    reorder_threshold = Column(
+        Integer,
+        nullable=False,
+        default=settings.LOW_STOCK_THRESHOLD,
+        server_default=str(settings.LOW_STOCK_THRESHOLD),
+    )
     unit_price = Column(Float(precision=2), nullable=False)
     tax_percentage = Column(Float(precision=2), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped on every update; stale ORM writes raise instead of overwriting
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
     bill_items = relationship("BillItem", back_populates="product")
 
+    __mapper_args__ = {"version_id_col": version}
+    # Only the few products under their threshold are in this index, so
+    # listing them never scans the catalog
+    __table_args__ = (
+        Index(
+            "ix_products_low_stock",
+            available_stocks,
+            postgresql_where=available_stocks < reorder_threshold,
+            sqlite_where=available_stocks < reorder_threshold,
+        ),
+    )
+
+
+class StockMovement(Base):
+    """Append-only record of every change to a product's stock"""
+
+    __tablename__ = "stock_movements"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    kind = Column(String(20), nullable=False)  # sale, receipt, adjustment, return
+    quantity = Column(Integer, nullable=False)  # Signed change to stock on hand
+    bill_id = Column(Integer, ForeignKey("bills.id"), nullable=True)
+    note = Column(String(255), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    __table_args__ = (
+        Index("ix_stock_movements_product_id_id", product_id, id),
+        # Snapshots refer to movements by id, so pruned ids must never come back
+        {"sqlite_autoincrement": True},
+    )
+
+
+class StockSnapshot(Base):
+    """Stock on hand after all of a product's movements up to last_movement_id"""
+
+    __tablename__ = "stock_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    last_movement_id = Column(Integer, nullable=False)
+    as_of = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_stock_snapshots_product_id_last_movement_id", product_id, last_movement_id),
+    )
+
+
+class StockLedgerState(Base):
+    """Single-row record of how far back the movement ledger has been pruned"""
+
+    __tablename__ = "stock_ledger_state"
+
+    id = Column(Integer, primary_key=True)
+    pruned_before = Column(DateTime(timezone=True), nullable=False)
+
 
 class Customer(Base):
     __tablename__ = "customers"
@@ -40,7 +108,7 @@ class Bill(Base):
     __tablename__ = "bills"
 
     id = Column(Integer, primary_key=True, index=True)
-    customer_id = Column(Integer, ForeignKey("customers.id"))
+    customer_id = Column(Integer, ForeignKey("customers.id"), index=True)
     total_amount = Column(Float(precision=2), nullable=False)
     rounded_total_amount = Column(Float(precision=2), nullable=False)
     tax_amount = Column(Float(precision=2), nullable=False)
@@ -48,17 +116,23 @@ class Bill(Base):
     balance_amount = Column(Float(precision=2), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     mail_sent = Column(Boolean, nullable=False, default=False, server_default="0")
+    # Set for bills rung up on an offline till and synced in later
+    register_id = Column(String(50), nullable=True, index=True)
+    sync_id = Column(String(36), nullable=True, unique=True)
     # Relationships
     customer = relationship("Customer", back_populates="bills")
     items = relationship("BillItem", back_populates="bill")
     denominations = relationship("BillDenomination", back_populates="bill")
 
+    # Bill search walks this newest first and pages by (created_at, id)
+    __table_args__ = (Index("ix_bills_created_at_id", created_at, id),)
+
 
 class BillItem(Base):
     __tablename__ = "bill_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    bill_id = Column(Integer, ForeignKey("bills.id"))
+    bill_id = Column(Integer, ForeignKey("bills.id"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Float(precision=2), nullable=False)
@@ -71,6 +145,9 @@ class BillItem(Base):
     bill = relationship("Bill", back_populates="items")
     product = relationship("Product", back_populates="bill_items")
 
+    # EXISTS probes from bill search: has this bill sold this product?
+    __table_args__ = (Index("ix_bill_items_product_id_bill_id", product_id, bill_id),)
+
 
 class Denomination(Base):
     __tablename__ = "denominations"
@@ -80,10 +157,13 @@ class Denomination(Base):
     count = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
     bill_denominations = relationship("BillDenomination", back_populates="denomination")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class BillDenomination(Base):
     __tablename__ = "bill_denominations"
@@ -97,3 +177,52 @@ class BillDenomination(Base):
     # Relationships
     bill = relationship("Bill", back_populates="denominations")
     denomination = relationship("Denomination", back_populates="bill_denominations")
+
+
+class CatalogVersion(Base):
+    """Single-row counter bumped whenever product prices or taxes change"""
+
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class SyncOutbox(Base):
+    """Bills committed on an edge till, waiting to be pushed to the central server"""
+
+    __tablename__ = "sync_outbox"
+
+    id = Column(Integer, primary_key=True)
+    bill_id = Column(Integer, ForeignKey("bills.id"), nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # Serialised bill document
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    synced_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+
+class StockConflict(Base):
+    """Stock a synced offline sale could not take because it had already gone"""
+
+    __tablename__ = "stock_conflicts"
+
+    id = Column(Integer, primary_key=True)
+    bill_id = Column(Integer, ForeignKey("bills.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    register_id = Column(String(50), nullable=True)
+    requested = Column(Integer, nullable=False)
+    shortfall = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    resolved = Column(Boolean, nullable=False, default=False, server_default="0")
+
+
+class PopularityCheckpoint(Base):
+    """Single-row snapshot of the in-memory top sellers and co-purchase index"""
+
+    __tablename__ = "popularity_checkpoint"
+
+    id = Column(Integer, primary_key=True)
+    last_bill_id = Column(Integer, nullable=False, default=0)  # Bills after this are replayed
+    payload = Column(LargeBinary, nullable=False)
+    checkpointed_at = Column(DateTime(timezone=True), nullable=False)
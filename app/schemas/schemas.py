@@ -13,6 +13,7 @@ class ProductBase(BaseModel):
     available_stocks: int
     unit_price: Decimal = Field(..., ge=0)
     tax_percentage: Decimal = Field(..., ge=0, le=100)
+    reorder_threshold: Optional[int] = Field(None, ge=0)  # Defaults to LOW_STOCK_THRESHOLD
 
 
 class ProductCreate(ProductBase):
@@ -35,6 +36,91 @@ class Product(ProductBase):
         from_attributes = True
 
 
+class RankedProduct(BaseModel):
+    product: Product
+    count: int  # Units sold in the window, or bills bought together
+
+
+class ProductImportError(BaseModel):
+    row: int
+    product_id: Optional[str] = None
+    error: str
+
+
+class ProductImportReport(BaseModel):
+    received: int
+    imported: int
+    failed: int
+    errors: List[ProductImportError]
+    errors_truncated: bool
+
+
+class StockAdjustment(BaseModel):
+    product_id: str
+    delta: Optional[int] = None
+    absolute: Optional[int] = Field(None, ge=0)
+    expected_stock: Optional[int] = None  # Optimistic check against current stock
+
+    @root_validator(pre=True)
+    def require_delta_or_absolute(cls, values):
+        if (values.get("delta") is None) == (values.get("absolute") is None):
+            raise ValueError("Provide exactly one of delta or absolute")
+        return values
+
+
+class BulkStockUpdate(BaseModel):
+    adjustments: List[StockAdjustment] = Field(..., min_length=1)
+
+
+class StockLevel(BaseModel):
+    id: int
+    product_id: str
+    available_stocks: int
+
+
+class StockRejection(BaseModel):
+    product_id: str
+    reason: str
+
+
+class BulkStockResult(BaseModel):
+    updated: List[StockLevel]
+    rejected: List[StockRejection]
+
+
+class StockMovementCreate(BaseModel):
+    kind: str = Field(..., pattern="^(receipt|adjustment|return)$")
+    quantity: int  # Signed change to stock on hand
+    note: Optional[str] = Field(None, max_length=255)
+
+    @validator("quantity")
+    def check_direction(cls, quantity, values):
+        if quantity == 0:
+            raise ValueError("Quantity must not be zero")
+        if values.get("kind") in ("receipt", "return") and quantity < 0:
+            raise ValueError("Receipts and returns add stock")
+        return quantity
+
+
+class StockMovement(BaseModel):
+    id: int
+    product_id: int
+    kind: str
+    quantity: int
+    bill_id: Optional[int]
+    note: Optional[str]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class StockOnHand(BaseModel):
+    id: int
+    available_stocks: int  # Per the ledger
+    at: Optional[datetime]  # None for now
+
+
 # Bill Item Schemas
 class BillItemBase(BaseModel):
     product_id: str
@@ -178,5 +264,154 @@ class CustomerPurchaseHistory(BaseModel):
     bills: List[Bill]
 
 
+class BillSearchResult(BaseModel):
+    bills: List[Bill]
+    next_cursor: Optional[str]  # None once there are no more bills
+    scan_capped: bool  # The page stopped early at the scan cap; keep paging
+
+
+class CustomerTopProduct(BaseModel):
+    product_id: str
+    name: str
+    quantity: int
+    spent: Decimal
+    bills: int
+
+
+class CustomerMonthlySpend(BaseModel):
+    month: str  # YYYY-MM
+    bills: int
+    spent: Decimal
+
+
+class CustomerBasket(BaseModel):
+    amount: Decimal
+    lines: Decimal
+    units: Decimal
+
+
+class CustomerAnalytics(BaseModel):
+    customer_email: EmailStr
+    bill_count: int
+    total_spent: Decimal
+    total_tax: Decimal
+    first_purchase_at: Optional[datetime] = None
+    last_purchase_at: Optional[datetime] = None
+    average_basket: CustomerBasket
+    top_products: List[CustomerTopProduct]
+    monthly_spend: List[CustomerMonthlySpend]
+
+
 class BillCreate(BillBase):
     denomination: List[DenominationBase]
+
+
+class BillQuoteRequest(BaseModel):
+    items: List[BillItemCreate]
+    paid_amount: Optional[Decimal] = Field(None, ge=0)
+    denomination: List[DenominationBase] = []
+
+
+class BillQuoteItem(BaseModel):
+    product_id: str
+    quantity: int
+    unit_price: Decimal
+    tax_percentage: Decimal
+    tax_amount: Decimal
+    total_amount: Decimal
+
+
+class BillQuote(BaseModel):
+    items: List[BillQuoteItem]
+    total_amount: Decimal
+    tax_amount: Decimal
+    rounded_total_amount: Decimal
+    paid_amount: Optional[Decimal] = None
+    balance_amount: Optional[Decimal] = None
+    balance_denominations: List
+    problems: List[str]  # Reasons a submit with this cart would be rejected
+
+
+# Cart Schemas
+class CartItemUpdate(BaseModel):
+    product_id: str
+    quantity: int = Field(..., ge=0)  # 0 removes the line
+
+
+class CartCreate(BaseModel):
+    items: List[CartItemUpdate] = []
+
+
+class CartItemsUpdate(BaseModel):
+    items: List[CartItemUpdate] = Field(..., min_length=1)
+
+
+class CartLine(BaseModel):
+    product_id: str
+    quantity: int
+    unit_price: Decimal
+    tax_percentage: Decimal
+    tax_amount: Decimal
+    total_amount: Decimal
+
+
+class Cart(BaseModel):
+    id: str
+    items: List[CartLine]
+    total_amount: Decimal
+    tax_amount: Decimal
+    rounded_total_amount: Decimal
+    expires_in_seconds: int
+
+
+class CartCheckout(BaseModel):
+    customer_email: EmailStr
+    paid_amount: Decimal = Field(..., ge=0)
+    denomination: List[DenominationBase]
+
+
+# Offline till sync Schemas
+class SyncBillItem(BaseModel):
+    product_id: str
+    quantity: int = Field(..., gt=0)
+    unit_price: Decimal
+    tax_percentage: Decimal
+    tax_amount: Decimal
+    total_amount: Decimal
+
+
+class SyncBill(BaseModel):
+    sync_id: str = Field(..., max_length=36)
+    customer_email: EmailStr
+    created_at: datetime
+    total_amount: Decimal
+    rounded_total_amount: Decimal
+    tax_amount: Decimal
+    paid_amount: Decimal
+    balance_amount: Decimal
+    items: List[SyncBillItem] = Field(..., min_length=1)
+    change_denominations: List[DenominationBase] = []
+
+
+class SyncBatch(BaseModel):
+    register_id: str = Field(..., max_length=50)
+    bills: List[SyncBill]
+
+
+class SyncStockConflict(BaseModel):
+    sync_id: str
+    product_id: str
+    requested: int
+    shortfall: int
+
+
+class SyncRejection(BaseModel):
+    sync_id: str
+    reason: str
+
+
+class SyncResult(BaseModel):
+    accepted: List[str]
+    duplicates: List[str]  # Already applied by an earlier push
+    conflicts: List[SyncStockConflict]
+    rejected: List[SyncRejection]
@@ -0,0 +1,126 @@
+"""Fast JSON path for bill responses.
+
+Builds response documents straight from ORM objects or raw row tuples,
+skipping Pydantic model construction and validation, and encodes them with
+orjson. The output matches what the ``Bill`` schema produces.
+"""
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+# Column order expected by the raw row serializers
+BILL_COLUMNS = (
+    "id",
+    "total_amount",
+    "rounded_total_amount",
+    "tax_amount",
+    "balance_amount",
+    "mail_sent",
+    "created_at",
+    "paid_amount",
+)
+BILL_ITEM_COLUMNS = (
+    "id",
+    "product_id",
+    "quantity",
+    "unit_price",
+    "tax_percentage",
+    "tax_amount",
+    "total_amount",
+    "created_at",
+)
+
+
+def _decimal(value: Any) -> Optional[str]:
+    """Render a numeric column the way Pydantic renders a Decimal field"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        text = repr(value)
+        return text if "e" not in text else str(Decimal(text))
+    return str(value)
+
+
+def serialize_bill_item_row(row: Sequence[Any]) -> Dict[str, Any]:
+    """Serialize a row laid out as BILL_ITEM_COLUMNS"""
+    id, product_id, quantity, unit_price, tax_percentage, tax_amount, total_amount, created_at = row
+    return {
+        "id": id,
+        "product_id": str(product_id) if product_id is not None else None,
+        "quantity": quantity,
+        "unit_price": _decimal(unit_price),
+        "tax_percentage": _decimal(tax_percentage),
+        "tax_amount": _decimal(tax_amount),
+        "total_amount": _decimal(total_amount),
+        "created_at": created_at,
+    }
+
+
+def serialize_bill_row(
+    row: Sequence[Any], items: List[Dict[str, Any]], customer_email: Optional[str]
+) -> Dict[str, Any]:
+    """Serialize a row laid out as BILL_COLUMNS with already serialized items"""
+    id, total_amount, rounded_total_amount, tax_amount, balance_amount, mail_sent, created_at, paid_amount = row
+    return {
+        "id": id,
+        "total_amount": _decimal(total_amount),
+        "rounded_total_amount": _decimal(rounded_total_amount),
+        "tax_amount": _decimal(tax_amount),
+        "balance_amount": _decimal(balance_amount),
+        "mail_sent": mail_sent,
+        "created_at": created_at,
+        "items": items,
+        "paid_amount": _decimal(paid_amount),
+        "customer_email": customer_email,
+    }
+
+
+def serialize_bill(bill: Any, customer_email: Optional[str] = None) -> Dict[str, Any]:
+    """Serialize a Bill ORM object (its items and customer must be loaded)"""
+    if customer_email is None and bill.customer is not None:
+        customer_email = bill.customer.email
+    items = [
+        serialize_bill_item_row([getattr(item, c) for c in BILL_ITEM_COLUMNS])
+        for item in bill.items
+    ]
+    return serialize_bill_row(
+        [getattr(bill, c) for c in BILL_COLUMNS], items, customer_email
+    )
+
+
+def serialize_bills_from_rows(
+    bill_rows: Iterable[Sequence[Any]],
+    item_rows: Iterable[Sequence[Any]],
+    customer_email: Optional[str],
+    emails: Optional[Dict[int, Optional[str]]] = None,
+) -> List[Dict[str, Any]]:
+    """Assemble bill documents from raw rows.
+
+    ``item_rows`` are BILL_ITEM_COLUMNS prefixed with the owning bill_id.
+    ``emails`` maps bill id to customer email when the bills belong to
+    different customers.
+    """
+    items_by_bill: Dict[int, List[Dict[str, Any]]] = {}
+    for row in item_rows:
+        items_by_bill.setdefault(row[0], []).append(serialize_bill_item_row(row[1:]))
+    return [
+        serialize_bill_row(
+            row,
+            items_by_bill.get(row[0], []),
+            customer_email if emails is None else emails.get(row[0]),
+        )
+        for row in bill_rows
+    ]
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson response that encodes datetimes exactly like Pydantic does"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
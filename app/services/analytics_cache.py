@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.events import Event, event_bus
+
+
+class AnalyticsCache:
+    """LRU of serialised customer analytics keyed by customer id.
+
+    An entry is dropped when a ``bill_created`` event arrives for its
+    customer, from this worker or replayed from a peer. A computation only
+    stores its result if no bill for that customer committed while it ran,
+    so a slow aggregate can never overwrite a fresher invalidation.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, bytes]" = OrderedDict()
+        self._computing: Dict[int, object] = {}
+        self._lock = threading.Lock()
+
+    def get(self, customer_id: int) -> Optional[bytes]:
+        with self._lock:
+            document = self._entries.get(customer_id)
+            if document is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(customer_id)
+            self.hits += 1
+            return document
+
+    def begin(self, customer_id: int) -> object:
+        """Token to pass to ``put``; take it before reading any bills"""
+        token = object()
+        with self._lock:
+            self._computing[customer_id] = token
+        return token
+
+    def put(self, customer_id: int, document: bytes, token: object) -> None:
+        with self._lock:
+            if self._computing.get(customer_id) is not token:
+                return  # Invalidated (or recomputed) while this one ran
+            del self._computing[customer_id]
+            self._entries[customer_id] = document
+            self._entries.move_to_end(customer_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, customer_id: int) -> None:
+        with self._lock:
+            self._entries.pop(customer_id, None)
+            self._computing.pop(customer_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._computing.clear()
+
+    def apply_event(self, event: Event) -> None:
+        if event.type == "bill_created" and event.data.get("customer_id") is not None:
+            self.invalidate(event.data["customer_id"])
+
+
+analytics_cache = AnalyticsCache(max_entries=settings.ANALYTICS_CACHE_MAX_ENTRIES)
+event_bus.add_listener(analytics_cache.apply_event)
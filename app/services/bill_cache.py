@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from app.core.config import settings
+
+_MAIL_PENDING = b'"mail_sent":false'
+_MAIL_SENT = b'"mail_sent":true'
+
+
+class BillCache:
+    """Byte-budgeted LRU of fully serialised bill documents.
+
+    Bills never change after commit except for ``mail_sent``, which is
+    committed separately once the mail is queued. Readers take that flag from
+    the bill row and patch it in with ``with_mail_sent``, so a document cached
+    by any worker before the flag flipped is never served stale.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, bill_id: int) -> Optional[bytes]:
+        with self._lock:
+            document = self._entries.get(bill_id)
+            if document is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(bill_id)
+            self.hits += 1
+            return document
+
+    def get_many(self, bill_ids: Iterable[int]) -> Dict[int, bytes]:
+        found = {}
+        with self._lock:
+            for bill_id in bill_ids:
+                document = self._entries.get(bill_id)
+                if document is not None:
+                    self._entries.move_to_end(bill_id)
+                    found[bill_id] = document
+            self.hits += len(found)
+        return found
+
+    def put(self, bill_id: int, document: bytes) -> None:
+        if len(document) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(bill_id, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[bill_id] = document
+            self.size += len(document)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def mark_mail_sent(self, bill_id: int) -> None:
+        """Flip mail_sent in a cached document without re-serialising it"""
+        with self._lock:
+            document = self._entries.get(bill_id)
+        if document is not None:
+            self.with_mail_sent(bill_id, document, True)
+
+    def with_mail_sent(self, bill_id: int, document: bytes, mail_sent: bool) -> bytes:
+        """``document`` with mail_sent as read from the bill row; a cached
+        copy that disagrees is patched to match"""
+        old, new = (_MAIL_PENDING, _MAIL_SENT) if mail_sent else (_MAIL_SENT, _MAIL_PENDING)
+        if old not in document:
+            return document
+        patched = document.replace(old, new, 1)
+        with self._lock:
+            if self._entries.get(bill_id) is document:
+                self._entries[bill_id] = patched
+                self.size += len(patched) - len(document)
+        return patched
+
+
+bill_cache = BillCache(max_bytes=settings.BILL_CACHE_MAX_BYTES)
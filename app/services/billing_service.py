@@ -1,19 +1,49 @@
-import math
+import base64
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
 from decimal import Decimal
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+import orjson
 from fastapi.background import BackgroundTasks
-from sqlalchemy.orm import Session
-
-from app.core.exceptions import (CustomerNotFoundError,
+from sqlalchemy import distinct, func, insert, select, text, tuple_
+from sqlalchemy.orm import (Session, joinedload, load_only,
+                            make_transient_to_detached, selectinload)
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.core.config import settings
+from app.core.events import event_bus, publish_stock_change
+from app.core.exceptions import (BillNotFoundError, CustomerNotFoundError,
                                  InsufficientPaymentError,
-                                 InsufficientStockError,
+                                 InsufficientStockError, InvalidCursorError,
                                  InvalidDenominationError,
                                  MismatchPaymentError, ProductNotFoundError)
+from app.core.invalidation import invalidation_channel
+from app.core.logging import bill_id_var
+from app.core.retry import retry_on_conflict
+from app.db.session import begin_write
 from app.models.models import (Bill, BillDenomination, BillItem, Customer,
-                               Denomination, Product)
-from app.schemas.schemas import BillCreate, BillItemCreate, DenominationBase
+                               Denomination, Product, SyncOutbox)
+from app.schemas.schemas import (BillCreate, BillItemCreate, BillQuoteRequest,
+                                 DenominationBase)
+from app.schemas.serializers import (BILL_COLUMNS, BILL_ITEM_COLUMNS, dumps,
+                                     serialize_bill, serialize_bills_from_rows)
+from app.services.analytics_cache import analytics_cache
+from app.services.bill_cache import bill_cache
+from app.services.catalog_cache import PriceSnapshot, catalog_cache
+from app.services.customer_cache import customer_cache
+from app.services.drawer_cache import drawer_cache
 from app.services.email_service import EmailService
+from app.services.popularity import popularity_index
+from app.services.pricing import (TWO_PLACES, add_amount, compute_change,
+                                  price_line, round_total)
+from app.services.receipts import receipt_data
+from app.services.stock_ledger import SALE, StockLedgerService, movement
+
+logger = logging.getLogger(__name__)
 
 
 class BillingService:
@@ -21,21 +51,23 @@ class BillingService:
         self.db = db
         self.email_service = EmailService()
 
+    @retry_on_conflict
     async def create_bill(
-        self, bill_create: BillCreate, background_tasks: BackgroundTasks
+        self,
+        bill_create: BillCreate,
+        background_tasks: BackgroundTasks,
+        prices: Optional[Dict[str, PriceSnapshot]] = None,
     ) -> Tuple[Bill, List[Dict[str, int]]]:
-        """Create a new bill with items and calculate balance denominations"""
+        """Create a new bill with items and calculate balance denominations.
 
-        # Get or create customer
-        customer = (
-            self.db.query(Customer)
-            .filter(Customer.email == bill_create.customer_email)
-            .first()
-        )
-        if not customer:
-            customer = Customer(email=bill_create.customer_email)
-            self.db.add(customer)
-            self.db.flush()
+        ``prices`` lets a caller that already locked in prices (a cart) bill at
+        those prices instead of the current catalog.
+        """
+        begin_write(self.db)
+        started = time.perf_counter()
+
+        # Get or create customer in one upsert; repeat customers are a cache hit
+        customer_id = customer_cache.resolve(self.db, bill_create.customer_email)
 
         # Check if all customer-given denominations exist in the DB; if not, raise error with missing value(s)
         # Fix: denomination may be a list of tuples, not objects with .value/.count
@@ -69,54 +101,70 @@ class BillingService:
         total_amount = Decimal("0")
         tax_amount = Decimal("0")
         bill_items = []
+        taken: Dict[int, int] = {}
+
+        # Prices come from the catalog cache; stock is always read and locked
+        # inside this transaction
+        requested_ids = [item.product_id for item in bill_create.items]
+        if prices is None:
+            prices = catalog_cache.get_prices(self.db, requested_ids)
+        products = {
+            product.product_id: product
+            for product in self.db.query(Product)
+            .options(
+                load_only(
+                    Product.id,
+                    Product.product_id,
+                    Product.available_stocks,
+                    Product.reorder_threshold,
+                    Product.version,
+                )
+            )
+            .filter(Product.product_id.in_(requested_ids))
+            .order_by(Product.id)
+            .with_for_update()
+        }
 
         for item in bill_create.items:
-            product = (
-                self.db.query(Product)
-                .filter(Product.product_id == item.product_id)
-                .first()
-            )
-            if not product:
+            product = products.get(item.product_id)
+            price = prices.get(item.product_id)
+            if not product or not price:
                 raise ProductNotFoundError(item.product_id)
 
-            if product.available_stocks < item.quantity:
+            available = product.available_stocks - taken.get(product.id, 0)
+            if available < item.quantity:
                 raise InsufficientStockError(
                     product_id=item.product_id,
-                    available=product.available_stocks,
+                    available=available,
                     requested=item.quantity,
                 )
 
             # Calculate item amounts
-            item_price = (
-                Decimal(str(product.unit_price)).quantize(Decimal("0.00"))
-                * item.quantity
+            item_tax, item_total = price_line(
+                price.unit_price, price.tax_percentage, item.quantity
             )
-            item_tax = (
-                item_price * (Decimal(str(product.tax_percentage)) / 100)
-            ).quantize(Decimal("0.00"))
-            item_total = (item_price + item_tax).quantize(Decimal("0.00"))
 
             # Update totals
-            total_amount = (total_amount + item_total).quantize(Decimal("0.00"))
-            tax_amount = (tax_amount + item_tax).quantize(Decimal("0.00"))
+            total_amount = add_amount(total_amount, item_total)
+            tax_amount = add_amount(tax_amount, item_tax)
 
             # Create bill item
             bill_items.append(
-                BillItem(
-                    product_id=product.id,  # Use product's database ID (integer)
-                    quantity=item.quantity,
-                    unit_price=product.unit_price,
-                    tax_percentage=product.tax_percentage,
-                    tax_amount=item_tax,
-                    total_amount=item_total,
-                )
+                {
+                    "product_id": product.id,  # Use product's database ID (integer)
+                    "quantity": item.quantity,
+                    "unit_price": price.unit_price,
+                    "tax_percentage": price.tax_percentage,
+                    "tax_amount": item_tax,
+                    "total_amount": item_total,
+                }
             )
 
             # Update product stock
-            product.available_stocks -= item.quantity
+            taken[product.id] = taken.get(product.id, 0) + item.quantity
 
         # Calculate rounded total amount
-        rounded_total_amount = math.floor(total_amount)
+        rounded_total_amount = round_total(total_amount)
         # Validate payment amount
         if bill_create.paid_amount < rounded_total_amount:
             raise InsufficientPaymentError(
@@ -128,82 +176,430 @@ class BillingService:
             Decimal("0.00")
         )
 
-        # Create bill
-        bill = Bill(
-            customer_id=customer.id,
-            total_amount=total_amount,
-            rounded_total_amount=float(rounded_total_amount),
-            tax_amount=tax_amount,
-            paid_amount=bill_create.paid_amount,
-            balance_amount=balance_amount,
-            items=bill_items,
-        )
+        # Create bill. The header, its lines and the change each take one
+        # statement; RETURNING hands back the generated columns so the bill
+        # never has to be reloaded. Amounts are stored as floats, so the
+        # response is built from the same values a reload would give.
+        header = {
+            "customer_id": customer_id,
+            "total_amount": float(total_amount),
+            "rounded_total_amount": float(rounded_total_amount),
+            "tax_amount": float(tax_amount),
+            "paid_amount": float(bill_create.paid_amount),
+            "balance_amount": float(balance_amount),
+            "mail_sent": False,
+            "register_id": None,
+            "sync_id": None,
+            # Stamped here like synced bills, so SQLite stores every bill's
+            # created_at in one format and search cursors compare exactly
+            "created_at": datetime.now(timezone.utc),
+        }
+        if settings.EDGE_MODE:
+            header["register_id"] = settings.REGISTER_ID
+            header["sync_id"] = str(uuid.uuid4())
+        bill_id, created_at = self.db.execute(
+            insert(Bill).values(header).returning(Bill.id, Bill.created_at)
+        ).one()
+        bill = Bill(**dict(header, id=bill_id, created_at=created_at))
+        bill_id_var.set(bill_id)
+
+        item_values = [
+            {
+                "bill_id": bill_id,
+                "product_id": row["product_id"],
+                "quantity": row["quantity"],
+                "unit_price": float(row["unit_price"]),
+                "tax_percentage": float(row["tax_percentage"]),
+                "tax_amount": float(row["tax_amount"]),
+                "total_amount": float(row["total_amount"]),
+            }
+            for row in bill_items
+        ]
+        # One multi-row INSERT ... RETURNING (insertmanyvalues). Row order
+        # isn't guaranteed without a sentinel column, so the lines are built
+        # from the returned columns rather than matched back to the input.
+        item_rows = self.db.execute(
+            insert(BillItem).returning(
+                *(getattr(BillItem, column) for column in BILL_ITEM_COLUMNS)
+            ),
+            item_values,
+        ).all()
+        items = [
+            BillItem(
+                bill_id=bill_id,
+                **dict(
+                    row._mapping,
+                    # SQLite returns whole REAL values as integers here
+                    unit_price=float(row.unit_price),
+                    tax_percentage=float(row.tax_percentage),
+                    tax_amount=float(row.tax_amount),
+                    total_amount=float(row.total_amount),
+                ),
+            )
+            for row in sorted(item_rows, key=lambda row: row.id)
+        ]
 
-        self.db.add(bill)
-        self.db.flush()
+        # One read of the drawer serves both the change calculation and the updates
+        drawer = (
+            self.db.query(Denomination).order_by(Denomination.value.desc()).all()
+        )
+        drawer_by_value = {denomination.value: denomination for denomination in drawer}
 
         # Calculate balance denominations
         balance_denominations = self.calculate_balance_denominations(
-            int(balance_amount)
+            int(balance_amount), drawer
         )
 
         # Create bill denominations
+        drawer_deltas: Dict[int, int] = {}
+        bill_denominations = []
         for denom in balance_denominations:
-            denomination = (
-                self.db.query(Denomination)
-                .filter(Denomination.value == denom["value"])
-                .first()
-            )
+            denomination = drawer_by_value.get(denom["value"])
 
             if denomination and denomination.count >= denom["count"]:
-                bill_denom = BillDenomination(
-                    bill_id=bill.id,
-                    denomination_id=denomination.id,
-                    count=denom["count"],
+                bill_denominations.append(
+                    {
+                        "bill_id": bill_id,
+                        "denomination_id": denomination.id,
+                        "count": denom["count"],
+                    }
                 )
-                denomination.count -= denom["count"]
-                self.db.add(bill_denom)
+                drawer_deltas[denomination.id] = -denom["count"]
+        if bill_denominations:
+            self.db.execute(insert(BillDenomination), bill_denominations)
 
         # Update the given Customer Denomination intothe Denomination Table
 
         for denom in denominations_from_request:
-            db_denom = (
-                self.db.query(Denomination)
-                .filter(Denomination.value == denom.value)
-                .first()
-            )
+            db_denom = drawer_by_value.get(denom.value)
             if db_denom:
-                db_denom.count += denom.count
+                drawer_deltas[db_denom.id] = drawer_deltas.get(db_denom.id, 0) + denom.count
+
+        # Stock and drawer each take one guarded UPDATE. A product changed
+        # since it was read fails the version check; the drawer only has to
+        # still hold the change, so bills paid with the same note don't
+        # collide. Either way the bill is retried against fresh rows.
+        new_stock = self._apply_versioned_deltas(
+            "products",
+            "available_stocks",
+            {
+                product.id: (product.version, -taken[product.id])
+                for product in products.values()
+                if product.id in taken
+            },
+        )
+        StockLedgerService(self.db).record(
+            movement(product_id, SALE, -quantity, bill_id=bill_id)
+            for product_id, quantity in taken.items()
+        )
+        new_counts = self._apply_drawer_deltas(drawer_deltas)
+
+        if settings.EDGE_MODE:
+            # Queued in the same transaction, so a committed bill is never lost
+            self._queue_for_sync(
+                bill,
+                bill_create.customer_email,
+                products,
+                bill_items,
+                bill_denominations,
+                drawer,
+            )
+
+        # Capture the deltas before commit expires the loaded rows
+        stock_deltas = [
+            (
+                product.id,
+                product.product_id,
+                product.available_stocks,
+                new_stock[product.id],
+                product.reorder_threshold,
+            )
+            for product in products.values()
+            if product.id in new_stock
+        ]
+        denomination_counts = {d.value: new_counts[d.id] for d in drawer if d.id in new_counts}
 
         # Commit changes
         self.db.commit()
-        self.db.refresh(bill)
+        self._attach_loaded(bill, items)
 
-        # Send email asynchronously
-        await self.email_service.send_bill_email(
-            background_tasks, bill_create.customer_email, bill
-        )
+        # Everything this bill tells the other workers goes out as one datagram
+        with invalidation_channel.batch():
+            self._publish_bill_events(bill, stock_deltas, denomination_counts)
+            popularity_index.record_bill(
+                bill.id, [(item.product_id, item.quantity) for item in items]
+            )
 
+            # Bills are immutable once committed; reprints and history are memory hits
+            bill_cache.put(bill.id, dumps(serialize_bill(bill, bill_create.customer_email)))
+
+            # Send email asynchronously; an edge till leaves that to the central server
+            if not settings.EDGE_MODE:
+                await self.email_service.send_bill_email(
+                    background_tasks, bill_create.customer_email, bill
+                )
+
+        logger.info(
+            "bill created",
+            extra={
+                "items": len(bill_items),
+                "rounded_total_amount": bill.rounded_total_amount,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            },
+        )
         return bill, balance_denominations
 
-    def calculate_balance_denominations(self, balance: int) -> List[Dict[str, int]]:
+    def _apply_versioned_deltas(
+        self, table: str, column: str, deltas: Dict[int, Tuple[int, int]]
+    ) -> Dict[int, int]:
+        """Add ``delta`` to ``column`` for each ``id: (version, delta)`` in one
+        UPDATE ... FROM (VALUES ...), returning the new values.
+
+        Raises StaleDataError if any row's version moved since it was read.
+        """
+        if not deltas:
+            return {}
+        values, params = [], {}
+        for i, (id, (version, delta)) in enumerate(deltas.items()):
+            values.append(
+                f"(CAST(:i{i} AS INTEGER), CAST(:v{i} AS INTEGER), CAST(:d{i} AS INTEGER))"
+            )
+            params.update({f"i{i}": id, f"v{i}": version, f"d{i}": delta})
+        # VALUES columns are named column1..N on both Postgres and SQLite
+        statement = text(
+            f"UPDATE {table} SET {column} = {table}.{column} + v.delta, "
+            f"version = {table}.version + 1, updated_at = CURRENT_TIMESTAMP "
+            "FROM (SELECT column1 AS id, column2 AS version, column3 AS delta "
+            f"FROM (VALUES {', '.join(values)}) AS deltas) AS v "
+            f"WHERE {table}.id = v.id AND {table}.version = v.version "
+            f"RETURNING {table}.id, {table}.{column}"
+        )
+        updated = dict(self.db.execute(statement, params).all())
+        if len(updated) != len(deltas):
+            raise StaleDataError(
+                f"{len(deltas) - len(updated)} {table} row(s) changed concurrently"
+            )
+        return updated
+
+    def _apply_drawer_deltas(self, deltas: Dict[int, int]) -> Dict[int, int]:
+        """Add each ``id: delta`` to the drawer counts in one UPDATE ... FROM
+        (VALUES ...), returning the new counts.
+
+        Notes paid in are added unconditionally; a row paying change out is
+        only updated while it still holds the notes. Raises StaleDataError if
+        one no longer does, so the bill is retried and picks other change.
+        """
+        if not deltas:
+            return {}
+        values, params = [], {}
+        for i, (id, delta) in enumerate(deltas.items()):
+            values.append(f"(CAST(:i{i} AS INTEGER), CAST(:d{i} AS INTEGER))")
+            params.update({f"i{i}": id, f"d{i}": delta})
+        # The version still moves, so ORM writes that read a count see the change
+        statement = text(
+            "UPDATE denominations SET count = denominations.count + v.delta, "
+            "version = denominations.version + 1, updated_at = CURRENT_TIMESTAMP "
+            "FROM (SELECT column1 AS id, column2 AS delta "
+            f"FROM (VALUES {', '.join(values)}) AS deltas) AS v "
+            "WHERE denominations.id = v.id AND denominations.count + v.delta >= 0 "
+            "RETURNING denominations.id, denominations.count"
+        )
+        updated = dict(self.db.execute(statement, params).all())
+        if len(updated) != len(deltas):
+            raise StaleDataError(
+                f"{len(deltas) - len(updated)} denomination(s) ran out of change concurrently"
+            )
+        return updated
+
+    def _attach_loaded(self, bill: Bill, items: List[BillItem]) -> None:
+        """Put a bill built from RETURNING rows into the session as if loaded"""
+        for instance in (bill, *items):
+            make_transient_to_detached(instance)
+        set_committed_value(bill, "items", items)
+        for item in items:
+            set_committed_value(item, "bill", bill)
+        self.db.add_all([bill, *items])
+
+    def _queue_for_sync(
+        self,
+        bill: Bill,
+        customer_email: str,
+        products: Dict[str, Product],
+        bill_items: List[Dict[str, Any]],
+        bill_denominations: List[Dict[str, int]],
+        drawer: List[Denomination],
+    ) -> None:
+        """Add the outbox entry the edge sync pushes to the central server"""
+        skus = {product.id: sku for sku, product in products.items()}
+        values = {denomination.id: denomination.value for denomination in drawer}
+        payload = {
+            "sync_id": bill.sync_id,
+            "customer_email": customer_email,
+            "created_at": bill.created_at,
+            "total_amount": str(bill.total_amount),
+            "rounded_total_amount": str(bill.rounded_total_amount),
+            "tax_amount": str(bill.tax_amount),
+            "paid_amount": str(bill.paid_amount),
+            "balance_amount": str(bill.balance_amount),
+            "items": [
+                {
+                    "product_id": skus[row["product_id"]],
+                    "quantity": row["quantity"],
+                    "unit_price": str(row["unit_price"]),
+                    "tax_percentage": str(row["tax_percentage"]),
+                    "tax_amount": str(row["tax_amount"]),
+                    "total_amount": str(row["total_amount"]),
+                }
+                for row in bill_items
+            ],
+            "change_denominations": [
+                {"value": values[row["denomination_id"]], "count": row["count"]}
+                for row in bill_denominations
+            ],
+        }
+        self.db.add(SyncOutbox(bill_id=bill.id, payload=dumps(payload)))
+
+    def quote_bill(self, quote: BillQuoteRequest) -> Dict[str, Any]:
+        """Price a cart and work out change without writing or locking anything.
+
+        Mirrors the checks in create_bill but reports them as problems instead
+        of raising, so the till can show totals while items are scanned.
+        """
+        problems = []
+        requested_ids = [item.product_id for item in quote.items]
+        prices = catalog_cache.get_prices(self.db, requested_ids)
+        # Plain read: advisory only, create_bill re-checks under lock
+        stocks = dict(
+            self.db.query(Product.product_id, Product.available_stocks).filter(
+                Product.product_id.in_(requested_ids)
+            )
+        )
+
+        total_amount = Decimal("0")
+        tax_amount = Decimal("0")
+        items = []
+        requested = {}
+        for item in quote.items:
+            price = prices.get(item.product_id)
+            if not price or item.product_id not in stocks:
+                problems.append(str(ProductNotFoundError(item.product_id)))
+                continue
+
+            requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+            item_tax, item_total = price_line(
+                price.unit_price, price.tax_percentage, item.quantity
+            )
+            total_amount = add_amount(total_amount, item_total)
+            tax_amount = add_amount(tax_amount, item_tax)
+            items.append(
+                {
+                    "product_id": item.product_id,
+                    "quantity": item.quantity,
+                    "unit_price": price.unit_price,
+                    "tax_percentage": price.tax_percentage,
+                    "tax_amount": item_tax,
+                    "total_amount": item_total,
+                }
+            )
+
+        for product_id, quantity in requested.items():
+            if stocks[product_id] < quantity:
+                problems.append(
+                    str(InsufficientStockError(product_id, stocks[product_id], quantity))
+                )
+
+        rounded_total_amount = round_total(total_amount)
+        result = {
+            "items": items,
+            "total_amount": total_amount,
+            "tax_amount": tax_amount,
+            "rounded_total_amount": rounded_total_amount,
+            "paid_amount": quote.paid_amount,
+            "balance_amount": None,
+            "balance_denominations": [],
+            "problems": problems,
+        }
+        if quote.paid_amount is None:
+            return result
+
+        drawer = drawer_cache.snapshot(self.db)
+        accepted = {value for value, _ in drawer}
+        rejected = [d.value for d in quote.denomination if d.value not in accepted]
+        if rejected:
+            problems.append(
+                str(
+                    InvalidDenominationError(
+                        f"We do not accept this denomination value(s): {', '.join(str(v) for v in rejected)}"
+                    )
+                )
+            )
+        denomination_sum = sum(d.value * d.count for d in quote.denomination)
+        if Decimal(denomination_sum) != quote.paid_amount:
+            problems.append(
+                str(
+                    MismatchPaymentError(
+                        f"Sum of given denominations ({denomination_sum}) does not match paid amount ({quote.paid_amount})"
+                    )
+                )
+            )
+        if quote.paid_amount < rounded_total_amount:
+            problems.append(
+                str(
+                    InsufficientPaymentError(
+                        float(rounded_total_amount), float(quote.paid_amount)
+                    )
+                )
+            )
+            return result
+
+        balance_amount = (quote.paid_amount - rounded_total_amount).quantize(
+            Decimal("0.00")
+        )
+        change, remaining = compute_change(int(balance_amount), drawer)
+        if remaining > 0:
+            problems.append(
+                str(
+                    InvalidDenominationError(
+                        f"Unable to provide exact change with available denominations: {remaining}"
+                    )
+                )
+            )
+        result["balance_amount"] = balance_amount
+        result["balance_denominations"] = change
+        return result
+
+    def _publish_bill_events(
+        self,
+        bill: Bill,
+        stock_deltas: List[Tuple[int, str, int, int, int]],
+        denomination_counts: Dict[int, int],
+    ) -> None:
+        """Push the committed bill's deltas to dashboard subscribers"""
+        event_bus.publish(
+            "bill_created",
+            id=bill.id,
+            customer_id=bill.customer_id,
+            rounded_total_amount=bill.rounded_total_amount,
+        )
+        for id, product_id, previous, current, threshold in stock_deltas:
+            publish_stock_change(id, product_id, previous, current, threshold)
+        for value, count in denomination_counts.items():
+            event_bus.publish("denomination_changed", value=value, count=count)
+
+    def calculate_balance_denominations(
+        self, balance: int, denominations: Optional[List[Denomination]] = None
+    ) -> List[Dict[str, int]]:
         """Calculate optimal denomination distribution for balance amount"""
-        denominations = (
-            self.db.query(Denomination).order_by(Denomination.value.desc()).all()
+        if denominations is None:
+            denominations = (
+                self.db.query(Denomination).order_by(Denomination.value.desc()).all()
+            )
+        result, balance = compute_change(
+            balance, [(denom.value, denom.count) for denom in denominations]
         )
-        result = []
-
-        for denom in denominations:
-            print("denom", denom.value, "count", denom.count)
-            denom_value = denom.value
-            if balance >= denom_value and denom.count > 0:
-                count = min(balance // denom_value, denom.count)
-                if count > 0:
-                    result.append({"value": denom.value, "count": count})
-                    balance -= count * denom_value
-        print(result)
+        logger.debug("Balance denominations: %s", result)
         if balance > 0:
-            print(f"Remaining balance: {balance}")
+            logger.info("Unable to make change, remaining balance: %s", balance)
 
             raise InvalidDenominationError(
                 f"Unable to provide exact change with available denominations: {balance}"
@@ -213,10 +609,8 @@ class BillingService:
 
     def get_customer_bills(self, customer_email: str) -> List[Bill]:
         """Get all bills for a customer"""
-        customer = (
-            self.db.query(Customer).filter(Customer.email == customer_email).first()
-        )
-        if not customer:
+        customer_id = customer_cache.lookup(self.db, customer_email)
+        if customer_id is None:
             raise CustomerNotFoundError(customer_email)
 
         # Load bills with their items and product relationships
@@ -225,16 +619,326 @@ class BillingService:
         bills = (
             self.db.query(Bill)
             .options(joinedload(Bill.items).joinedload(BillItem.product))
-            .filter(Bill.customer_id == customer.id)
+            .filter(Bill.customer_id == customer_id)
             .order_by(Bill.id.desc())
             .all()
         )
 
         return bills
 
+    def get_customer_bill_documents(self, customer_email: str) -> List[bytes]:
+        """Get a customer's serialised bills, newest first, from the bill cache
+        where possible and from raw rows otherwise"""
+        customer_id = customer_cache.lookup(self.db, customer_email)
+        if customer_id is None:
+            raise CustomerNotFoundError(customer_email)
+
+        mail_sent = dict(
+            self.db.query(Bill.id, Bill.mail_sent)
+            .filter(Bill.customer_id == customer_id)
+            .order_by(Bill.id.desc())
+        )
+        return self._bill_documents(list(mail_sent), customer_email, mail_sent)
+
+    def search_bill_documents(
+        self,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        min_total: Optional[Decimal] = None,
+        max_total: Optional[Decimal] = None,
+        product_id: Optional[str] = None,
+        mail_sent: Optional[bool] = None,
+        register_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ) -> Tuple[List[bytes], Optional[str], bool]:
+        """Serialised bills matching the filters, newest first.
+
+        Returns the page, the cursor for the next one (None at the end) and
+        whether the page stopped early at BILL_SEARCH_MAX_SCAN. At most that
+        many bills, walked through ix_bills_created_at_id, are examined per
+        call; filters on other columns only narrow what was walked, and a
+        capped page still hands back a cursor to carry on from.
+        """
+        window = []
+        if created_from is not None:
+            window.append(Bill.created_at >= created_from)
+        if created_to is not None:
+            window.append(Bill.created_at <= created_to)
+        if cursor is not None:
+            window.append(tuple_(Bill.created_at, Bill.id) < tuple_(*_decode_cursor(cursor)))
+        newest_first = (Bill.created_at.desc(), Bill.id.desc())
+        scanned = (
+            select(
+                Bill.id,
+                Bill.created_at,
+                Bill.rounded_total_amount,
+                Bill.mail_sent,
+                Bill.register_id,
+            )
+            .where(*window)
+            .order_by(*newest_first)
+            .limit(settings.BILL_SEARCH_MAX_SCAN)
+            .subquery()
+        )
+
+        filters = []
+        if min_total is not None:
+            filters.append(scanned.c.rounded_total_amount >= float(min_total))
+        if max_total is not None:
+            filters.append(scanned.c.rounded_total_amount <= float(max_total))
+        if mail_sent is not None:
+            filters.append(scanned.c.mail_sent == mail_sent)
+        if register_id is not None:
+            filters.append(scanned.c.register_id == register_id)
+        if product_id is not None:
+            id = self.db.query(Product.id).filter(Product.product_id == product_id).scalar()
+            if id is None:
+                return [], None, False
+            # EXISTS keeps one row per bill however many lines match
+            filters.append(
+                select(BillItem.id)
+                .where(BillItem.bill_id == scanned.c.id, BillItem.product_id == id)
+                .exists()
+            )
+
+        rows = self.db.execute(
+            select(scanned.c.id, scanned.c.created_at, scanned.c.mail_sent)
+            .where(*filters)
+            .order_by(scanned.c.created_at.desc(), scanned.c.id.desc())
+            .limit(limit + 1)
+        ).all()
+        capped = False
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].id, rows[-1].created_at)
+        elif filters:
+            # A short page either ran out of bills or hit the scan cap; the
+            # last bill walked is where the next call would carry on
+            boundary = self.db.execute(
+                select(Bill.created_at, Bill.id)
+                .where(*window)
+                .order_by(*newest_first)
+                .offset(settings.BILL_SEARCH_MAX_SCAN - 1)
+                .limit(1)
+            ).first()
+            if boundary is not None:
+                capped = True
+                next_cursor = _encode_cursor(boundary.id, boundary.created_at)
+        documents = self._bill_documents(
+            [row.id for row in rows], mail_sent={row.id: row.mail_sent for row in rows}
+        )
+        return documents, next_cursor, capped
+
+    def _bill_documents(
+        self,
+        bill_ids: List[int],
+        customer_email: Optional[str] = None,
+        mail_sent: Optional[Dict[int, bool]] = None,
+    ) -> List[bytes]:
+        """Serialised bills in the given order, from the bill cache where
+        possible and from raw rows otherwise; emails are looked up unless given.
+
+        ``mail_sent`` maps bill id to the flag as just read from its row; it is
+        read here for cached bills when not given.
+        """
+        documents = bill_cache.get_many(bill_ids)
+        if documents:
+            if mail_sent is None:
+                mail_sent = dict(
+                    self.db.query(Bill.id, Bill.mail_sent).filter(Bill.id.in_(list(documents)))
+                )
+            for bill_id, document in documents.items():
+                if bill_id in mail_sent:
+                    documents[bill_id] = bill_cache.with_mail_sent(
+                        bill_id, document, mail_sent[bill_id]
+                    )
+        missing = [bill_id for bill_id in bill_ids if bill_id not in documents]
+
+        if missing:
+            columns = [getattr(Bill, c) for c in BILL_COLUMNS]
+            emails = None
+            if customer_email is None:
+                rows = (
+                    self.db.query(*columns, Customer.email)
+                    .outerjoin(Customer, Customer.id == Bill.customer_id)
+                    .filter(Bill.id.in_(missing))
+                    .all()
+                )
+                emails = {row[0]: row[-1] for row in rows}
+                bill_rows = [row[:-1] for row in rows]
+            else:
+                bill_rows = self.db.query(*columns).filter(Bill.id.in_(missing)).all()
+            item_rows = (
+                self.db.query(
+                    BillItem.bill_id, *[getattr(BillItem, c) for c in BILL_ITEM_COLUMNS]
+                )
+                .filter(BillItem.bill_id.in_(missing))
+                .order_by(BillItem.id)
+                .all()
+            )
+            for document in serialize_bills_from_rows(
+                bill_rows, item_rows, customer_email, emails
+            ):
+                encoded = dumps(document)
+                bill_cache.put(document["id"], encoded)
+                documents[document["id"]] = encoded
+
+        return [documents[bill_id] for bill_id in bill_ids]
+
+    def get_customer_analytics(self, customer_email: str) -> bytes:
+        """Serialised spend summary, top products and monthly spend for a
+        customer, aggregated in SQL and cached until their next bill"""
+        customer_id = customer_cache.lookup(self.db, customer_email)
+        if customer_id is None:
+            raise CustomerNotFoundError(customer_email)
+        document = analytics_cache.get(customer_id)
+        if document is not None:
+            return document
+
+        # Taken before the aggregates start a fresh snapshot, so a bill that
+        # commits while they run discards this result instead of being missed
+        token = analytics_cache.begin(customer_id)
+        self.db.rollback()
+        count, spent, tax, first, last = (
+            self.db.query(
+                func.count(Bill.id),
+                func.sum(Bill.rounded_total_amount),
+                func.sum(Bill.tax_amount),
+                func.min(Bill.created_at),
+                func.max(Bill.created_at),
+            )
+            .filter(Bill.customer_id == customer_id)
+            .one()
+        )
+        lines, units = (
+            self.db.query(func.count(BillItem.id), func.sum(BillItem.quantity))
+            .join(Bill, BillItem.bill_id == Bill.id)
+            .filter(Bill.customer_id == customer_id)
+            .one()
+        )
+        quantity = func.sum(BillItem.quantity).label("quantity")
+        top_products = (
+            self.db.query(
+                Product.product_id,
+                Product.name,
+                quantity,
+                func.sum(BillItem.total_amount),
+                func.count(distinct(BillItem.bill_id)),
+            )
+            .join(BillItem, BillItem.product_id == Product.id)
+            .join(Bill, BillItem.bill_id == Bill.id)
+            .filter(Bill.customer_id == customer_id)
+            .group_by(Product.id, Product.product_id, Product.name)
+            .order_by(quantity.desc(), Product.product_id)
+            .limit(settings.ANALYTICS_TOP_PRODUCTS)
+            .all()
+        )
+        month = _month_of(self.db, Bill.created_at).label("month")
+        months = (
+            self.db.query(month, func.count(Bill.id), func.sum(Bill.rounded_total_amount))
+            .filter(Bill.customer_id == customer_id)
+            .group_by(month)
+            .order_by(month.desc())
+            .limit(settings.ANALYTICS_MONTHS)
+            .all()
+        )
+
+        document = dumps(
+            {
+                "customer_email": customer_email,
+                "bill_count": count,
+                "total_spent": _money(spent),
+                "total_tax": _money(tax),
+                "first_purchase_at": first,
+                "last_purchase_at": last,
+                "average_basket": {
+                    "amount": _money(Decimal(str(spent)) / count if count else 0),
+                    "lines": _money(Decimal(lines) / count if count else 0),
+                    "units": _money(Decimal(units or 0) / count if count else 0),
+                },
+                "top_products": [
+                    {
+                        "product_id": sku,
+                        "name": name,
+                        "quantity": product_quantity,
+                        "spent": _money(product_spent),
+                        "bills": bills,
+                    }
+                    for sku, name, product_quantity, product_spent, bills in top_products
+                ],
+                "monthly_spend": [
+                    {"month": period, "bills": bills, "spent": _money(month_spent)}
+                    for period, bills, month_spent in reversed(months)
+                ],
+            }
+        )
+        analytics_cache.put(customer_id, document, token)
+        return document
+
+    def get_bill_document(self, bill_id: int) -> bytes:
+        """Get a serialised bill, loading it eagerly on a cache miss"""
+        document = bill_cache.get(bill_id)
+        if document is not None:
+            # The one mutable column comes from the row, by primary key
+            mail_sent = self.db.query(Bill.mail_sent).filter(Bill.id == bill_id).scalar()
+            if mail_sent is None:
+                raise BillNotFoundError(bill_id)
+            return bill_cache.with_mail_sent(bill_id, document, mail_sent)
+
+        bill = (
+            self.db.query(Bill)
+            .options(selectinload(Bill.items), joinedload(Bill.customer))
+            .filter(Bill.id == bill_id)
+            .first()
+        )
+        if not bill:
+            raise BillNotFoundError(bill_id)
+        document = dumps(serialize_bill(bill))
+        bill_cache.put(bill_id, document)
+        return document
+
+    def get_receipt_data(self, bill_id: int) -> Dict[str, Any]:
+        """The values a receipt shows, from the serialised bill and one
+        query for its product names"""
+        document = orjson.loads(self.get_bill_document(bill_id))
+        product_ids = {int(item["product_id"]) for item in document["items"] if item["product_id"]}
+        names = dict(
+            self.db.query(Product.id, Product.name).filter(Product.id.in_(product_ids))
+        )
+        return receipt_data(document, names)
+
     def get_bill(self, bill_id: int) -> Bill:
         """Get a specific bill by ID"""
         bill = self.db.query(Bill).filter(Bill.id == bill_id).first()
         if not bill:
             raise CustomerNotFoundError(f"Bill not found with ID: {bill_id}")
         return bill
+
+
+def _encode_cursor(id: int, created_at: datetime) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([created_at.isoformat(), id])).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise InvalidCursorError(cursor)
+
+
+def _money(value: Any) -> str:
+    """An aggregated amount rendered like a Decimal money field"""
+    return str(Decimal(str(value or 0)).quantize(TWO_PLACES))
+
+
+def _month_of(db: Session, column: Any) -> Any:
+    """SQL expression for a timestamp's YYYY-MM"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    if dialect in ("mysql", "mariadb"):
+        return func.date_format(column, "%Y-%m")
+    return func.strftime("%Y-%m", column)
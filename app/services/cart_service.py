@@ -0,0 +1,430 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.background import BackgroundTasks
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.exceptions import (CartConflictError, CartNotFoundError,
+                                 ProductNotFoundError)
+from app.models.models import Bill
+from app.schemas.schemas import (BillCreate, BillItemCreate, CartCheckout,
+                                 CartItemUpdate)
+from app.services.billing_service import BillingService
+from app.services.catalog_cache import PriceSnapshot, catalog_cache
+from app.services.pricing import add_amount, price_line, round_total
+
+
+@dataclass
+class CartLine:
+    price: PriceSnapshot  # Locked in when the product was first added
+    quantity: int
+    tax_amount: Decimal
+    total_amount: Decimal
+
+
+@dataclass
+class Cart:
+    id: str
+    expires_at: float
+    lines: "OrderedDict[str, CartLine]" = field(default_factory=OrderedDict)
+    total_amount: Decimal = Decimal("0.00")
+    tax_amount: Decimal = Decimal("0.00")
+    revision: int = 0  # The journal's revision this copy was read at
+
+    def set_quantity(self, price: PriceSnapshot, quantity: int) -> None:
+        """Replace one line and adjust the running totals in O(1)"""
+        old = self.lines.pop(price.product_id, None)
+        if old is not None:
+            self.total_amount = add_amount(self.total_amount, -old.total_amount)
+            self.tax_amount = add_amount(self.tax_amount, -old.tax_amount)
+        if quantity <= 0:
+            return
+
+        tax_amount, total_amount = price_line(price.unit_price, price.tax_percentage, quantity)
+        self.lines[price.product_id] = CartLine(price, quantity, tax_amount, total_amount)
+        self.total_amount = add_amount(self.total_amount, total_amount)
+        self.tax_amount = add_amount(self.tax_amount, tax_amount)
+
+    def copy(self) -> "Cart":
+        return Cart(
+            self.id,
+            self.expires_at,
+            OrderedDict(self.lines),
+            self.total_amount,
+            self.tax_amount,
+            self.revision,
+        )
+
+    def restore(self, other: "Cart") -> None:
+        """Take on another copy's lines and totals"""
+        self.expires_at = other.expires_at
+        self.lines = other.lines
+        self.total_amount = other.total_amount
+        self.tax_amount = other.tax_amount
+        self.revision = other.revision
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "items": [
+                {
+                    "product_id": product_id,
+                    "quantity": line.quantity,
+                    "unit_price": line.price.unit_price,
+                    "tax_percentage": line.price.tax_percentage,
+                    "tax_amount": line.tax_amount,
+                    "total_amount": line.total_amount,
+                }
+                for product_id, line in self.lines.items()
+            ],
+            "total_amount": self.total_amount,
+            "tax_amount": self.tax_amount,
+            "rounded_total_amount": round_total(self.total_amount),
+            "expires_in_seconds": max(0, int(self.expires_at - time.time())),
+        }
+
+
+class CartJournal:
+    """Local SQLite journal so carts survive a worker restart.
+
+    Each edit writes only the lines it changed, in one transaction, keeping
+    journal writes proportional to the edit rather than the cart. The journal
+    is shared by every worker on the box and is the source of truth: each
+    edit bumps the cart's revision, and is refused if the cart moved on from
+    the revision the edit was based on or has gone to checkout.
+    """
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Connections must not cross a fork; each worker opens its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("PRAGMA busy_timeout=5000")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS carts (id TEXT PRIMARY KEY, expires_at REAL NOT NULL, "
+                "revision INTEGER NOT NULL DEFAULT 0, checking_out INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(carts)")}
+            for column in ("revision", "checking_out"):
+                # Journals written before carts were versioned
+                if column not in columns:
+                    self._connection.execute(
+                        f"ALTER TABLE carts ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+                    )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cart_lines ("
+                "cart_id TEXT NOT NULL, product_id TEXT NOT NULL, product_pk INTEGER NOT NULL, "
+                "quantity INTEGER NOT NULL, unit_price REAL NOT NULL, tax_percentage REAL NOT NULL, "
+                "position INTEGER NOT NULL, PRIMARY KEY (cart_id, product_id))"
+            )
+        return self._connection
+
+    def save_cart(self, cart: Cart) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO carts (id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET expires_at = excluded.expires_at",
+                (cart.id, cart.expires_at),
+            )
+
+    def state(self, cart_id: str) -> Optional[Tuple[float, int]]:
+        """The cart's expiry and revision, or None if it doesn't exist"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT expires_at, revision FROM carts WHERE id = ?", (cart_id,)
+            ).fetchone()
+
+    def save_lines(self, cart: Cart, product_ids: List[str], revision: int) -> bool:
+        """Write the current state of the given lines in one transaction.
+
+        Returns False, writing nothing, unless the cart is still at
+        ``revision`` and not checking out.
+        """
+        kept = [product_id for product_id in cart.lines if product_id in product_ids]
+        removed = [
+            (cart.id, product_id) for product_id in product_ids if product_id not in cart.lines
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                claimed = self._conn.execute(
+                    "UPDATE carts SET expires_at = ?, revision = revision + 1 "
+                    "WHERE id = ? AND revision = ? AND checking_out = 0",
+                    (cart.expires_at, cart.id, revision),
+                ).rowcount
+                if not claimed:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.executemany(
+                    "DELETE FROM cart_lines WHERE cart_id = ? AND product_id = ?", removed
+                )
+                # New lines go after every line the cart has had, keeping their order
+                for product_id in kept:
+                    line = cart.lines[product_id]
+                    self._conn.execute(
+                        "INSERT INTO cart_lines VALUES (?, ?, ?, ?, ?, ?, (SELECT "
+                        "COALESCE(MAX(position), -1) + 1 FROM cart_lines WHERE cart_id = ?)) "
+                        "ON CONFLICT (cart_id, product_id) "
+                        "DO UPDATE SET quantity = excluded.quantity",
+                        (
+                            cart.id,
+                            product_id,
+                            line.price.id,
+                            line.quantity,
+                            line.price.unit_price,
+                            line.price.tax_percentage,
+                            cart.id,
+                        ),
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return True
+
+    def load_cart(self, cart_id: str) -> Optional[Cart]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, revision FROM carts WHERE id = ?", (cart_id,)
+            ).fetchone()
+            if row is None or row[0] < time.time():
+                return None
+            lines = self._conn.execute(
+                "SELECT product_id, product_pk, quantity, unit_price, tax_percentage "
+                "FROM cart_lines WHERE cart_id = ? ORDER BY position",
+                (cart_id,),
+            ).fetchall()
+
+        cart = Cart(id=cart_id, expires_at=row[0], revision=row[1])
+        for product_id, product_pk, quantity, unit_price, tax_percentage in lines:
+            cart.set_quantity(
+                PriceSnapshot(product_pk, product_id, unit_price, tax_percentage), quantity
+            )
+        return cart
+
+    def claim(self, cart_id: str, revision: int) -> bool:
+        """Mark the cart as checking out, if it is still at ``revision``.
+
+        A claim is never timed out; a checkout that dies midway leaves the
+        cart to expire rather than risk billing it twice.
+        """
+        with self._lock:
+            return bool(
+                self._conn.execute(
+                    "UPDATE carts SET checking_out = 1 "
+                    "WHERE id = ? AND revision = ? AND checking_out = 0",
+                    (cart_id, revision),
+                ).rowcount
+            )
+
+    def release(self, cart_id: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE carts SET checking_out = 0 WHERE id = ?", (cart_id,))
+
+    def delete_cart(self, cart_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM cart_lines WHERE cart_id = ?", (cart_id,))
+            self._conn.execute("DELETE FROM carts WHERE id = ?", (cart_id,))
+            self._conn.execute("COMMIT")
+
+    def purge_expired(self) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM cart_lines WHERE cart_id IN "
+                "(SELECT id FROM carts WHERE expires_at < ?)",
+                (time.time(),),
+            )
+            self._conn.execute("DELETE FROM carts WHERE expires_at < ?", (time.time(),))
+            self._conn.execute("COMMIT")
+
+
+class CartStore:
+    """Bounded in-memory cart store with TTL eviction, backed by a journal.
+
+    Every access checks the cart's revision in the journal, which other
+    workers write too, and reloads a copy that has fallen behind. Carts
+    evicted for space stay in the journal and are reloaded on their next
+    access; expired carts are dropped from both.
+    """
+
+    def __init__(self, journal: CartJournal, max_carts: int, ttl_seconds: int):
+        self.journal = journal
+        self.max_carts = max_carts
+        self.ttl_seconds = ttl_seconds
+        self._carts: "OrderedDict[str, Cart]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._purged_at = 0.0
+
+    def create(self) -> Cart:
+        cart = Cart(id=uuid.uuid4().hex, expires_at=time.time() + self.ttl_seconds)
+        self.journal.save_cart(cart)
+        with self._lock:
+            self._remember(cart)
+        self._maybe_purge()
+        return cart
+
+    def get(self, cart_id: str) -> Cart:
+        with self._lock:
+            state = self.journal.state(cart_id)
+            if state is None or state[0] < time.time():
+                self._carts.pop(cart_id, None)
+                raise CartNotFoundError(cart_id)
+            cart = self._carts.get(cart_id)
+            if cart is None or cart.revision != state[1]:
+                cart = self.journal.load_cart(cart_id)
+                if cart is None:
+                    raise CartNotFoundError(cart_id)
+                self._remember(cart)
+            cart.expires_at = state[0]
+            self._carts.move_to_end(cart_id)
+            return cart
+
+    def update(self, cart: Cart, prices: Dict[str, PriceSnapshot], items: List[CartItemUpdate]) -> None:
+        """Apply a batch of line changes: all of them, or none if any is invalid"""
+        with self._lock:
+            staged = cart.copy()
+            for item in items:
+                existing = staged.lines.get(item.product_id)
+                if existing is None:
+                    if item.quantity <= 0:
+                        continue  # Removing a line that isn't there
+                    if item.product_id not in prices:
+                        raise ProductNotFoundError(item.product_id)
+                # Keep the price locked in when the line was first added
+                price = existing.price if existing else prices[item.product_id]
+                staged.set_quantity(price, item.quantity)
+            staged.expires_at = time.time() + self.ttl_seconds
+            product_ids = list(dict.fromkeys(item.product_id for item in items))
+            if not self.journal.save_lines(staged, product_ids, cart.revision):
+                self._carts.pop(cart.id, None)
+                raise CartConflictError(cart.id)
+            staged.revision += 1
+            cart.restore(staged)
+
+    def claim(self, cart: Cart) -> None:
+        """Reserve the cart for checkout, exactly as this copy of it stands"""
+        if not self.journal.claim(cart.id, cart.revision):
+            self.forget(cart.id)
+            raise CartConflictError(cart.id)
+
+    def release(self, cart_id: str) -> None:
+        """Give a cart back after a failed checkout"""
+        self.journal.release(cart_id)
+
+    def discard(self, cart_id: str) -> None:
+        self.forget(cart_id)
+        self.journal.delete_cart(cart_id)
+
+    def forget(self, cart_id: str) -> None:
+        """Drop the in-memory copy only"""
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def _remember(self, cart: Cart) -> None:
+        self._carts[cart.id] = cart
+        while len(self._carts) > self.max_carts:
+            self._carts.popitem(last=False)
+
+    def _maybe_purge(self) -> None:
+        if time.monotonic() - self._purged_at < 60:
+            return
+        self._purged_at = time.monotonic()
+        with self._lock:
+            now = time.time()
+            for cart_id in [c.id for c in self._carts.values() if c.expires_at < now]:
+                del self._carts[cart_id]
+        self.journal.purge_expired()
+
+
+cart_store = CartStore(
+    CartJournal(settings.CART_JOURNAL_PATH),
+    max_carts=settings.CART_MAX_CARTS,
+    ttl_seconds=settings.CART_TTL_SECONDS,
+)
+
+
+class CartService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create_cart(self, items: List[CartItemUpdate]) -> Cart:
+        """Create a cart, optionally with initial items"""
+        cart = cart_store.create()
+        if items:
+            self.update_items(cart.id, items)
+        return cart
+
+    def get_cart(self, cart_id: str) -> Cart:
+        return cart_store.get(cart_id)
+
+    def update_items(self, cart_id: str, items: List[CartItemUpdate]) -> Cart:
+        """Set line quantities; a quantity of 0 removes the line"""
+        cart = cart_store.get(cart_id)
+        new_ids = [i.product_id for i in items if i.product_id not in cart.lines and i.quantity > 0]
+        prices = catalog_cache.get_prices(self.db, new_ids) if new_ids else {}
+        # Raises ProductNotFoundError before changing anything if a SKU is unknown
+        cart_store.update(cart, prices, items)
+        return cart
+
+    def delete_cart(self, cart_id: str) -> None:
+        cart_store.get(cart_id)
+        cart_store.discard(cart_id)
+
+    async def checkout(
+        self, cart_id: str, checkout: CartCheckout, background_tasks: BackgroundTasks
+    ) -> Tuple[Bill, List[Dict[str, int]]]:
+        """Turn the cart into a bill at the prices locked into its lines.
+
+        The cart is claimed first, so a second checkout of it, or an edit,
+        from any worker fails with CartConflictError until this one is done.
+        """
+        cart = cart_store.get(cart_id)
+        cart_store.claim(cart)
+        try:
+            result = await self._bill(cart, checkout, background_tasks)
+        except Exception:
+            cart_store.release(cart_id)
+            raise
+        cart_store.discard(cart_id)
+        return result
+
+    async def _bill(
+        self, cart: Cart, checkout: CartCheckout, background_tasks: BackgroundTasks
+    ) -> Tuple[Bill, List[Dict[str, int]]]:
+        bill_create = BillCreate(
+            customer_email=checkout.customer_email,
+            items=[
+                BillItemCreate(product_id=product_id, quantity=line.quantity)
+                for product_id, line in cart.lines.items()
+            ],
+            paid_amount=checkout.paid_amount,
+            denomination=checkout.denomination,
+        )
+        prices = {product_id: line.price for product_id, line in cart.lines.items()}
+
+        return await BillingService(self.db).create_bill(
+            bill_create, background_tasks, prices=prices
+        )
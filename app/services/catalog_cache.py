@@ -0,0 +1,202 @@
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.invalidation import invalidation_channel
+from app.models.models import CatalogVersion, Product
+
+NOTIFY_CHANNEL = "catalog_changed"
+_UPSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """Immutable price/tax view of a product at a given catalog version"""
+
+    id: int
+    product_id: str
+    unit_price: float
+    tax_percentage: float
+
+
+def read_catalog_version(db: Session) -> int:
+    version = db.query(CatalogVersion.version).filter(CatalogVersion.id == 1).scalar()
+    return version or 0
+
+
+def bump_catalog_version(db: Session) -> int:
+    """Increment the catalog version inside the caller's transaction.
+
+    On Postgres a NOTIFY is queued as well; it is delivered to listeners only
+    when the transaction commits.
+    """
+    dialect = db.get_bind().dialect.name
+    upsert = _UPSERTS.get(dialect)
+    if upsert is not None:
+        # One statement, so two first bumps racing on a fresh database don't
+        # both try to insert the row
+        statement = upsert(CatalogVersion).values(id=1, version=1)
+        version = db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[CatalogVersion.id],
+                set_={"version": CatalogVersion.version + 1},
+            ).returning(CatalogVersion.version)
+        ).scalar_one()
+    else:
+        version = db.execute(
+            update(CatalogVersion)
+            .where(CatalogVersion.id == 1)
+            .values(version=CatalogVersion.version + 1)
+            .returning(CatalogVersion.version)
+        ).scalar()
+        if version is None:
+            version = 1
+            db.execute(insert(CatalogVersion).values(id=1, version=version))
+
+    if dialect == "postgresql":
+        db.connection().exec_driver_sql(f"NOTIFY {NOTIFY_CHANNEL}, '{version}'")
+    return version
+
+
+class CatalogCache:
+    """Process-local LRU of product price snapshots keyed by product_id.
+
+    Entries are only trusted for the catalog version they were loaded at.
+    Other processes' changes are picked up through Postgres LISTEN/NOTIFY,
+    or by polling the version row when no listener is running.
+    """
+
+    def __init__(self, max_entries: int, poll_seconds: float):
+        self.max_entries = max_entries
+        self.poll_seconds = poll_seconds
+        self.version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, PriceSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._listening = False
+
+    def get_prices(
+        self, db: Session, product_ids: Iterable[str]
+    ) -> Dict[str, PriceSnapshot]:
+        """Return snapshots for the requested products, loading misses in one query"""
+        self._ensure_current(db)
+        found, missing = {}, []
+        with self._lock:
+            for product_id in product_ids:
+                snapshot = self._entries.get(product_id)
+                if snapshot is None:
+                    missing.append(product_id)
+                else:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = snapshot
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            version = self.version
+            rows = db.query(
+                Product.id, Product.product_id, Product.unit_price, Product.tax_percentage
+            ).filter(Product.product_id.in_(missing))
+            loaded = [PriceSnapshot(*row) for row in rows]
+            with self._lock:
+                # Don't cache rows that raced with an invalidation
+                if version == self.version:
+                    for snapshot in loaded:
+                        self._entries[snapshot.product_id] = snapshot
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            found.update((snapshot.product_id, snapshot) for snapshot in loaded)
+        return found
+
+    def invalidate(self, version: Optional[int] = None) -> None:
+        """Drop every snapshot; the next read reloads at ``version``"""
+        with self._lock:
+            self._entries.clear()
+            self.version = version
+            self._checked_at = time.monotonic() if version is not None else 0.0
+
+    def _ensure_current(self, db: Session) -> None:
+        if self.version is not None and (
+            self._listening or time.monotonic() - self._checked_at < self.poll_seconds
+        ):
+            return
+        version = read_catalog_version(db)
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def start_listener(self, engine: Engine) -> None:
+        """Follow catalog changes from other processes via LISTEN (Postgres only)"""
+        if engine.dialect.name != "postgresql":
+            return
+        thread = threading.Thread(
+            target=self._listen, args=(engine,), name="catalog-listener", daemon=True
+        )
+        thread.start()
+
+    def _listen(self, engine: Engine) -> None:
+        connect_args, connect_kwargs = engine.dialect.create_connect_args(engine.url)
+        while True:
+            connection = None
+            try:
+                # A dedicated connection outside the pool, held for LISTEN
+                connection = engine.dialect.connect(*connect_args, **connect_kwargs)
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Anything committed before LISTEN took effect is caught by a fresh read
+                self.invalidate()
+                self._listening = True
+                while True:
+                    if select.select([connection], [], [], 60) == ([], [], []):
+                        continue
+                    connection.poll()
+                    latest = None
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        latest = max(latest or 0, int(notify.payload or 0))
+                    if latest is not None:
+                        self.invalidate(latest)
+            except Exception as e:
+                logger.warning(
+                    "Catalog listener error, falling back to polling: %s", str(e)
+                )
+            finally:
+                self._listening = False
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            time.sleep(self.poll_seconds)
+
+
+catalog_cache = CatalogCache(
+    max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+    poll_seconds=settings.CATALOG_VERSION_POLL_SECONDS,
+)
+invalidation_channel.subscribe(
+    "catalog", lambda data: catalog_cache.invalidate(data["version"])
+)
+
+
+def catalog_changed(version: int) -> None:
+    """Drop this worker's snapshots after a commit and tell the other workers"""
+    catalog_cache.invalidate(version)
+    invalidation_channel.broadcast("catalog", version=version)
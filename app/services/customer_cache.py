@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Customer
+
+_UPSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+_PENDING = "pending_customer_ids"
+
+
+class CustomerCache:
+    """LRU of customer email -> id.
+
+    Customers are never deleted or re-keyed, so an id is valid for good once
+    its row is committed and entries never need invalidating. Ids resolved
+    inside a transaction are only published when that transaction commits.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, email: str) -> Optional[int]:
+        with self._lock:
+            customer_id = self._entries.get(email)
+            if customer_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            return customer_id
+
+    def put_many(self, ids: Dict[str, int]) -> None:
+        with self._lock:
+            for email, customer_id in ids.items():
+                self._entries[email] = customer_id
+                self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def lookup(self, db: Session, email: str) -> Optional[int]:
+        """Id of an existing customer, or None; never writes"""
+        customer_id = self._get(email)
+        if customer_id is None:
+            customer_id = db.query(Customer.id).filter(Customer.email == email).scalar()
+            if customer_id is not None:
+                self.put_many({email: customer_id})
+        return customer_id
+
+    def resolve(self, db: Session, email: str) -> int:
+        """Id of the customer with this email, creating the row if needed"""
+        return self.resolve_many(db, [email])[email]
+
+    def resolve_many(self, db: Session, emails: Iterable[str]) -> Dict[str, int]:
+        ids = {}
+        for email in emails:
+            customer_id = db.info.get(_PENDING, {}).get(email) or self._get(email)
+            if customer_id is None:
+                customer_id = self._upsert(db, email)
+                db.info.setdefault(_PENDING, {})[email] = customer_id
+            ids[email] = customer_id
+        return ids
+
+    def _upsert(self, db: Session, email: str) -> int:
+        upsert = _UPSERTS.get(db.get_bind().dialect.name)
+        if upsert is None:
+            customer = db.query(Customer).filter(Customer.email == email).first()
+            if customer is None:
+                customer = Customer(email=email)
+                db.add(customer)
+                db.flush()
+            return customer.id
+        # A no-op update rather than DO NOTHING, so RETURNING also yields
+        # the id of a row that already existed or a concurrent insert won
+        statement = upsert(Customer).values(email=email)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Customer.email], set_={"email": statement.excluded.email}
+        ).returning(Customer.id)
+        return db.execute(statement).scalar_one()
+
+
+customer_cache = CustomerCache(max_entries=settings.CUSTOMER_CACHE_MAX_ENTRIES)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING, None)
+    if pending:
+        customer_cache.put_many(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING, None)
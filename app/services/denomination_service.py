@@ -5,7 +5,10 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.events import event_bus
 from app.core.exceptions import DatabaseError, InvalidDenominationError
+from app.core.retry import retry_on_conflict
+from app.db.session import begin_write
 from app.models.models import Denomination
 from app.schemas.schemas import DenominationCreate, DenominationUpdate
 
@@ -26,6 +29,11 @@ class DenominationService:
             self.db.add(db_denomination)
             self.db.commit()
             self.db.refresh(db_denomination)
+            event_bus.publish(
+                "denomination_changed",
+                value=db_denomination.value,
+                count=db_denomination.count,
+            )
             return db_denomination
 
         except IntegrityError:
@@ -50,10 +58,12 @@ class DenominationService:
         """Get all denominations ordered by value descending"""
         return self.db.query(Denomination).order_by(Denomination.value.desc()).all()
 
+    @retry_on_conflict
     def update_denomination_count(
         self, value: int, update: DenominationUpdate
     ) -> Denomination:
         """Update denomination count"""
+        begin_write(self.db)
         try:
             denomination = self.get_denomination(value)
 
@@ -63,6 +73,9 @@ class DenominationService:
             denomination.count = update.count
             self.db.commit()
             self.db.refresh(denomination)
+            event_bus.publish(
+                "denomination_changed", value=denomination.value, count=denomination.count
+            )
             return denomination
 
         except Exception as e:
@@ -77,6 +90,7 @@ class DenominationService:
             if denomination:
                 self.db.delete(denomination)   # ✅ actually delete the object
                 self.db.commit()
+                event_bus.publish("denomination_deleted", value=value)
                 return True
 
             return False  # no denomination found
@@ -118,16 +132,22 @@ class DenominationService:
                 return False
         return True
 
+    @retry_on_conflict
     def update_denominations_after_transaction(
         self, distribution: Dict[int, int]
     ) -> None:
         """Update denomination counts after a transaction"""
+        begin_write(self.db)
         try:
+            counts = {}
             for value, count in distribution.items():
                 denomination = self.get_denomination(value)
                 denomination.count -= count
+                counts[value] = denomination.count
 
             self.db.commit()
+            for value, count in counts.items():
+                event_bus.publish("denomination_changed", value=value, count=count)
 
         except Exception as e:
             self.db.rollback()
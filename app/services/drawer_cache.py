@@ -0,0 +1,54 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.events import Event, event_bus
+from app.models.models import Denomination
+
+
+class DrawerCache:
+    """Cached view of the cash drawer (denomination value -> count).
+
+    Kept current in-process from the denomination events the services
+    publish, and reloaded after ``ttl_seconds`` to pick up other workers'
+    changes. Only used for advisory reads such as quotes; bills still read
+    the drawer inside their own transaction.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._counts: Optional[Dict[int, int]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self, db: Session) -> List[Tuple[int, int]]:
+        """Return (value, count) pairs sorted by value descending"""
+        with self._lock:
+            if self._counts is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return sorted(self._counts.items(), reverse=True)
+
+        counts = dict(db.query(Denomination.value, Denomination.count))
+        with self._lock:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+        return sorted(counts.items(), reverse=True)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._counts = None
+
+    def apply_event(self, event: Event) -> None:
+        with self._lock:
+            if self._counts is None:
+                return
+            if event.type == "denomination_changed":
+                self._counts[event.data["value"]] = event.data["count"]
+            elif event.type == "denomination_deleted":
+                self._counts.pop(event.data["value"], None)
+
+
+drawer_cache = DrawerCache(ttl_seconds=settings.DRAWER_CACHE_TTL_SECONDS)
+event_bus.add_listener(drawer_cache.apply_event)
@@ -0,0 +1,248 @@
+"""Background sync for a till running in edge mode.
+
+The till bills against its own SQLite database. This module keeps that
+database's catalog and drawer seeded from the central server and pushes the
+outbox of committed bills there in gzip batches, backing off while the link
+is down. Local stock is the central figure minus whatever is still waiting
+in the outbox, so a refresh never hands back stock the till already sold.
+"""
+import gzip
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+import orjson
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import (BillItem, Denomination, Product, StockMovement,
+                               StockSnapshot, SyncOutbox)
+from app.services.catalog_cache import bump_catalog_version, catalog_changed
+from app.services.drawer_cache import drawer_cache
+from app.services.low_stock import low_stock_tracker
+from app.services.stock_ledger import (ADJUSTMENT, RECEIPT, StockLedgerService,
+                                       movement)
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = 500
+
+
+class EdgeSync:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        client: httpx.Client,
+        register_id: str,
+    ):
+        self.session_factory = session_factory
+        self.client = client
+        self.register_id = register_id
+        self.pushed = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _pending_quantities(self, db: Session) -> Counter:
+        pending: Counter = Counter()
+        for (payload,) in db.query(SyncOutbox.payload).filter(SyncOutbox.synced_at.is_(None)):
+            for item in orjson.loads(payload)["items"]:
+                pending[item["product_id"]] += item["quantity"]
+        return pending
+
+    def pull_catalog(self) -> int:
+        """Copy the central catalog into the local database.
+
+        Products the central server no longer has are removed from the till,
+        or, if local bills still refer to them, kept with no stock so they
+        can't be sold.
+        """
+        rows = []
+        while True:
+            # Keyset paging: a product added or deleted mid-pull can't shift a page
+            params = {"limit": _PAGE_SIZE}
+            if rows:
+                params["after_id"] = rows[-1]["id"]
+            response = self.client.get("/api/v1/products/", params=params)
+            response.raise_for_status()
+            page = response.json()
+            rows.extend(page)
+            if len(page) < _PAGE_SIZE:
+                break
+
+        with self.session_factory() as db:
+            pending = self._pending_quantities(db)
+            local = {product.product_id: product for product in db.query(Product)}
+            refreshed = []
+            for row in rows:
+                stock = max(row["available_stocks"] - pending[row["product_id"]], 0)
+                product = local.pop(row["product_id"], None)
+                previous = None if product is None else product.available_stocks
+                if product is None:
+                    product = Product(product_id=row["product_id"])
+                    db.add(product)
+                refreshed.append((product, previous))
+                product.name = row["name"]
+                product.unit_price = float(row["unit_price"])
+                product.tax_percentage = float(row["tax_percentage"])
+                product.available_stocks = stock
+                if "reorder_threshold" in row:
+                    product.reorder_threshold = row["reorder_threshold"]
+
+            # Whatever is left in ``local`` was deleted centrally
+            gone = {product.id: product for product in local.values()}
+            sold = set()
+            if gone:
+                sold = {
+                    product_id
+                    for (product_id,) in db.query(BillItem.product_id)
+                    .filter(BillItem.product_id.in_(list(gone)))
+                    .distinct()
+                }
+            for id, product in gone.items():
+                if id in sold:
+                    refreshed.append((product, product.available_stocks))
+                    product.available_stocks = 0
+                else:
+                    for model in (StockSnapshot, StockMovement):
+                        db.execute(delete(model).where(model.product_id == id))
+                    db.delete(product)
+            db.flush()
+            StockLedgerService(db).record(
+                movement(product.id, RECEIPT, product.available_stocks)
+                if previous is None
+                else movement(product.id, ADJUSTMENT, product.available_stocks - previous)
+                for product, previous in refreshed
+            )
+            version = bump_catalog_version(db)
+            db.commit()
+        catalog_changed(version)
+        # A whole-catalog refresh publishes no per-product crossings
+        low_stock_tracker.invalidate()
+        return len(rows)
+
+    def seed_drawer(self) -> bool:
+        """Copy the central denominations once; after that the drawer is local"""
+        with self.session_factory() as db:
+            if db.query(Denomination.id).first() is not None:
+                return False
+            response = self.client.get("/api/v1/denominations/")
+            response.raise_for_status()
+            for row in response.json():
+                db.add(Denomination(value=row["value"], count=row["count"]))
+            db.commit()
+        drawer_cache.invalidate()
+        return True
+
+    def push(self) -> Optional[Dict[str, Any]]:
+        """Send one batch from the outbox; returns None when it is empty"""
+        with self.session_factory() as db:
+            entries = (
+                db.query(SyncOutbox)
+                .filter(SyncOutbox.synced_at.is_(None))
+                .order_by(SyncOutbox.id)
+                .limit(settings.EDGE_SYNC_BATCH_SIZE)
+                .all()
+            )
+            if not entries:
+                return None
+            # Payloads are stored serialised, so the batch is spliced, not re-encoded
+            body = b"".join(
+                [
+                    b'{"register_id":',
+                    orjson.dumps(self.register_id),
+                    b',"bills":[',
+                    b",".join(entry.payload for entry in entries),
+                    b"]}",
+                ]
+            )
+            try:
+                response = self.client.post(
+                    "/api/v1/bills/sync",
+                    content=gzip.compress(body),
+                    headers={
+                        "Content-Type": "application/json",
+                        "Content-Encoding": "gzip",
+                    },
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                for entry in entries:
+                    entry.attempts += 1
+                    entry.last_error = str(e)[:500]
+                db.commit()
+                raise
+
+            result = response.json()
+            by_sync_id = {orjson.loads(entry.payload)["sync_id"]: entry for entry in entries}
+            now = datetime.now(timezone.utc)
+            for sync_id in result["accepted"] + result["duplicates"]:
+                entry = by_sync_id[sync_id]
+                entry.attempts += 1
+                entry.last_error = None
+                entry.synced_at = now
+            for rejection in result["rejected"]:
+                # Central will never take these; park them with the reason for an operator
+                entry = by_sync_id[rejection["sync_id"]]
+                entry.attempts += 1
+                entry.last_error = rejection["reason"][:500]
+                entry.synced_at = now
+                logger.error(
+                    "edge bill rejected",
+                    extra={"sync_id": rejection["sync_id"], "reason": rejection["reason"]},
+                )
+            db.commit()
+        self.pushed += len(result["accepted"])
+        if result["conflicts"]:
+            logger.warning(
+                "stock conflicts reported by central",
+                extra={"conflicts": len(result["conflicts"])},
+            )
+        return result
+
+    def sync_once(self) -> None:
+        while self.push() is not None:
+            pass
+
+    def run(self) -> None:
+        backoff = settings.EDGE_SYNC_INTERVAL_SECONDS
+        last_refresh = float("-inf")
+        while not self._stop.is_set():
+            try:
+                self.seed_drawer()
+                # Push first so the refreshed stock already reflects our sales
+                self.sync_once()
+                now = time.monotonic()
+                if now - last_refresh >= settings.EDGE_CATALOG_REFRESH_SECONDS:
+                    self.pull_catalog()
+                    last_refresh = now
+                backoff = settings.EDGE_SYNC_INTERVAL_SECONDS
+            except Exception as e:
+                self.failures += 1
+                logger.warning(
+                    "edge sync failed, retrying",
+                    extra={"error": str(e), "retry_in": backoff},
+                )
+                backoff = min(backoff * 2, settings.EDGE_SYNC_MAX_BACKOFF_SECONDS)
+                self._stop.wait(backoff)
+                continue
+            self._stop.wait(settings.EDGE_SYNC_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="edge-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+        self.client.close()
@@ -1,13 +1,22 @@
+import logging
 from pathlib import Path
+from typing import Any, Dict, List
 
 from fastapi.background import BackgroundTasks
 from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
+from sqlalchemy.orm import object_session
 
 from app.core.config import settings
 from app.core.exceptions import EmailError
 from app.db.session import SessionLocal
 from app.models.models import Bill as BillModel
+from app.models.models import Product as ProductModel
 from app.schemas.schemas import Bill
+from app.schemas.serializers import serialize_bill
+from app.services.bill_cache import bill_cache
+from app.services.receipts import receipt_data, receipt_renderer
+
+logger = logging.getLogger(__name__)
 
 # Email configuration
 conf = ConnectionConfig(
@@ -30,39 +39,108 @@ class EmailService:
         self, background_tasks: BackgroundTasks, customer_email: str, bill: Bill
     ):
         """Send bill details to customer email asynchronously"""
+        # Reuse the caller's session: a second pool checkout while the request
+        # still holds its connection can exhaust the pool under load
+        owner = object_session(bill)
         try:
-            db = SessionLocal()
-            # Create message schema
-            message = MessageSchema(
-                subject="Your Bill Details",
-                recipients=[customer_email],
-                template_body={
+            db = owner or SessionLocal()
+            items = self._template_items(bill)
+            fields = {
+                "subject": "Your Bill Details",
+                "recipients": [customer_email],
+                "template_body": {
                     "bill": bill,
                     "total_amount": bill.total_amount,
                     "tax_amount": bill.tax_amount,
                     "paid_amount": bill.paid_amount,
                     "balance_amount": bill.balance_amount,
-                    "items": bill.items,
+                    "items": items,
                 },
-                subtype="html",
-            )
+                "subtype": "html",
+            }
+            # Create message schema
+            message = MessageSchema(**fields)
 
             # Add email sending task to background tasks
-            background_tasks.add_task(
-                self.fastmail.send_message, message, template_name="bill_email.html"
-            )
+            if settings.RECEIPT_EMAIL_ATTACHMENT:
+                names = {
+                    line["product_id"]: line["product"]["name"]
+                    for line in items
+                    if "product" in line
+                }
+                receipt = receipt_data(serialize_bill(bill, customer_email), names)
+                background_tasks.add_task(self._send_with_receipt, fields, bill.id, receipt)
+            else:
+                background_tasks.add_task(
+                    self.fastmail.send_message, message, template_name="bill_email.html"
+                )
+            bill_id = bill.id
             try:
-                bill = db.query(BillModel).filter(BillModel.id == bill.id).first()
-                if bill:
-                    bill.mail_sent = True
-                db.commit()
+                marked = (
+                    db.query(BillModel)
+                    .filter(BillModel.id == bill_id)
+                    .update({"mail_sent": True}, synchronize_session=False)
+                )
+                # The caller still serialises the bill; don't make it reload
+                expire_on_commit, db.expire_on_commit = db.expire_on_commit, False
+                try:
+                    db.commit()
+                finally:
+                    db.expire_on_commit = expire_on_commit
+                if marked:
+                    # Other workers read the flag from the row
+                    bill_cache.mark_mail_sent(bill_id)
             except Exception as e:
-                print("error", str(e))
+                logger.error("Failed to mark bill %s as mailed: %s", bill_id, str(e))
 
         except Exception as e:
             raise EmailError(f"Failed to send email: {str(e)}")
         finally:
-            db.close()
+            if owner is None:
+                db.close()
+
+    async def _send_with_receipt(
+        self, fields: Dict[str, Any], bill_id: int, receipt: Dict[str, Any]
+    ) -> None:
+        """Send a bill email with its PDF receipt, rendered in the receipt pool
+        after the response has gone out, or reused from disk"""
+        attachments = []
+        try:
+            path = await receipt_renderer.render(bill_id, receipt)
+            attachments.append(
+                {"file": str(path), "mime_type": "application", "mime_subtype": "pdf"}
+            )
+        except Exception as e:
+            # The bill email matters more than its attachment
+            logger.warning("Receipt for bill %s not attached: %s", bill_id, str(e))
+        await self.fastmail.send_message(
+            MessageSchema(**fields, attachments=attachments), template_name="bill_email.html"
+        )
+
+    def _template_items(self, bill: BillModel) -> List[Dict[str, Any]]:
+        """Bill lines with product names fetched in one query, not one per line"""
+        items = list(bill.items)
+        names = {}
+        session = object_session(bill)
+        if session is not None and items:
+            names = dict(
+                session.query(ProductModel.id, ProductModel.name).filter(
+                    ProductModel.id.in_({item.product_id for item in items})
+                )
+            )
+        lines = []
+        for item in items:
+            line = {
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "tax_percentage": item.tax_percentage,
+                "total_amount": item.total_amount,
+            }
+            if item.product_id in names:
+                line["product"] = {"name": names[item.product_id]}
+            lines.append(line)
+        return lines
 
     async def send_test_email(self, email: str):
         """Send a test email to verify email configuration"""
@@ -0,0 +1,87 @@
+import threading
+import time
+from typing import List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.events import RESYNC, Event, event_bus
+from app.models.models import Product
+
+LOW_STOCK = Product.available_stocks < Product.reorder_threshold
+
+
+class LowStockTracker:
+    """Ids of products below their reorder threshold.
+
+    Loaded once through the low-stock partial index, then kept current from
+    the threshold-crossing events every stock write publishes, including
+    those replayed from other workers. Imports publish no per-product
+    events, so they trigger a reload instead, as does a ``resync`` from a
+    peer whose deltas were lost. Replayed events are best effort and never
+    come from other hosts, so the set is also reloaded after ``ttl_seconds``.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._ids: Optional[Set[int]] = None
+        self._loaded_at = 0.0
+        self._pending: Optional[List[Event]] = None  # Events seen during a load
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def ids(self, db: Session) -> Set[int]:
+        with self._lock:
+            if self._fresh():
+                return set(self._ids)
+        with self._load_lock:
+            with self._lock:
+                if self._fresh():
+                    return set(self._ids)
+                self._pending = []
+            loaded_at = time.monotonic()
+            ids = {id for (id,) in db.query(Product.id).filter(LOW_STOCK)}
+            with self._lock:
+                pending, self._pending = self._pending, None
+                if pending is None:
+                    return ids  # An import landed mid-load; the next caller reloads
+                for event in pending:
+                    self._apply(ids, event)
+                self._ids = ids
+                self._loaded_at = loaded_at
+                return set(ids)
+
+    def _fresh(self) -> bool:
+        return self._ids is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def count(self, db: Session) -> int:
+        return len(self.ids(db))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._ids = None
+            self._pending = None
+
+    def apply_event(self, event: Event) -> None:
+        if event.type in ("products_imported", RESYNC.type):
+            self.invalidate()
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(event)
+            if self._ids is not None:
+                self._apply(self._ids, event)
+
+    @staticmethod
+    def _apply(ids: Set[int], event: Event) -> None:
+        if event.type == "low_stock":
+            ids.add(event.data["id"])
+        elif event.type in ("stock_recovered", "product_deleted"):
+            ids.discard(event.data["id"])
+        elif event.type == "product_created":
+            if event.data["available_stocks"] < event.data["reorder_threshold"]:
+                ids.add(event.data["id"])
+
+
+low_stock_tracker = LowStockTracker(ttl_seconds=settings.LOW_STOCK_TTL_SECONDS)
+event_bus.add_listener(low_stock_tracker.apply_event)
@@ -0,0 +1,360 @@
+"""Top sellers over a rolling window, and products bought together.
+
+Both live in memory and are updated from every committed bill, so a lookup
+costs O(k) instead of a GROUP BY over bill_items. Sales are counted in
+fixed-size time buckets; buckets that fall out of the window are subtracted
+from the running totals. Co-purchases are a sparse per-product counter with
+a fixed number of slots: a new partner takes over the weakest slot and its
+count (Space-Saving), so a pair that starts late can still climb, while the
+count it inherited is tracked as error and left out of its ranking. Pair
+counts are halved once per window, so pairs that stop selling fade.
+
+Each bill's lines are broadcast to peer workers so all of them rank the
+same sales. The state is checkpointed to a table periodically and reloaded
+on startup, after which the bills committed since the checkpoint are
+replayed from bill_items.
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.invalidation import invalidation_channel
+from app.models.models import Bill, BillItem, PopularityCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Pairs grow with the square of a bill's distinct products; huge bills only
+# count their first few toward co-purchases
+_MAX_PAIRED_PRODUCTS = 25
+
+Lines = Iterable[Sequence[int]]  # (product id, quantity)
+
+
+class PopularityIndex:
+    def __init__(
+        self,
+        window_seconds: int,
+        bucket_seconds: int,
+        top_capacity: int,
+        related_capacity: int,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = max(window_seconds // bucket_seconds, 1)
+        self.top_capacity = top_capacity
+        self.related_capacity = related_capacity
+        self.clock = clock
+        self.last_bill_id = 0
+        self._buckets: Deque[Tuple[int, Counter]] = deque()
+        self._totals: Counter = Counter()
+        self._top: List[int] = []  # Highest totals first
+        self._pairs: Dict[int, Counter] = defaultdict(Counter)
+        self._pair_errors: Dict[int, Counter] = defaultdict(Counter)  # Inherited counts
+        self._pairs_epoch: Optional[int] = None  # Window the pair counts were last aged in
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- Updates
+
+    def record(self, bill_id: int, lines: Lines, at: Optional[float] = None) -> None:
+        quantities: Counter = Counter()
+        for product_id, quantity in lines:
+            quantities[product_id] += quantity
+        if not quantities:
+            return
+        at = self.clock() if at is None else at
+        with self._lock:
+            self._count_sales(quantities, at)
+            self._age_pairs(int(at // (self.window_buckets * self.bucket_seconds)))
+            self._count_pairs(sorted(quantities)[:_MAX_PAIRED_PRODUCTS])
+            self.last_bill_id = max(self.last_bill_id, bill_id)
+            self._dirty = True
+
+    def record_bill(
+        self, bill_id: int, lines: Lines, created_at: Optional[datetime] = None
+    ) -> None:
+        """Count a bill committed by this worker and tell the others about it"""
+        lines = [(product_id, quantity) for product_id, quantity in lines]
+        at = self.clock() if created_at is None else _timestamp(created_at)
+        self.record(bill_id, lines, at)
+        invalidation_channel.broadcast("bill_lines", bill_id=bill_id, lines=lines, at=at)
+
+    def _count_sales(self, quantities: Counter, at: float) -> None:
+        bucket = int(at // self.bucket_seconds)
+        self._expire(max(bucket, self._buckets[-1][0] if self._buckets else bucket))
+        counts = self._bucket(bucket)
+        if counts is None:
+            return  # Older than the window, e.g. a late replay
+        for product_id, quantity in quantities.items():
+            counts[product_id] += quantity
+            self._totals[product_id] += quantity
+            self._promote(product_id)
+
+    def _bucket(self, bucket: int) -> Optional[Counter]:
+        if not self._buckets or self._buckets[-1][0] < bucket:
+            self._buckets.append((bucket, Counter()))
+            return self._buckets[-1][1]
+        # Synced offline sales may land in an earlier bucket
+        for start, counts in reversed(self._buckets):
+            if start == bucket:
+                return counts
+            if start < bucket:
+                break
+        if bucket <= self._buckets[-1][0] - self.window_buckets:
+            return None
+        counts = Counter()
+        index = next(i for i, (start, _) in enumerate(self._buckets) if start > bucket)
+        self._buckets.insert(index, (bucket, counts))
+        return counts
+
+    def _expire(self, current_bucket: int) -> None:
+        oldest = current_bucket - self.window_buckets + 1
+        expired = False
+        while self._buckets and self._buckets[0][0] < oldest:
+            _, counts = self._buckets.popleft()
+            self._totals.subtract(counts)
+            expired = True
+        if expired:
+            self._totals = +self._totals  # Drop products that no longer sell
+            self._top = heapq.nlargest(self.top_capacity, self._totals, key=self._rank)
+
+    def _rank(self, product_id: int) -> Tuple[int, int]:
+        return self._totals[product_id], -product_id
+
+    def _promote(self, product_id: int) -> None:
+        # Totals only grow between expiries, so only the product that just
+        # sold can enter the ranking, and only by displacing the last entry
+        top = self._top
+        if product_id not in top:
+            if len(top) < self.top_capacity:
+                top.append(product_id)
+            elif self._rank(product_id) > self._rank(top[-1]):
+                top[-1] = product_id
+            else:
+                return
+        top.sort(key=self._rank, reverse=True)
+
+    def _count_pairs(self, product_ids: List[int]) -> None:
+        # Twice the slots that are shown, so the ranking shown is mostly exact
+        slots = 2 * self.related_capacity
+        for product_id in product_ids:
+            related = self._pairs[product_id]
+            errors = self._pair_errors[product_id]
+            for other in product_ids:
+                if other == product_id:
+                    continue
+                if other in related or len(related) < slots:
+                    related[other] += 1
+                    continue
+                # The weakest slot, and of those the least certain one
+                weakest = min(related, key=lambda p: (related[p], -errors[p]))
+                count = related.pop(weakest)
+                errors.pop(weakest, None)
+                related[other] = count + 1
+                errors[other] = count
+            if not errors:
+                del self._pair_errors[product_id]
+
+    def _age_pairs(self, epoch: int) -> None:
+        """Halve every pair count for each window that has passed"""
+        if self._pairs_epoch is not None and epoch > self._pairs_epoch:
+            shift = epoch - self._pairs_epoch
+            pairs, pair_errors = defaultdict(Counter), defaultdict(Counter)
+            for product_id, related in self._pairs.items():
+                errors = self._pair_errors.get(product_id, {})
+                for other, count in related.items():
+                    error = errors.get(other, 0) >> shift
+                    count = ((count - errors.get(other, 0)) >> shift) + error
+                    if count:  # Pairs that faded to nothing go
+                        pairs[product_id][other] = count
+                        if error:
+                            pair_errors[product_id][other] = error
+            self._pairs, self._pair_errors = pairs, pair_errors
+        if self._pairs_epoch is None or epoch > self._pairs_epoch:
+            self._pairs_epoch = epoch
+
+    # ----- Lookups
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """(product id, units sold in the window), best sellers first"""
+        with self._lock:
+            self._expire(int(self.clock() // self.bucket_seconds))
+            return [
+                (product_id, self._totals[product_id]) for product_id in self._top[: max(limit, 0)]
+            ]
+
+    def related(self, product_id: int, limit: int) -> List[Tuple[int, int]]:
+        """(product id, bills bought together), most frequent first"""
+        with self._lock:
+            related = self._pairs.get(product_id)
+            if not related:
+                return []
+            errors = self._pair_errors.get(product_id, {})
+            # Only the co-purchases seen since a partner took its slot count
+            counts = [(other, count - errors.get(other, 0)) for other, count in related.items()]
+            return heapq.nlargest(
+                limit,
+                (pair for pair in counts if pair[1] > 0),
+                key=lambda pair: (pair[1], -pair[0]),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self._totals.clear()
+            self._top = []
+            self._pairs.clear()
+            self._pair_errors.clear()
+            self._pairs_epoch = None
+            self.last_bill_id = 0
+            self._dirty = False
+
+    # ----- Persistence
+
+    def checkpoint(self, db: Session) -> bool:
+        """Save the current state if it changed since the last checkpoint"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            payload = orjson.dumps(
+                {
+                    "buckets": [[start, list(counts.items())] for start, counts in self._buckets],
+                    "pairs": [
+                        [product_id, list(related.items())]
+                        for product_id, related in self._pairs.items()
+                        if related
+                    ],
+                    "pair_errors": [
+                        [product_id, list(errors.items())]
+                        for product_id, errors in self._pair_errors.items()
+                        if errors
+                    ],
+                    "pairs_epoch": self._pairs_epoch,
+                }
+            )
+            last_bill_id = self.last_bill_id
+            self._dirty = False
+        try:
+            db.merge(
+                PopularityCheckpoint(
+                    id=1,
+                    last_bill_id=last_bill_id,
+                    payload=payload,
+                    checkpointed_at=datetime.now(timezone.utc),
+                )
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._dirty = True
+            raise
+        return True
+
+    def load(self, db: Session) -> int:
+        """Restore the last checkpoint and replay newer bills; returns bills replayed"""
+        checkpoint = db.get(PopularityCheckpoint, 1)
+        with self._lock:
+            if checkpoint is not None:
+                state = orjson.loads(checkpoint.payload)
+                self._buckets = deque((start, Counter(dict(counts))) for start, counts in state["buckets"])
+                self._totals = Counter()
+                for _, counts in self._buckets:
+                    self._totals.update(counts)
+                self._top = heapq.nlargest(self.top_capacity, self._totals, key=self._rank)
+                self._pairs = defaultdict(
+                    Counter, {product_id: Counter(dict(related)) for product_id, related in state["pairs"]}
+                )
+                self._pair_errors = defaultdict(
+                    Counter,
+                    {
+                        product_id: Counter(dict(errors))
+                        for product_id, errors in state.get("pair_errors", [])
+                    },
+                )
+                self._pairs_epoch = state.get("pairs_epoch")
+                self.last_bill_id = checkpoint.last_bill_id
+            since = self.last_bill_id
+
+        # Older bills could only feed co-purchases; a first start skips them
+        # rather than scanning the whole history
+        cutoff = datetime.now(timezone.utc) - timedelta(
+            seconds=self.window_buckets * self.bucket_seconds
+        )
+        rows = (
+            db.query(Bill.id, Bill.created_at, BillItem.product_id, BillItem.quantity)
+            .join(BillItem, BillItem.bill_id == Bill.id)
+            .filter(Bill.id > since, Bill.created_at >= cutoff)
+            .order_by(Bill.id)
+            .yield_per(5000)
+        )
+        replayed = 0
+        bill_id, created_at, lines = None, None, []
+        for row_bill_id, row_created_at, product_id, quantity in rows:
+            if row_bill_id != bill_id:
+                if lines:
+                    self.record(bill_id, lines, _timestamp(created_at))
+                    replayed += 1
+                bill_id, created_at, lines = row_bill_id, row_created_at, []
+            lines.append((product_id, quantity))
+        if lines:
+            self.record(bill_id, lines, _timestamp(created_at))
+            replayed += 1
+        return replayed
+
+    def run(self, session_factory: Callable[[], Session]) -> None:
+        while not self._stop.wait(settings.POPULARITY_CHECKPOINT_SECONDS):
+            try:
+                with session_factory() as db:
+                    self.checkpoint(db)
+            except Exception:
+                logger.exception("popularity checkpoint failed")
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        if self._thread is not None:
+            return
+        with session_factory() as db:
+            replayed = self.load(db)
+        logger.info("popularity index loaded", extra={"replayed_bills": replayed})
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, args=(session_factory,), name="popularity", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, session_factory: Callable[[], Session]) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        thread.join(timeout=5)
+        with session_factory() as db:
+            self.checkpoint(db)
+
+
+def _timestamp(created_at: datetime) -> float:
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)  # Stored as UTC
+    return created_at.timestamp()
+
+
+popularity_index = PopularityIndex(
+    window_seconds=settings.POPULARITY_WINDOW_HOURS * 3600,
+    bucket_seconds=settings.POPULARITY_BUCKET_SECONDS,
+    top_capacity=settings.POPULARITY_TOP_CAPACITY,
+    related_capacity=settings.POPULARITY_RELATED_CAPACITY,
+)
+invalidation_channel.subscribe(
+    "bill_lines",
+    lambda data: popularity_index.record(data["bill_id"], data["lines"], data["at"]),
+)
@@ -0,0 +1,44 @@
+"""Pure pricing and change arithmetic shared by bills, quotes and carts.
+
+Nothing here touches the database, so the same rounding applies whether a
+bill is committed, quoted or accumulated line by line in a cart.
+"""
+import math
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+TWO_PLACES = Decimal("0.00")
+
+
+def price_line(unit_price: float, tax_percentage: float, quantity: int) -> Tuple[Decimal, Decimal]:
+    """Return (tax_amount, total_amount) for one bill line"""
+    item_price = Decimal(str(unit_price)).quantize(TWO_PLACES) * quantity
+    item_tax = (item_price * (Decimal(str(tax_percentage)) / 100)).quantize(TWO_PLACES)
+    item_total = (item_price + item_tax).quantize(TWO_PLACES)
+    return item_tax, item_total
+
+
+def add_amount(running: Decimal, amount: Decimal) -> Decimal:
+    return (running + amount).quantize(TWO_PLACES)
+
+
+def round_total(total_amount: Decimal) -> int:
+    """Payable amount after dropping the paisa"""
+    return math.floor(total_amount)
+
+
+def compute_change(
+    balance: int, drawer: Iterable[Tuple[int, int]]
+) -> Tuple[List[Dict[str, int]], int]:
+    """Greedy change from (value, count) pairs sorted by value descending.
+
+    Returns the denominations to hand out and any balance left uncovered.
+    """
+    result = []
+    for value, available in drawer:
+        if balance >= value and available > 0:
+            count = min(balance // value, available)
+            if count > 0:
+                result.append({"value": value, "count": count})
+                balance -= count * value
+    return result, balance
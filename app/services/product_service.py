@@ -1,14 +1,55 @@
-from typing import List, Optional
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+from pydantic import ValidationError as SchemaValidationError
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from app.models.models import Product
-from app.schemas.schemas import ProductCreate, ProductUpdate
-from app.core.exceptions import ProductNotFoundError, DatabaseError
+from app.core.config import settings
+from app.core.events import event_bus, publish_stock_change, publish_stock_levels
+from app.core.retry import retry_on_conflict
+from app.db.session import begin_write
+from app.models.models import Product, StockMovement, StockSnapshot
+from app.schemas.schemas import (ProductCreate, ProductUpdate, StockAdjustment,
+                                 StockMovementCreate)
+from app.services.catalog_cache import bump_catalog_version, catalog_changed
+from app.services.popularity import popularity_index
+from app.services.stock_ledger import (ADJUSTMENT, RECEIPT, StockLedgerService,
+                                       movement)
+from app.core.exceptions import ProductNotFoundError, DatabaseError, ValidationError
+
+logger = logging.getLogger(__name__)
+
+IMPORT_COLUMNS = ("name", "product_id", "available_stocks", "unit_price", "tax_percentage")
+
+
+def read_import_rows(file: IO[bytes], filename: str = "") -> Iterator[Dict[str, Any]]:
+    """Lazily decode an uploaded CSV or NDJSON product file row by row"""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    if filename.lower().endswith((".ndjson", ".jsonl", ".json")):
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Reported against its row number by import_products
+                yield None
+    else:
+        yield from csv.DictReader(text)
+
 
 class ProductService:
     def __init__(self, db: Session):
         self.db = db
+        self.ledger = StockLedgerService(db)
 
     def create_product(self, product: ProductCreate) -> Product:
         """Create a new product"""
@@ -18,11 +59,24 @@ class ProductService:
                 product_id=product.product_id,
                 available_stocks=product.available_stocks,
                 unit_price=float(product.unit_price),
-                tax_percentage=float(product.tax_percentage)
+                tax_percentage=float(product.tax_percentage),
             )
+            if product.reorder_threshold is not None:
+                db_product.reorder_threshold = product.reorder_threshold
             self.db.add(db_product)
+            self.db.flush()
+            self.ledger.record([movement(db_product.id, RECEIPT, db_product.available_stocks)])
+            version = bump_catalog_version(self.db)
             self.db.commit()
+            catalog_changed(version)
             self.db.refresh(db_product)
+            event_bus.publish(
+                "product_created",
+                id=db_product.id,
+                product_id=db_product.product_id,
+                available_stocks=db_product.available_stocks,
+                reorder_threshold=db_product.reorder_threshold,
+            )
             return db_product
 
         except IntegrityError:
@@ -32,6 +86,193 @@ class ProductService:
             self.db.rollback()
             raise DatabaseError(f"Failed to create product: {str(e)}")
 
+    def import_products(self, rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Validate and upsert products in chunks, returning a per-row error report"""
+        begin_write(self.db)
+        report = {
+            "received": 0,
+            "imported": 0,
+            "failed": 0,
+            "errors": [],
+            "errors_truncated": False,
+        }
+        postgres = self.db.bind.dialect.name == "postgresql"
+        rows = enumerate(rows, start=1)
+        # Stock per product ID before the import (None if new) and after it
+        stock_before: Dict[str, Optional[int]] = {}
+        stock_after: Dict[str, int] = {}
+
+        try:
+            if postgres:
+                self._create_import_staging_table()
+
+            while True:
+                chunk = list(islice(rows, settings.PRODUCT_IMPORT_CHUNK_SIZE))
+                if not chunk:
+                    break
+                valid = self._validate_import_chunk(chunk, report)
+                if not valid:
+                    continue
+                self._read_import_stock(valid, stock_before)
+                if postgres:
+                    self._copy_import_chunk(valid)
+                else:
+                    self._upsert_import_chunk(valid)
+                for product in valid:
+                    stock_after[product["product_id"]] = product["available_stocks"]
+
+            # Distinct products written; a product ID repeated in a later
+            # chunk is upserted over the earlier row, not added twice
+            report["imported"] = len(stock_after)
+
+            if postgres:
+                self._upsert_import_staging_table()
+            self._record_import_movements(stock_before, stock_after)
+            version = bump_catalog_version(self.db)
+            self.db.commit()
+            catalog_changed(version)
+
+        except Exception as e:
+            self.db.rollback()
+            raise DatabaseError(f"Failed to import products: {str(e)}")
+
+        event_bus.publish(
+            "products_imported", imported=report["imported"], failed=report["failed"]
+        )
+        return report
+
+    def _validate_import_chunk(
+        self, chunk: List[tuple], report: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Validate one chunk; the last row wins when a product ID repeats"""
+        valid = {}
+        for row_number, row in chunk:
+            report["received"] += 1
+            try:
+                product = ProductCreate(**row)
+            except (SchemaValidationError, TypeError) as e:
+                report["failed"] += 1
+                if len(report["errors"]) >= settings.PRODUCT_IMPORT_MAX_ERRORS:
+                    report["errors_truncated"] = True
+                    continue
+                if isinstance(e, SchemaValidationError):
+                    message = "; ".join(
+                        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}"
+                        for err in e.errors()
+                    )
+                else:
+                    message = "Row is not a valid object"
+                report["errors"].append(
+                    {
+                        "row": row_number,
+                        "product_id": row.get("product_id") if isinstance(row, dict) else None,
+                        "error": message,
+                    }
+                )
+                continue
+
+            valid[product.product_id] = {
+                "name": product.name,
+                "product_id": product.product_id,
+                "available_stocks": product.available_stocks,
+                "unit_price": float(product.unit_price),
+                "tax_percentage": float(product.tax_percentage),
+            }
+        return list(valid.values())
+
+    def _read_import_stock(
+        self, products: List[Dict[str, Any]], stock_before: Dict[str, Optional[int]]
+    ) -> None:
+        """Remember the pre-import stock of product IDs not seen in earlier chunks"""
+        skus = [p["product_id"] for p in products if p["product_id"] not in stock_before]
+        if not skus:
+            return
+        found = dict(
+            self.db.execute(
+                select(Product.product_id, Product.available_stocks).where(
+                    Product.product_id.in_(skus)
+                )
+            ).all()
+        )
+        for sku in skus:
+            stock_before[sku] = found.get(sku)
+
+    def _record_import_movements(
+        self, stock_before: Dict[str, Optional[int]], stock_after: Dict[str, int]
+    ) -> None:
+        """Write a receipt for each new product and an adjustment for each changed one"""
+        skus = list(stock_after)
+        for start in range(0, len(skus), settings.STOCK_BULK_CHUNK_SIZE):
+            chunk = skus[start:start + settings.STOCK_BULK_CHUNK_SIZE]
+            ids = dict(
+                self.db.execute(
+                    select(Product.product_id, Product.id).where(Product.product_id.in_(chunk))
+                ).all()
+            )
+            self.ledger.record(
+                movement(ids[sku], RECEIPT, stock_after[sku])
+                if stock_before[sku] is None
+                else movement(ids[sku], ADJUSTMENT, stock_after[sku] - stock_before[sku])
+                for sku in chunk
+            )
+
+    def _upsert_import_chunk(self, products: List[Dict[str, Any]]) -> None:
+        """Upsert a validated chunk with a single executemany (SQLite)"""
+        stmt = sqlite_insert(Product)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.product_id],
+            set_={
+                "name": stmt.excluded.name,
+                "available_stocks": stmt.excluded.available_stocks,
+                "unit_price": stmt.excluded.unit_price,
+                "tax_percentage": stmt.excluded.tax_percentage,
+                "updated_at": func.now(),
+                "version": Product.version + 1,
+            },
+        )
+        self.db.execute(stmt, products)
+
+    def _create_import_staging_table(self) -> None:
+        self.db.connection().exec_driver_sql(
+            "CREATE TEMP TABLE products_import ("
+            "seq BIGSERIAL, name VARCHAR(255), product_id VARCHAR(50), "
+            "available_stocks INTEGER, unit_price DOUBLE PRECISION, "
+            "tax_percentage DOUBLE PRECISION) ON COMMIT DROP"
+        )
+
+    def _copy_import_chunk(self, products: List[Dict[str, Any]]) -> None:
+        """Stream a validated chunk into the staging table with COPY (Postgres)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for product in products:
+            writer.writerow([product[column] for column in IMPORT_COLUMNS])
+        buffer.seek(0)
+
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY products_import ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+    def _upsert_import_staging_table(self) -> None:
+        """Merge the staging table into products in one statement (Postgres)"""
+        columns = ", ".join(IMPORT_COLUMNS)
+        self.db.connection().exec_driver_sql(
+            f"INSERT INTO products ({columns}) "
+            f"SELECT DISTINCT ON (product_id) {columns} FROM products_import "
+            "ORDER BY product_id, seq DESC "
+            "ON CONFLICT (product_id) DO UPDATE SET "
+            "name = EXCLUDED.name, "
+            "available_stocks = EXCLUDED.available_stocks, "
+            "unit_price = EXCLUDED.unit_price, "
+            "tax_percentage = EXCLUDED.tax_percentage, "
+            "updated_at = now(), "
+            "version = products.version + 1"
+        )
+
     def get_product(self, id: int) -> Product:
         """Get a product by ID"""
         product = self.db.query(Product).filter(Product.id == id).first()
@@ -39,14 +280,61 @@ class ProductService:
             raise ProductNotFoundError(id)
         return product
 
-    def get_products(self, skip: int = 0, limit: int = 100) -> List[Product]:
-        """Get list of products with pagination"""
-        return self.db.query(Product).offset(skip).limit(limit).all()
+    def get_top_products(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Best sellers over the popularity window, with units sold"""
+        return self._ranked_products(popularity_index.top(limit))
+
+    def get_related_products(self, id: int, limit: int = 5) -> List[Dict[str, Any]]:
+        """Products most often bought together with this one"""
+        return self._ranked_products(popularity_index.related(id, limit), anchor=id)
 
+    def _ranked_products(
+        self, ranked: List[Any], anchor: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        # One IN query for the k ranked ids (and the product they relate to);
+        # products deleted since they sold are skipped
+        ids = [product_id for product_id, _ in ranked]
+        if anchor is not None:
+            ids.append(anchor)
+        products = {
+            product.id: product
+            for product in self.db.query(Product).filter(Product.id.in_(ids))
+        }
+        if anchor is not None and anchor not in products:
+            raise ProductNotFoundError(anchor)
+        return [
+            {"product": products[product_id], "count": count}
+            for product_id, count in ranked
+            if product_id in products
+        ]
+
+    def get_low_stock_products(self) -> List[Product]:
+        """Products below their reorder threshold, emptiest first"""
+        # Filters on exactly the partial index's predicate so it is used
+        return (
+            self.db.query(Product)
+            .filter(Product.available_stocks < Product.reorder_threshold)
+            .order_by(Product.available_stocks, Product.id)
+            .all()
+        )
+
+    def get_products(
+        self, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+    ) -> List[Product]:
+        """Get list of products in id order, paged by offset or after an id"""
+        query = self.db.query(Product)
+        if after_id is not None:
+            query = query.filter(Product.id > after_id)
+        return query.order_by(Product.id).offset(skip).limit(limit).all()
+
+    @retry_on_conflict
     def update_product(self, id: int, product_update: ProductUpdate) -> Product:
         """Update a product"""
+        begin_write(self.db)
         db_product = self.get_product(id)
-        print(db_product)
+        logger.debug("Updating product %s", db_product.product_id)
+        previous_stock = db_product.available_stocks
+        previous_threshold = db_product.reorder_threshold
         try:
             update_data = product_update.dict(exclude_unset=True)
             for field, value in update_data.items():
@@ -54,9 +342,22 @@ class ProductService:
                     if field in ['unit_price', 'tax_percentage']:
                         value = float(value)
                     setattr(db_product, field, value)
+            self.ledger.record(
+                [movement(db_product.id, ADJUSTMENT, db_product.available_stocks - previous_stock)]
+            )
 
+            version = bump_catalog_version(self.db)
             self.db.commit()
+            catalog_changed(version)
             self.db.refresh(db_product)
+            publish_stock_change(
+                db_product.id,
+                db_product.product_id,
+                previous_stock,
+                db_product.available_stocks,
+                db_product.reorder_threshold,
+                previous_threshold,
+            )
             return db_product
 
         except Exception as e:
@@ -66,28 +367,209 @@ class ProductService:
     def delete_product(self, id: int) -> None:
         """Delete a product"""
         db_product = self.get_product(id)
+        deleted = {"id": db_product.id, "product_id": db_product.product_id}
 
         try:
+            # Its stock history goes with it
+            for model in (StockSnapshot, StockMovement):
+                self.db.execute(delete(model).where(model.product_id == db_product.id))
             self.db.delete(db_product)
+            version = bump_catalog_version(self.db)
             self.db.commit()
+            catalog_changed(version)
+            event_bus.publish("product_deleted", **deleted)
         except Exception as e:
             self.db.rollback()
             raise DatabaseError(f"Failed to delete product: {str(e)}")
 
+    @retry_on_conflict
     def update_stock(self, id: int, quantity: int) -> Product:
         """Update product stock"""
+        begin_write(self.db)
         db_product = self.get_product(id)
+        previous_stock = db_product.available_stocks
 
         try:
             db_product.available_stocks = quantity
+            self.ledger.record([movement(id, ADJUSTMENT, quantity - previous_stock)])
             self.db.commit()
             self.db.refresh(db_product)
+            publish_stock_change(
+                db_product.id,
+                db_product.product_id,
+                previous_stock,
+                quantity,
+                db_product.reorder_threshold,
+            )
             return db_product
 
         except Exception as e:
             self.db.rollback()
             raise DatabaseError(f"Failed to update stock: {str(e)}")
 
+    @retry_on_conflict
+    def record_stock_movement(self, id: int, stock_movement: StockMovementCreate) -> Product:
+        """Receive, return or adjust stock by a signed quantity"""
+        quantity = stock_movement.quantity
+        try:
+            # Relative and guarded, so nothing is read first
+            row = self.db.execute(
+                update(Product)
+                .where(Product.id == id, Product.available_stocks + quantity >= 0)
+                .values(
+                    available_stocks=Product.available_stocks + quantity,
+                    version=Product.version + 1,
+                    updated_at=func.now(),
+                )
+                .returning(Product.product_id, Product.available_stocks, Product.reorder_threshold)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if row is not None:
+                self.ledger.record(
+                    [movement(id, stock_movement.kind, quantity, note=stock_movement.note)]
+                )
+                self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            raise DatabaseError(f"Failed to record stock movement: {str(e)}")
+
+        if row is None:
+            self.db.rollback()
+            stock = self.get_product(id).available_stocks
+            raise ValidationError(f"Stock cannot go negative (current {stock})")
+        publish_stock_change(
+            id,
+            row.product_id,
+            row.available_stocks - quantity,
+            row.available_stocks,
+            row.reorder_threshold,
+        )
+        return self.get_product(id)
+
+    def get_stock_movements(
+        self, id: int, limit: int = 100, before_id: Optional[int] = None
+    ) -> List[StockMovement]:
+        """A product's stock movements, newest first"""
+        self.get_product(id)
+        return self.ledger.get_movements(id, limit=limit, before_id=before_id)
+
+    def get_stock_at(self, id: int, at: Optional[datetime] = None) -> Dict[str, Any]:
+        """Stock on hand per the ledger, now or at a point in time"""
+        self.get_product(id)
+        return {"id": id, "available_stocks": self.ledger.stock_at(id, at), "at": at}
+
+    def bulk_update_stock(self, adjustments: List[StockAdjustment]) -> Dict[str, List]:
+        """Apply many stock adjustments with one set-based UPDATE per chunk"""
+        begin_write(self.db)
+        product_ids = [a.product_id for a in adjustments]
+        if len(set(product_ids)) != len(product_ids):
+            raise ValidationError("Each product may appear only once per bulk update")
+
+        updated, rejected, changes = [], [], []
+        try:
+            for start in range(0, len(adjustments), settings.STOCK_BULK_CHUNK_SIZE):
+                chunk = adjustments[start:start + settings.STOCK_BULK_CHUNK_SIZE]
+                current = self._lock_stock_chunk(chunk)
+                rows = self._apply_stock_chunk(chunk)
+                by_product_id = {row.product_id: row for row in rows}
+
+                movements = []
+                for adjustment in chunk:
+                    row = by_product_id.get(adjustment.product_id)
+                    if row is None:
+                        continue
+                    updated.append(
+                        {
+                            "id": row.id,
+                            "product_id": row.product_id,
+                            "available_stocks": row.available_stocks,
+                        }
+                    )
+                    previous = current[row.product_id]
+                    changes.append(
+                        (row.id, row.product_id, previous, row.available_stocks, row.reorder_threshold)
+                    )
+                    movements.append(movement(row.id, ADJUSTMENT, row.available_stocks - previous))
+                self.ledger.record(movements)
+
+                missed = [a for a in chunk if a.product_id not in by_product_id]
+                if missed:
+                    rejected.extend(self._explain_stock_rejections(missed, current))
+
+            self.db.commit()
+
+        except Exception as e:
+            self.db.rollback()
+            raise DatabaseError(f"Failed to update stock: {str(e)}")
+
+        # One notification for the whole batch rather than one per row
+        publish_stock_levels(changes)
+        return {"updated": updated, "rejected": rejected}
+
+    def _lock_stock_chunk(self, chunk: List[StockAdjustment]) -> Dict[str, int]:
+        """Lock the chunk's rows and read their stock, so each movement is the
+        exact change even for absolute updates"""
+        return dict(
+            self.db.execute(
+                select(Product.product_id, Product.available_stocks)
+                .where(Product.product_id.in_([a.product_id for a in chunk]))
+                .order_by(Product.id)
+                .with_for_update()
+            ).all()
+        )
+
+    def _apply_stock_chunk(self, chunk: List[StockAdjustment]) -> List[Any]:
+        """Run UPDATE ... FROM (VALUES ...) for one chunk, returning the new levels.
+
+        Rows whose expected_stock no longer matches, or whose stock would go
+        negative, are left untouched and simply absent from the result.
+        """
+        values, params = [], {}
+        for i, adjustment in enumerate(chunk):
+            values.append(
+                f"(CAST(:p{i} AS VARCHAR(50)), CAST(:d{i} AS INTEGER), "
+                f"CAST(:a{i} AS INTEGER), CAST(:e{i} AS INTEGER))"
+            )
+            params[f"p{i}"] = adjustment.product_id
+            params[f"d{i}"] = adjustment.delta
+            params[f"a{i}"] = adjustment.absolute
+            params[f"e{i}"] = adjustment.expected_stock
+
+        new_stock = (
+            "CASE WHEN v.absolute IS NOT NULL THEN v.absolute "
+            "ELSE products.available_stocks + v.delta END"
+        )
+        # VALUES columns are named column1..N on both Postgres and SQLite
+        statement = text(
+            f"UPDATE products SET available_stocks = {new_stock}, updated_at = CURRENT_TIMESTAMP, "
+            "version = products.version + 1 "
+            "FROM (SELECT column1 AS product_id, column2 AS delta, "
+            "column3 AS absolute, column4 AS expected "
+            f"FROM (VALUES {', '.join(values)}) AS adjustments) AS v "
+            "WHERE products.product_id = v.product_id "
+            "AND (v.expected IS NULL OR products.available_stocks = v.expected) "
+            f"AND {new_stock} >= 0 "
+            "RETURNING products.id, products.product_id, products.available_stocks, "
+            "products.reorder_threshold"
+        )
+        return self.db.execute(statement, params).all()
+
+    def _explain_stock_rejections(
+        self, missed: List[StockAdjustment], current: Dict[str, int]
+    ) -> List[Dict[str, str]]:
+        # The chunk's rows are locked, so the levels read before the UPDATE hold
+        rejections = []
+        for adjustment in missed:
+            stock = current.get(adjustment.product_id)
+            if stock is None:
+                reason = "Product not found"
+            elif adjustment.expected_stock is not None and stock != adjustment.expected_stock:
+                reason = f"Stock changed: expected {adjustment.expected_stock}, found {stock}"
+            else:
+                reason = f"Stock cannot go negative (current {stock})"
+            rejections.append({"product_id": adjustment.product_id, "reason": reason})
+        return rejections
+
     def check_stock_availability(self, id: int, quantity: int) -> bool:
         """Check if product has sufficient stock"""
         product = self.get_product(id)
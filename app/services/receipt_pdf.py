@@ -0,0 +1,240 @@
+"""Receipt PDFs written with the standard library only.
+
+This module runs inside the receipt worker processes, so it imports nothing
+from the app. Text uses the PDF base-14 Helvetica fonts, which every viewer
+has, so no font files are embedded; their WinAnsi encoding has no rupee
+sign, so amounts are shown as "Rs.". Output is byte-for-byte deterministic
+for the same receipt.
+"""
+import os
+import zlib
+from typing import Any, Dict, List, Tuple
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 48
+
+# Helvetica advance widths (1/1000 em) for ASCII 32..126, from its AFM
+_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+Color = Tuple[float, float, float]
+BLUE: Color = (0.0, 0.48, 1.0)
+DARK: Color = (0.2, 0.2, 0.2)
+GREY: Color = (0.4, 0.4, 0.4)
+LIGHT: Color = (0.97, 0.976, 0.98)
+WHITE: Color = (1.0, 1.0, 1.0)
+
+
+def text_width(value: str, size: float) -> float:
+    return sum(_WIDTHS[ord(c) - 32] if 32 <= ord(c) <= 126 else 556 for c in value) * size / 1000
+
+
+def _fit(value: str, size: float, width: float) -> str:
+    if text_width(value, size) <= width:
+        return value
+    while value and text_width(value + "...", size) > width:
+        value = value[:-1]
+    return value + "..."
+
+
+def _literal(value: str) -> bytes:
+    encoded = value.encode("cp1252", errors="replace")
+    return b"(" + encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class PdfCanvas:
+    """Pages of text, lines and filled boxes; y grows up from the bottom"""
+
+    def __init__(self):
+        self.pages: List[List[bytes]] = []
+        self.new_page()
+
+    def new_page(self) -> None:
+        self.pages.append([])
+
+    def _draw(self, operators: bytes) -> None:
+        self.pages[-1].append(operators)
+
+    def text(
+        self,
+        x: float,
+        y: float,
+        value: str,
+        size: float = 10,
+        bold: bool = False,
+        color: Color = DARK,
+        align: str = "left",
+    ) -> None:
+        if align == "right":
+            x -= text_width(value, size)
+        elif align == "center":
+            x -= text_width(value, size) / 2
+        font = b"/F2" if bold else b"/F1"
+        self._draw(
+            b"BT %s %.2f Tf %.3f %.3f %.3f rg %.2f %.2f Td %s Tj ET"
+            % (font, size, *color, x, y, _literal(value))
+        )
+
+    def box(self, x: float, y: float, width: float, height: float, color: Color) -> None:
+        self._draw(b"%.3f %.3f %.3f rg %.2f %.2f %.2f %.2f re f" % (*color, x, y, width, height))
+
+    def line(self, x1: float, y1: float, x2: float, y2: float, color: Color = LIGHT) -> None:
+        self._draw(b"%.3f %.3f %.3f RG 1 w %.2f %.2f m %.2f %.2f l S" % (*color, x1, y1, x2, y2))
+
+    def to_bytes(self) -> bytes:
+        fonts = [
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold "
+            b"/Encoding /WinAnsiEncoding >>",
+        ]
+        # 1 catalog, 2 page tree, 3-4 fonts, then a page and its content per page
+        kids = b" ".join(b"%d 0 R" % (5 + 2 * i) for i in range(len(self.pages)))
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages)),
+            *fonts,
+        ]
+        for i, operators in enumerate(self.pages):
+            content = zlib.compress(b"\n".join(operators))
+            objects.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                % (PAGE_WIDTH, PAGE_HEIGHT, 6 + 2 * i)
+            )
+            objects.append(
+                b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream"
+                % (len(content), content)
+            )
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1,
+            xref,
+        )
+        return bytes(out)
+
+
+# Items table: (heading, left edge, right-aligned)
+_COLUMNS = [
+    ("Product", MARGIN + 8, False),
+    ("Quantity", 330, True),
+    ("Unit Price", 410, True),
+    ("Tax %", 470, True),
+    ("Total", PAGE_WIDTH - MARGIN - 8, True),
+]
+_ROW_HEIGHT = 20
+
+
+def render_receipt(receipt: Dict[str, Any]) -> bytes:
+    """Lay out a receipt built by ``app.services.receipts.receipt_data``.
+
+    Mirrors bill_email.html: header, bill information, items and payment
+    summary. Long bills continue on further pages under a repeated heading.
+    """
+    canvas = PdfCanvas()
+    right = PAGE_WIDTH - MARGIN
+
+    canvas.box(0, PAGE_HEIGHT - 110, PAGE_WIDTH, 110, BLUE)
+    canvas.text(PAGE_WIDTH / 2, PAGE_HEIGHT - 60, "Bill Details", 24, True, WHITE, "center")
+    canvas.text(
+        PAGE_WIDTH / 2, PAGE_HEIGHT - 84, "Thank you for your purchase!", 12,
+        color=WHITE, align="center",
+    )
+
+    y = PAGE_HEIGHT - 150
+    canvas.text(MARGIN, y, "Bill Information", 13, True)
+    y -= 24
+    for label, value, x in (
+        ("Bill ID", f"#{receipt['id']}", MARGIN),
+        ("Customer Email", receipt["customer_email"] or "", MARGIN + 120),
+        ("Date", receipt["created_at"], MARGIN + 340),
+    ):
+        canvas.text(x, y, label, 9, color=GREY)
+        canvas.text(x, y - 14, _fit(value, 10, 210), 10, True)
+    y -= 50
+
+    canvas.text(MARGIN, y, "Items Purchased", 13, True)
+    y -= 14
+
+    def heading(y: float) -> float:
+        canvas.box(MARGIN, y - _ROW_HEIGHT, right - MARGIN, _ROW_HEIGHT, LIGHT)
+        for title, x, align_right in _COLUMNS:
+            canvas.text(x, y - 14, title, 10, True, align="right" if align_right else "left")
+        return y - _ROW_HEIGHT
+
+    y = heading(y)
+    for item in receipt["items"]:
+        if y - _ROW_HEIGHT < MARGIN:
+            canvas.new_page()
+            y = heading(PAGE_HEIGHT - MARGIN)
+        cells = [
+            _fit(item["name"], 10, 330 - 70 - (MARGIN + 8)),
+            str(item["quantity"]),
+            f"Rs. {item['unit_price']}",
+            f"{item['tax_percentage']}%",
+            f"Rs. {item['total_amount']}",
+        ]
+        for value, (_, x, align_right) in zip(cells, _COLUMNS):
+            canvas.text(x, y - 14, value, 10, align="right" if align_right else "left")
+        y -= _ROW_HEIGHT
+        canvas.line(MARGIN, y, right, y)
+
+    summary = [
+        ("Subtotal", receipt["subtotal"], False),
+        ("Tax Amount", receipt["tax_amount"], False),
+        ("Total Amount", receipt["total_amount"], True),
+        ("Paid Amount", receipt["paid_amount"], False),
+        ("Balance Amount", receipt["balance_amount"], False),
+    ]
+    footer_height = 60
+    if y - 40 - _ROW_HEIGHT * len(summary) - footer_height < MARGIN:
+        canvas.new_page()
+        y = PAGE_HEIGHT - MARGIN
+    y -= 30
+    canvas.text(MARGIN, y, "Payment Summary", 13, True)
+    y -= 8
+    for label, value, final in summary:
+        if final:
+            canvas.box(MARGIN, y - _ROW_HEIGHT, right - MARGIN, _ROW_HEIGHT, BLUE)
+        color = WHITE if final else DARK
+        canvas.text(MARGIN + 8, y - 14, label, 10, True, color)
+        canvas.text(
+            right - 8, y - 14, f"Rs. {value}", 11, True, WHITE if final else BLUE, "right"
+        )
+        y -= _ROW_HEIGHT
+
+    y -= 30
+    canvas.line(MARGIN, y, right, y)
+    for offset, line in (
+        (18, "This is an automated receipt."),
+        (32, "Billing System - Professional Invoice Management"),
+    ):
+        canvas.text(PAGE_WIDTH / 2, y - offset, line, 9, color=GREY, align="center")
+    canvas.text(
+        PAGE_WIDTH / 2, y - 46, f"Generated on {receipt['created_at']}", 9,
+        color=GREY, align="center",
+    )
+    return canvas.to_bytes()
+
+
+def write_receipt(path: str, receipt: Dict[str, Any]) -> int:
+    """Render into ``path`` atomically; runs in a worker process"""
+    document = render_receipt(receipt)
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(document)
+    os.replace(partial, path)
+    return len(document)
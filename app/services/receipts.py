@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+
+from app.core.config import settings
+from app.core.exceptions import ReceiptQueueFullError
+from app.services.receipt_pdf import write_receipt
+
+logger = logging.getLogger(__name__)
+
+
+def receipt_data(document: Mapping[str, Any], names: Mapping[int, str]) -> Dict[str, Any]:
+    """What bill_email.html shows, as plain values a worker process can take.
+
+    ``document`` is a serialised bill (see app.schemas.serializers) and
+    ``names`` maps product ids to names.
+    """
+    created_at = document["created_at"]
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    items = []
+    for item in document["items"]:
+        product_id = int(item["product_id"]) if item["product_id"] is not None else None
+        items.append(
+            {
+                "name": names.get(product_id) or f"Product ID: {product_id}",
+                "quantity": item["quantity"],
+                "unit_price": f"{float(item['unit_price']):.2f}",
+                "tax_percentage": f"{float(item['tax_percentage']):.2f}",
+                "total_amount": f"{float(item['total_amount']):.2f}",
+            }
+        )
+    total_amount = float(document["total_amount"])
+    tax_amount = float(document["tax_amount"])
+    return {
+        "id": document["id"],
+        "customer_email": document["customer_email"],
+        "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "items": items,
+        "subtotal": f"{total_amount - tax_amount:.2f}",
+        "tax_amount": f"{tax_amount:.2f}",
+        "total_amount": f"{total_amount:.2f}",
+        "paid_amount": f"{float(document['paid_amount']):.2f}",
+        "balance_amount": f"{float(document['balance_amount']):.2f}",
+    }
+
+
+class ReceiptRenderer:
+    """Renders receipt PDFs in a process pool and keeps them on disk.
+
+    Bills are immutable, so a receipt is rendered once and then served from
+    its file by every worker sharing the directory. Concurrent requests for
+    the same bill wait on one render. At most ``max_pending`` renders are
+    queued or running; past that ``render`` raises ReceiptQueueFullError
+    rather than letting the backlog grow.
+
+    With ``max_files`` set, the oldest receipts are deleted once the
+    directory holds more than that; an evicted receipt is rendered again on
+    its next request. The directory is rescanned after every tenth of
+    ``max_files`` renders, so it can run over by that much per worker.
+    """
+
+    def __init__(
+        self, cache_dir: Path, workers: int, max_pending: int, max_files: Optional[int] = None
+    ):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_files = max_files
+        self.renders = 0
+        self.rejected = 0
+        self.evicted = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._renders_since_evict = 0
+
+    def path(self, bill_id: int) -> Path:
+        return self.cache_dir / f"receipt-{bill_id}.pdf"
+
+    def cached(self, bill_id: int) -> Optional[Path]:
+        path = self.path(bill_id)
+        return path if path.exists() else None
+
+    async def render(self, bill_id: int, receipt: Dict[str, Any]) -> Path:
+        """Path of the bill's receipt, rendering it first if needed"""
+        path = self.path(bill_id)
+        with self._lock:
+            future = self._pending.get(bill_id)
+            if future is None:
+                if path.exists():
+                    return path  # Finished since the caller looked
+                if len(self._pending) >= self.max_pending:
+                    self.rejected += 1
+                    raise ReceiptQueueFullError(self.max_pending)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                future = self._executor().submit(write_receipt, str(path), receipt)
+                self._pending[bill_id] = future
+                self.renders += 1
+                submitted = True
+            else:
+                submitted = False
+        if submitted:
+            # Outside the lock: a render that is already done runs the
+            # callback right here, and _finished takes the lock itself
+            future.add_done_callback(lambda _: self._finished(bill_id))
+        await asyncio.wrap_future(future)
+        return path
+
+    def _finished(self, bill_id: int) -> None:
+        with self._lock:
+            self._pending.pop(bill_id, None)
+            if self.max_files is None:
+                return
+            self._renders_since_evict += 1
+            if self._renders_since_evict < max(1, self.max_files // 10):
+                return
+            self._renders_since_evict = 0
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete the oldest receipts past ``max_files``; returns how many"""
+        if self.max_files is None:
+            return 0
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.startswith("receipt-") and entry.name.endswith(".pdf"):
+                        try:
+                            entries.append((entry.stat().st_mtime, entry.path))
+                        except FileNotFoundError:
+                            pass  # Evicted by another worker sharing the directory
+        except FileNotFoundError:
+            return 0
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return 0
+        entries.sort()
+        for _, path in entries[:excess]:
+            Path(path).unlink(missing_ok=True)
+        with self._lock:
+            self.evicted += excess
+        logger.info("receipts evicted", extra={"evicted": excess})
+        return excess
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking a server that runs threads can copy held locks; spawned
+            # workers only import the stdlib-only PDF module
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+receipt_renderer = ReceiptRenderer(
+    cache_dir=Path(settings.RECEIPT_CACHE_DIR or Path(tempfile.gettempdir()) / "billing-receipts"),
+    workers=settings.RECEIPT_WORKERS,
+    max_pending=settings.RECEIPT_QUEUE_SIZE,
+    max_files=settings.RECEIPT_CACHE_MAX_FILES,
+)
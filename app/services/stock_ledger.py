@@ -0,0 +1,277 @@
+"""Append-only stock ledger.
+
+Every change to a product's stock is also written as a movement (sale,
+receipt, adjustment or return) in the same transaction, so shrinkage can be
+audited and stock can be read as of any point in time: the latest snapshot
+at or before it plus the movements after that snapshot. ``compact`` rolls
+settled movements into new snapshots so that sum stays short, and can prune
+compacted movements past a retention period; history older than that keeps
+the granularity of its snapshots.
+
+Before a product's first snapshot, or when it has none yet, stock is
+counted back from that snapshot or from ``available_stocks`` over the
+movements since, so products whose stock predates the ledger (or was set
+outside it) read correctly. Once anything has been pruned, a point in time
+before a product's first snapshot and before the pruning horizon can no
+longer be answered and is refused.
+
+``Product.available_stocks`` remains the figure checkout guards on. A sale
+has to see the current level to refuse overselling, and reading it from the
+ledger would need the same per-product serialisation the row gives today.
+``compact`` reports any product whose ledger disagrees with it.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.exceptions import ValidationError
+from app.db.session import begin_write
+from app.models.models import Product, StockLedgerState, StockMovement, StockSnapshot
+
+logger = logging.getLogger(__name__)
+
+SALE = "sale"
+RECEIPT = "receipt"
+ADJUSTMENT = "adjustment"
+RETURN = "return"
+
+
+def movement(
+    product_id: int,
+    kind: str,
+    quantity: int,
+    bill_id: Optional[int] = None,
+    note: Optional[str] = None,
+) -> Dict[str, Any]:
+    """A row for ``StockLedgerService.record``; quantity is the signed change"""
+    return {
+        "product_id": product_id,
+        "kind": kind,
+        "quantity": quantity,
+        "bill_id": bill_id,
+        "note": note,
+    }
+
+
+def _utc(at: datetime) -> datetime:
+    # SQLite stores timestamps without an offset, always as UTC
+    if at.tzinfo is None:
+        return at.replace(tzinfo=timezone.utc)
+    return at.astimezone(timezone.utc)
+
+
+class StockLedgerService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record(self, movements: Iterable[Dict[str, Any]]) -> None:
+        """Append movements with one executemany; the caller commits"""
+        rows = [row for row in movements if row["quantity"]]
+        if rows:
+            self.db.execute(insert(StockMovement), rows)
+
+    def get_movements(
+        self, product_id: int, limit: int = 100, before_id: Optional[int] = None
+    ) -> List[StockMovement]:
+        """A product's movements, newest first, paged by id"""
+        query = self.db.query(StockMovement).filter(StockMovement.product_id == product_id)
+        if before_id is not None:
+            query = query.filter(StockMovement.id < before_id)
+        return query.order_by(StockMovement.id.desc()).limit(limit).all()
+
+    def stock_at(self, product_id: int, at: Optional[datetime] = None) -> int:
+        """Stock on hand per the ledger, now or as of ``at``"""
+        snapshots = select(StockSnapshot.quantity, StockSnapshot.last_movement_id).where(
+            StockSnapshot.product_id == product_id
+        )
+        movements = select(func.coalesce(func.sum(StockMovement.quantity), 0)).where(
+            StockMovement.product_id == product_id
+        )
+        if at is not None:
+            at = _utc(at)
+        base = self.db.execute(
+            (snapshots if at is None else snapshots.where(StockSnapshot.as_of <= at))
+            .order_by(StockSnapshot.last_movement_id.desc())
+            .limit(1)
+        ).first()
+        if base is not None:
+            quantity, last_movement_id = base
+            if at is not None:
+                movements = movements.where(StockMovement.created_at <= at)
+            return quantity + self.db.execute(
+                movements.where(StockMovement.id > last_movement_id)
+            ).scalar()
+
+        # Before the product's first snapshot, or it has none yet: count back
+        # from the first snapshot, or from the stock row, over the movements
+        # after ``at``. That holds for stock that predates the ledger too.
+        if at is None:
+            return self.db.execute(
+                select(Product.available_stocks).where(Product.id == product_id)
+            ).scalar()
+        movements = movements.where(StockMovement.created_at > at)
+        first = self.db.execute(
+            snapshots.order_by(StockSnapshot.last_movement_id).limit(1)
+        ).first()
+        if first is None:
+            # Nothing of this product has been compacted, so nothing pruned;
+            # read the row and the movements in one statement
+            return self.db.execute(
+                select(Product.available_stocks - movements.scalar_subquery()).where(
+                    Product.id == product_id
+                )
+            ).scalar()
+        pruned_before = self.db.execute(select(StockLedgerState.pruned_before)).scalar()
+        if pruned_before is not None and at < _utc(pruned_before):
+            raise ValidationError(
+                f"Stock history for product {product_id} is only kept from "
+                f"{_utc(pruned_before).isoformat()}"
+            )
+        quantity, last_movement_id = first
+        return quantity - self.db.execute(
+            movements.where(StockMovement.id <= last_movement_id)
+        ).scalar()
+
+    def compact(
+        self,
+        settle_seconds: Optional[int] = None,
+        retention_days: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Roll settled movements into new snapshots and commit.
+
+        A product's first snapshot is taken from ``available_stocks``, which
+        also covers stock that predates the ledger.
+        """
+        begin_write(self.db)
+        if settle_seconds is None:
+            settle_seconds = settings.STOCK_COMPACTION_SETTLE_SECONDS
+        if retention_days is None:
+            retention_days = settings.STOCK_MOVEMENT_RETENTION_DAYS
+        now = datetime.now(timezone.utc)
+        as_of = now - timedelta(seconds=settle_seconds)
+
+        # Movements up to this id are taken as committed; anything still in
+        # flight after the settle time is picked up by the next run
+        horizon = self.db.execute(
+            select(func.max(StockMovement.id)).where(StockMovement.created_at < as_of)
+        ).scalar() or 0
+
+        latest = (
+            select(
+                StockSnapshot.product_id,
+                func.max(StockSnapshot.last_movement_id).label("last_movement_id"),
+            )
+            .group_by(StockSnapshot.product_id)
+            .subquery()
+        )
+        previous = {
+            product_id: (quantity, last_movement_id)
+            for product_id, quantity, last_movement_id in self.db.execute(
+                select(
+                    StockSnapshot.product_id,
+                    StockSnapshot.quantity,
+                    StockSnapshot.last_movement_id,
+                ).join(
+                    latest,
+                    (latest.c.product_id == StockSnapshot.product_id)
+                    & (latest.c.last_movement_id == StockSnapshot.last_movement_id),
+                )
+            )
+        }
+        settled = dict(
+            self.db.execute(
+                select(StockMovement.product_id, func.sum(StockMovement.quantity))
+                .outerjoin(latest, latest.c.product_id == StockMovement.product_id)
+                .where(
+                    StockMovement.id > func.coalesce(latest.c.last_movement_id, 0),
+                    StockMovement.id <= horizon,
+                )
+                .group_by(StockMovement.product_id)
+            ).all()
+        )
+        # Stock and the movements past the horizon in one statement, so both
+        # come from the same snapshot of the database
+        unsettled = (
+            select(
+                StockMovement.product_id,
+                func.sum(StockMovement.quantity).label("quantity"),
+            )
+            .where(StockMovement.id > horizon)
+            .group_by(StockMovement.product_id)
+            .subquery()
+        )
+        current = self.db.execute(
+            select(
+                Product.id,
+                Product.product_id,
+                Product.available_stocks,
+                func.coalesce(unsettled.c.quantity, 0),
+            ).outerjoin(unsettled, unsettled.c.product_id == Product.id)
+        ).all()
+
+        snapshots, drift, opened = [], [], 0
+        for id, product_id, available_stocks, pending in current:
+            if id not in previous:
+                quantity = available_stocks - pending
+                opened += 1
+            else:
+                quantity = previous[id][0] + settled.get(id, 0)
+                if quantity + pending != available_stocks:
+                    drift.append(
+                        {
+                            "id": id,
+                            "product_id": product_id,
+                            "ledger": quantity + pending,
+                            "available_stocks": available_stocks,
+                        }
+                    )
+                if id not in settled:
+                    continue
+            snapshots.append(
+                {
+                    "product_id": id,
+                    "quantity": quantity,
+                    "last_movement_id": horizon,
+                    "as_of": as_of,
+                }
+            )
+        if snapshots:
+            self.db.execute(insert(StockSnapshot), snapshots)
+
+        pruned = 0
+        if retention_days is not None:
+            # Every movement up to the horizon is now inside a snapshot
+            pruned = self.db.execute(
+                delete(StockMovement).where(
+                    StockMovement.id <= horizon,
+                    StockMovement.created_at < now - timedelta(days=retention_days),
+                )
+            ).rowcount
+        if pruned:
+            self._mark_pruned(now - timedelta(days=retention_days))
+        self.db.commit()
+
+        for row in drift:
+            logger.warning("stock ledger drift", extra=row)
+        logger.info(
+            "stock ledger compacted",
+            extra={"snapshots": len(snapshots), "opened": opened, "pruned": pruned},
+        )
+        return {
+            "snapshots": len(snapshots),
+            "opened": opened,
+            "pruned": pruned,
+            "drift": drift,
+        }
+
+    def _mark_pruned(self, before: datetime) -> None:
+        # Only ever moves forward; a run with a longer retention prunes nothing new
+        state = self.db.get(StockLedgerState, 1)
+        if state is None:
+            self.db.add(StockLedgerState(id=1, pruned_before=before))
+        elif _utc(state.pruned_before) < before:
+            state.pruned_before = before
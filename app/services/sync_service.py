@@ -0,0 +1,196 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+
+from fastapi.background import BackgroundTasks
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.events import event_bus, publish_stock_levels
+from app.core.invalidation import invalidation_channel
+from app.core.retry import retry_on_conflict
+from app.db.session import begin_write
+from app.models.models import (Bill, BillDenomination, BillItem,
+                               Denomination, Product, StockConflict)
+from app.schemas.schemas import SyncBatch
+from app.services.customer_cache import customer_cache
+from app.services.email_service import EmailService
+from app.services.popularity import popularity_index
+from app.services.stock_ledger import SALE, StockLedgerService, movement
+
+logger = logging.getLogger(__name__)
+
+
+class SyncService:
+    """Applies bills pushed by offline tills on the central server"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.email_service = EmailService()
+
+    @retry_on_conflict
+    async def apply_batch(
+        self, batch: SyncBatch, background_tasks: BackgroundTasks
+    ) -> Dict[str, Any]:
+        """Record a batch of already-paid bills in one transaction.
+
+        Bills are idempotent on ``sync_id``. The goods have already left the
+        store, so a sale is never refused for stock: stock is taken down to
+        zero and any shortfall is recorded as a StockConflict for follow-up.
+        The till's own drawer paid the change, so central drawer counts are
+        not touched.
+        """
+        begin_write(self.db)
+        result: Dict[str, Any] = {
+            "accepted": [],
+            "duplicates": [],
+            "conflicts": [],
+            "rejected": [],
+        }
+        sync_ids = [bill.sync_id for bill in batch.bills]
+        seen: Set[str] = set(
+            sync_id
+            for (sync_id,) in self.db.query(Bill.sync_id).filter(Bill.sync_id.in_(sync_ids))
+        )
+        skus = {item.product_id for bill in batch.bills for item in bill.items}
+        products = {
+            product.product_id: product
+            for product in self.db.query(Product)
+            .filter(Product.product_id.in_(skus))
+            .order_by(Product.id)
+            .with_for_update()
+        }
+        denomination_ids = dict(self.db.query(Denomination.value, Denomination.id))
+
+        stock_changes: Dict[int, Tuple[Product, int]] = {}
+        created: List[Tuple[Bill, str]] = []
+        sold: List[Tuple[int, List[Tuple[int, int]], datetime]] = []
+        sales: List[Dict[str, Any]] = []
+        for pushed in batch.bills:
+            if pushed.sync_id in seen:
+                result["duplicates"].append(pushed.sync_id)
+                continue
+            seen.add(pushed.sync_id)
+            missing = [i.product_id for i in pushed.items if i.product_id not in products]
+            if missing:
+                reason = f"Unknown products: {', '.join(missing)}"
+                result["rejected"].append({"sync_id": pushed.sync_id, "reason": reason})
+                continue
+
+            bill = Bill(
+                customer_id=customer_cache.resolve(self.db, pushed.customer_email),
+                total_amount=pushed.total_amount,
+                rounded_total_amount=pushed.rounded_total_amount,
+                tax_amount=pushed.tax_amount,
+                paid_amount=pushed.paid_amount,
+                balance_amount=pushed.balance_amount,
+                created_at=pushed.created_at,
+                register_id=batch.register_id,
+                sync_id=pushed.sync_id,
+            )
+            self.db.add(bill)
+            self.db.flush()
+
+            items = []
+            for item in pushed.items:
+                product = products[item.product_id]
+                items.append(
+                    {
+                        "bill_id": bill.id,
+                        "product_id": product.id,
+                        "quantity": item.quantity,
+                        "unit_price": item.unit_price,
+                        "tax_percentage": item.tax_percentage,
+                        "tax_amount": item.tax_amount,
+                        "total_amount": item.total_amount,
+                    }
+                )
+                stock_changes.setdefault(product.id, (product, product.available_stocks))
+                taken = min(max(product.available_stocks, 0), item.quantity)
+                product.available_stocks -= taken
+                sales.append(movement(product.id, SALE, -taken, bill_id=bill.id))
+                if taken < item.quantity:
+                    shortfall = item.quantity - taken
+                    self.db.add(
+                        StockConflict(
+                            bill_id=bill.id,
+                            product_id=product.id,
+                            register_id=batch.register_id,
+                            requested=item.quantity,
+                            shortfall=shortfall,
+                        )
+                    )
+                    result["conflicts"].append(
+                        {
+                            "sync_id": pushed.sync_id,
+                            "product_id": item.product_id,
+                            "requested": item.quantity,
+                            "shortfall": shortfall,
+                        }
+                    )
+            self.db.execute(insert(BillItem), items)
+            sold.append(
+                (bill.id, [(item["product_id"], item["quantity"]) for item in items], pushed.created_at)
+            )
+
+            change = [
+                {
+                    "bill_id": bill.id,
+                    "denomination_id": denomination_ids[d.value],
+                    "count": d.count,
+                }
+                for d in pushed.change_denominations
+                if d.value in denomination_ids and d.count > 0
+            ]
+            if change:
+                self.db.execute(insert(BillDenomination), change)
+
+            result["accepted"].append(pushed.sync_id)
+            created.append((bill, pushed.customer_email))
+
+        StockLedgerService(self.db).record(sales)
+
+        # Capture event data before commit expires the loaded rows
+        stock_deltas = [
+            (
+                product.id,
+                product.product_id,
+                previous,
+                product.available_stocks,
+                product.reorder_threshold,
+            )
+            for product, previous in stock_changes.values()
+        ]
+        bill_events = [
+            {
+                "id": bill.id,
+                "customer_id": bill.customer_id,
+                "rounded_total_amount": float(bill.rounded_total_amount),
+            }
+            for bill, _ in created
+        ]
+        self.db.commit()
+
+        logger.info(
+            "sync batch applied",
+            extra={
+                "register_id": batch.register_id,
+                "accepted": len(result["accepted"]),
+                "duplicates": len(result["duplicates"]),
+                "conflicts": len(result["conflicts"]),
+                "rejected": len(result["rejected"]),
+            },
+        )
+        # The whole batch reaches the other workers as one datagram
+        with invalidation_channel.batch():
+            for data in bill_events:
+                event_bus.publish("bill_created", **data)
+            # Offline sales count toward the hour they were rung up in
+            for bill_id, lines, created_at in sold:
+                popularity_index.record_bill(bill_id, lines, created_at)
+            publish_stock_levels(stock_deltas)
+
+            # Receipts for offline sales go out once the bill reaches the server
+            for bill, email in created:
+                await self.email_service.send_bill_email(background_tasks, email, bill)
+        return result
@@ -0,0 +1,134 @@
+"""Benchmark bill serialization for the purchase history endpoint.
+
+Compares the Pydantic ``Bill`` schema path with the fast serializer, both
+from ORM objects and from raw row tuples, over an in-memory SQLite database.
+
+    python scripts/bench_bill_serialization.py --bills 1000 --items 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from app.models.models import Base, Bill, BillItem, Customer, Product
+from app.schemas.schemas import CustomerPurchaseHistory
+from app.schemas.serializers import dumps, serialize_bill
+from app.services.bill_cache import bill_cache
+from app.services.billing_service import BillingService
+
+EMAIL = "bench@example.com"
+
+
+def seed(db, bills: int, items: int) -> None:
+    rng = random.Random(42)
+    products = [
+        Product(
+            name=f"Product {i}",
+            product_id=f"BENCH{i:04d}",
+            available_stocks=1000,
+            unit_price=round(rng.uniform(1, 500), 2),
+            tax_percentage=18.0,
+        )
+        for i in range(50)
+    ]
+    customer = Customer(email=EMAIL)
+    db.add_all(products + [customer])
+    db.flush()
+
+    now = datetime.now(timezone.utc)
+    for _ in range(bills):
+        bill_items = [
+            BillItem(
+                product_id=rng.choice(products).id,
+                quantity=rng.randint(1, 5),
+                unit_price=99.99,
+                tax_percentage=18.0,
+                tax_amount=18.0,
+                total_amount=117.99,
+                created_at=now,
+            )
+            for _ in range(items)
+        ]
+        db.add(
+            Bill(
+                customer_id=customer.id,
+                total_amount=117.99 * items,
+                rounded_total_amount=float(int(117.99 * items)),
+                tax_amount=18.0 * items,
+                paid_amount=1000.0,
+                balance_amount=1000.0 - int(117.99 * items),
+                created_at=now,
+                items=bill_items,
+            )
+        )
+    db.commit()
+
+
+def measure(label: str, fn, bills: int, repeat: int) -> None:
+    best = min(_timed(fn) for _ in range(repeat))
+    print(f"{label:<32} {best * 1000:9.2f} ms total {best / bills * 1e6:9.2f} us/bill")
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bills", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        seed(db, args.bills, args.items)
+
+    with Session() as db:
+        orm_bills = (
+            db.query(Bill)
+            .options(joinedload(Bill.items), joinedload(Bill.customer))
+            .filter(Bill.customer.has(email=EMAIL))
+            .all()
+        )
+
+        def pydantic_path():
+            history = CustomerPurchaseHistory(customer_email=EMAIL, bills=orm_bills)
+            json.dumps(jsonable_encoder(history))
+
+        def fast_orm_path():
+            dumps({"customer_email": EMAIL, "bills": [serialize_bill(b) for b in orm_bills]})
+
+        def fast_rows_path():
+            # Includes the raw queries the history endpoint runs on a cold cache
+            bill_cache.clear()
+            bills = BillingService(db).get_customer_bill_documents(EMAIL)
+            b'{"bills":[' + b",".join(bills) + b"]}"
+
+        def cached_path():
+            bills = BillingService(db).get_customer_bill_documents(EMAIL)
+            b'{"bills":[' + b",".join(bills) + b"]}"
+
+        print(f"{args.bills} bills x {args.items} items")
+        measure("pydantic schema + json", pydantic_path, args.bills, args.repeat)
+        measure("fast serializer (ORM) + orjson", fast_orm_path, args.bills, args.repeat)
+        measure("fast serializer (rows+query)", fast_rows_path, args.bills, args.repeat)
+        measure("bill cache hits (ids query)", cached_path, args.bills, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Roll settled stock movements into snapshots; run it from cron.
+
+    python scripts/compact_stock_ledger.py [--settle-seconds 60] [--retention-days 365]
+
+Exits non-zero when a product's ledger disagrees with its available stock.
+"""
+import argparse
+import os
+import sys
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.session import SessionLocal
+from app.services.stock_ledger import StockLedgerService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--settle-seconds", type=int, help="Defaults to STOCK_COMPACTION_SETTLE_SECONDS")
+    parser.add_argument(
+        "--retention-days", type=int, help="Defaults to STOCK_MOVEMENT_RETENTION_DAYS"
+    )
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        result = StockLedgerService(db).compact(
+            settle_seconds=args.settle_seconds, retention_days=args.retention_days
+        )
+    print(
+        f"snapshots: {result['snapshots']}, opened: {result['opened']}, "
+        f"pruned: {result['pruned']}, drift: {len(result['drift'])}"
+    )
+    for row in result["drift"]:
+        print(
+            f"  {row['product_id']}: ledger {row['ledger']}, "
+            f"available_stocks {row['available_stocks']}"
+        )
+    sys.exit(1 if result["drift"] else 0)
+
+
+if __name__ == "__main__":
+    main()
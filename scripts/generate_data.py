@@ -0,0 +1,349 @@
+"""Generate benchmark-scale data: products, customers and bills.
+
+Rows are generated in chunks by a process pool and written by the parent
+with COPY on Postgres or executemany elsewhere. Product popularity (and,
+more gently, customer activity) follows a Zipf distribution, bills have
+1..--max-items lines and are spread over --days with ids in time order.
+The same --seed and --chunk-size always produce the same data, whatever
+the number of workers.
+
+    python scripts/generate_data.py --products 500000 --customers 5000000 \\
+        --bills 50000000 --workers 8 --database-url postgresql://...
+
+Rows are appended after the current maximum ids, so an existing database
+keeps its data. Run the app's init first (or let it create the tables).
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import accumulate
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.models.models import Base, Bill, Customer, Denomination, Product
+from app.services.pricing import add_amount, compute_change, price_line, round_total
+
+NOTES = [500, 200, 100, 50, 20, 10, 5, 2, 1]
+TAX_RATES = [0.0, 5.0, 12.0, 18.0, 28.0]
+
+PRODUCT_COLUMNS = ("id", "name", "product_id", "available_stocks", "unit_price", "tax_percentage")
+CUSTOMER_COLUMNS = ("id", "email")
+BILL_COLUMNS = (
+    "id", "customer_id", "total_amount", "rounded_total_amount", "tax_amount",
+    "paid_amount", "balance_amount", "created_at", "mail_sent",
+)
+ITEM_COLUMNS = (
+    "bill_id", "product_id", "quantity", "unit_price", "tax_percentage",
+    "tax_amount", "total_amount", "created_at",
+)
+CHANGE_COLUMNS = ("bill_id", "denomination_id", "count")
+
+# Set in each worker by _init_worker
+_plan: Dict[str, Any] = {}
+
+
+def zipf_cum_weights(n: int, skew: float) -> List[float]:
+    return list(accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+
+
+def product_prices(seed: int, count: int) -> List[Tuple[float, float]]:
+    """(unit_price, tax_percentage) per product; regenerated identically anywhere"""
+    rng = random.Random(f"{seed}:prices")
+    # Mostly cheap goods with a long tail of expensive ones
+    return [
+        (round(min(rng.lognormvariate(4, 1.2), 99_999), 2), rng.choice(TAX_RATES))
+        for _ in range(count)
+    ]
+
+
+def _init_worker(plan: Dict[str, Any]) -> None:
+    _plan.update(plan)
+    _plan["prices"] = product_prices(plan["seed"], plan["products"])
+    _plan["product_weights"] = zipf_cum_weights(plan["products"], plan["skew"])
+    _plan["customer_weights"] = zipf_cum_weights(plan["customers"], plan["customer_skew"])
+
+
+def _rng(table: str, start: int) -> random.Random:
+    return random.Random(f"{_plan['seed']}:{table}:{start}")
+
+
+def _encode(rows: List[Sequence[Any]]) -> Any:
+    """CSV text for COPY, or the rows themselves for executemany"""
+    if not _plan["copy"]:
+        return rows
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def generate_products(start: int, end: int) -> Dict[str, Any]:
+    rng = _rng("products", start)
+    first = _plan["first_product"]
+    rows = []
+    for offset in range(start, end):
+        unit_price, tax_percentage = _plan["prices"][offset]
+        rows.append(
+            (
+                first + offset,
+                f"Product {first + offset}",
+                f"GEN{first + offset:08d}",
+                rng.randint(0, 5000),
+                unit_price,
+                tax_percentage,
+            )
+        )
+    return {"products": _encode(rows)}
+
+
+def generate_customers(start: int, end: int) -> Dict[str, Any]:
+    first = _plan["first_customer"]
+    rows = [(first + offset, f"customer{first + offset}@example.com") for offset in range(start, end)]
+    return {"customers": _encode(rows)}
+
+
+def generate_bills(start: int, end: int) -> Dict[str, Any]:
+    rng = _rng("bills", start)
+    plan = _plan
+    first_bill, first_product, first_customer = (
+        plan["first_bill"], plan["first_product"], plan["first_customer"]
+    )
+    span = plan["days"] * 86400 / max(plan["bills"], 1)
+    began = plan["began"]
+    product_range = range(plan["products"])
+    customer_range = range(plan["customers"])
+    drawer = [(value, 1 << 30) for value in NOTES]
+
+    bills, items, change = [], [], []
+    for offset in range(start, end):
+        bill_id = first_bill + offset
+        created_at = began + timedelta(seconds=offset * span + rng.random() * span)
+        # Most baskets are small; a few are large
+        lines = min(1 + int(rng.expovariate(1 / plan["mean_items"])), plan["max_items"])
+        chosen = rng.choices(product_range, cum_weights=plan["product_weights"], k=lines)
+        total = tax = Decimal("0")
+        for index in dict.fromkeys(chosen):
+            unit_price, tax_percentage = plan["prices"][index]
+            quantity = 1 + int(rng.expovariate(1.5))
+            line_tax, line_total = price_line(unit_price, tax_percentage, quantity)
+            total = add_amount(total, line_total)
+            tax = add_amount(tax, line_tax)
+            items.append(
+                (
+                    bill_id, first_product + index, quantity, unit_price, tax_percentage,
+                    float(line_tax), float(line_total), created_at,
+                )
+            )
+        rounded = round_total(total)
+        # Paid exactly, or rounded up to the next 100 or 500
+        paid = rng.choice([rounded, -(-rounded // 100) * 100, -(-rounded // 500) * 500])
+        for note in compute_change(paid - rounded, drawer)[0]:
+            change.append((bill_id, plan["denomination_ids"][note["value"]], note["count"]))
+        customer = rng.choices(customer_range, cum_weights=plan["customer_weights"])[0]
+        bills.append(
+            (
+                bill_id, first_customer + customer, float(total), float(rounded),
+                float(tax), float(paid), float(paid - rounded), created_at, True,
+            )
+        )
+    return {
+        "bills": _encode(bills),
+        "bill_items": _encode(items),
+        "bill_denominations": _encode(change),
+    }
+
+
+class Writer:
+    """Appends generated chunks in one transaction per chunk"""
+
+    COLUMNS = {
+        "products": PRODUCT_COLUMNS,
+        "customers": CUSTOMER_COLUMNS,
+        "bills": BILL_COLUMNS,
+        "bill_items": ITEM_COLUMNS,
+        "bill_denominations": CHANGE_COLUMNS,
+    }
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.copy = engine.dialect.name == "postgresql"
+        self.rows: Dict[str, int] = dict.fromkeys(self.COLUMNS, 0)
+
+    def write(self, chunk: Dict[str, Any]) -> None:
+        with self.engine.begin() as conn:
+            for table, payload in chunk.items():
+                if self.copy:
+                    self._copy(conn, table, payload)
+                    self.rows[table] += payload.count("\n")
+                elif payload:
+                    columns = self.COLUMNS[table]
+                    conn.execute(
+                        insert(Base.metadata.tables[table]),
+                        [dict(zip(columns, row)) for row in payload],
+                    )
+                    self.rows[table] += len(payload)
+
+    def _copy(self, conn: Connection, table: str, payload: str) -> None:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(self.COLUMNS[table])}) FROM STDIN WITH (FORMAT csv)",
+                io.StringIO(payload),
+            )
+        finally:
+            cursor.close()
+
+    def finish(self) -> None:
+        if not self.copy:
+            return
+        # Explicit ids bypassed the sequences; move them past the new rows
+        with self.engine.begin() as conn:
+            for table in self.COLUMNS:
+                conn.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"COALESCE((SELECT MAX(id) FROM {table}), 1))"
+                    )
+                )
+
+
+def _max_id(conn: Connection, model) -> int:
+    return conn.execute(select(func.max(model.id))).scalar() or 0
+
+
+def ensure_denominations(engine: Engine) -> Dict[int, int]:
+    with engine.begin() as conn:
+        existing = dict(conn.execute(select(Denomination.value, Denomination.id)).all())
+        missing = [{"value": value, "count": 1000} for value in NOTES if value not in existing]
+        if missing:
+            conn.execute(insert(Denomination), missing)
+            existing = dict(conn.execute(select(Denomination.value, Denomination.id)).all())
+    return existing
+
+
+def _chunks(total: int, size: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def generate(
+    engine: Engine,
+    products: int,
+    customers: int,
+    bills: int,
+    seed: int = 42,
+    skew: float = 1.1,
+    customer_skew: float = 0.6,
+    mean_items: float = 2.5,
+    max_items: int = 25,
+    days: int = 365,
+    workers: Optional[int] = None,
+    chunk_size: int = 20_000,
+    log=print,
+) -> Dict[str, int]:
+    """Append the requested volumes and return the rows written per table"""
+    if bills and (products < 1 or customers < 1):
+        raise ValueError("Bills need at least one product and one customer")
+    Base.metadata.create_all(bind=engine)
+    denomination_ids = ensure_denominations(engine)
+    with engine.connect() as conn:
+        first_product = _max_id(conn, Product) + 1
+        first_customer = _max_id(conn, Customer) + 1
+        first_bill = _max_id(conn, Bill) + 1
+
+    writer = Writer(engine)
+    plan = {
+        "seed": seed,
+        "skew": skew,
+        "customer_skew": customer_skew,
+        "mean_items": mean_items,
+        "max_items": max_items,
+        "days": days,
+        "products": products,
+        "customers": customers,
+        "bills": bills,
+        "first_product": first_product,
+        "first_customer": first_customer,
+        "first_bill": first_bill,
+        "denomination_ids": denomination_ids,
+        "began": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "copy": writer.copy,
+    }
+    with Pool(workers, initializer=_init_worker, initargs=(plan,)) as pool:
+        for name, job, total in (
+            ("products", generate_products, products),
+            ("customers", generate_customers, customers),
+            ("bills", generate_bills, bills),
+        ):
+            started = time.perf_counter()
+            # imap keeps chunk order, so ids go into the tables in order
+            for chunk in pool.imap(_star(job), _chunks(total, chunk_size)):
+                writer.write(chunk)
+            if total:
+                log(f"{name}: {total} in {time.perf_counter() - started:.1f}s")
+    writer.finish()
+    return writer.rows
+
+
+class _star:
+    """Picklable ``lambda args: job(*args)`` for Pool.imap"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def __call__(self, args):
+        return self.job(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Defaults to the app's DATABASE_URL")
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--bills", type=int, default=1_000_000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for product popularity")
+    parser.add_argument("--customer-skew", type=float, default=0.6)
+    parser.add_argument("--mean-items", type=float, default=2.5)
+    parser.add_argument("--max-items", type=int, default=25)
+    parser.add_argument("--days", type=int, default=365, help="Bills are spread over this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    args = parser.parse_args()
+
+    if args.database_url:
+        url = args.database_url
+    else:
+        from app.core.config import settings
+
+        url = settings.DATABASE_URL
+    engine = create_engine(url)
+    rows = generate(
+        engine,
+        products=args.products,
+        customers=args.customers,
+        bills=args.bills,
+        seed=args.seed,
+        skew=args.skew,
+        customer_skew=args.customer_skew,
+        mean_items=args.mean_items,
+        max_items=args.max_items,
+        days=args.days,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+    print(", ".join(f"{table}: {count}" for table, count in rows.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Prefork launcher for production serving.
+
+The app is imported once in the master so workers share its pages
+copy-on-write. The database is initialised once, then N workers are forked
+onto a shared listening socket. Each worker binds an invalidation socket in
+a common directory so cache changes reach its siblings. Crashed workers are
+replaced; SIGINT/SIGTERM shut everything down.
+
+    python scripts/serve.py --workers 4 --port 8000
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import uvicorn
+
+from app.core.config import settings
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args: argparse.Namespace) -> None:
+    from app.db.session import engine
+
+    # Connections opened by the master must not be shared with the children
+    engine.dispose(close=False)
+    config = uvicorn.Config(app, log_level=args.log_level, access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(app, sock: socket.socket, args: argparse.Namespace) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            run_worker(app, sock, args)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket-dir", help="Directory for invalidation sockets")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    settings.INVALIDATION_SOCKET_DIR = args.socket_dir or tempfile.mkdtemp(
+        prefix="billing-workers-"
+    )
+    settings.INIT_DB_ON_STARTUP = False
+
+    # Preload: everything imported here is shared copy-on-write after fork
+    from app.db.session import engine
+    from app.main import app, init_db
+
+    init_db()
+    engine.dispose()
+
+    sock = bind_socket(args.host, args.port)
+    workers = {spawn(app, sock, args) for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            time.sleep(0.5)
+            workers.add(spawn(app, sock, args))
+
+
+if __name__ == "__main__":
+    main()
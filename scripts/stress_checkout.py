@@ -0,0 +1,323 @@
+"""Concurrent checkout stress harness.
+
+Runs many ``create_bill`` calls at once from a thread pool against a real
+database, drawing SKUs from a Zipf distribution so a few hot products take
+most of the traffic, then checks the invariants concurrent tills rely on:
+
+- no product's stock goes negative, and stock + units sold equals the seed
+- each drawer count equals seed + notes received - notes paid out as change
+- every bill's change denominations add up to its balance
+
+and reports throughput, latency, time spent waiting for row/database locks
+and how many attempts failed on deadlocks or lock timeouts and were retried.
+
+    python scripts/stress_checkout.py --bills 2000 --concurrency 16 --skew 1.2
+    python scripts/stress_checkout.py --database-url postgresql://... --skus 50
+
+Without ``--database-url`` a fresh file-backed SQLite database is used. A
+database given explicitly must be empty, since the drawer and change checks
+cover every bill in it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.background import BackgroundTasks
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.core.exceptions import InsufficientStockError
+from app.db.session import SessionLocal, configure_sqlite
+from app.models.models import (Base, Bill, BillDenomination, BillItem,
+                               Denomination, Product)
+from app.schemas.schemas import BillCreate
+from app.services.billing_service import BillingService
+from app.services.catalog_cache import catalog_cache
+from app.services.drawer_cache import drawer_cache
+from app.services.pricing import add_amount, price_line, round_total
+
+NOTES = [500, 200, 100, 50, 20, 10, 5, 2, 1]
+# Postgres deadlock_detected / serialization_failure / lock_not_available
+_RETRYABLE_PGCODES = {"40P01", "40001", "55P03"}
+
+
+@dataclass
+class StressReport:
+    bills: int = 0
+    out_of_stock: int = 0
+    failed: int = 0
+    retries: int = 0
+    deadlocks: int = 0
+    seconds: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    lock_wait_seconds: float = 0.0
+    violations: List[str] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, object]:
+        latencies = sorted(self.latencies) or [0.0]
+        return {
+            "bills": self.bills,
+            "out_of_stock": self.out_of_stock,
+            "failed": self.failed,
+            "retries": self.retries,
+            "deadlocks": self.deadlocks,
+            "bills_per_second": round(self.bills / self.seconds, 1) if self.seconds else 0,
+            "latency_p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "latency_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+            "lock_wait_ms": round(self.lock_wait_seconds * 1000, 2),
+            "violations": self.violations,
+        }
+
+
+class LockTimer:
+    """Time spent in statements that wait for locks.
+
+    That is ``SELECT ... FOR UPDATE`` on databases with row locks, and the
+    ``BEGIN IMMEDIATE`` that takes SQLite's write lock.
+    """
+
+    def __init__(self, engine: Engine):
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        if "FOR UPDATE" in statement or statement.startswith("BEGIN IMMEDIATE"):
+            with self._lock:
+                self.seconds += time.perf_counter() - self._local.started
+
+
+def is_retryable(error: Exception) -> bool:
+    """Version conflicts, deadlocks, serialization failures and lock timeouts"""
+    if isinstance(error, StaleDataError):
+        return True
+    if getattr(error.orig, "pgcode", None) in _RETRYABLE_PGCODES:
+        return True
+    return isinstance(error, OperationalError) and "locked" in str(error.orig)
+
+
+def seed(session_factory, skus: int, stock: int, notes: int) -> Dict[str, Dict]:
+    """Fresh catalog and drawer; returns the seeded state for the checks"""
+    rng = random.Random(0)
+    catalog = {
+        f"STRESS{i:04d}": {
+            "unit_price": round(rng.uniform(1, 900), 2),
+            "tax_percentage": rng.choice([0.0, 5.0, 12.0, 18.0]),
+            "stock": stock,
+        }
+        for i in range(skus)
+    }
+    with session_factory() as db:
+        db.add_all(
+            Product(
+                name=sku,
+                product_id=sku,
+                available_stocks=data["stock"],
+                unit_price=data["unit_price"],
+                tax_percentage=data["tax_percentage"],
+            )
+            for sku, data in catalog.items()
+        )
+        drawer = {d.value: d for d in db.query(Denomination)}
+        for value in NOTES:
+            if value in drawer:
+                drawer[value].count = notes
+            else:
+                db.add(Denomination(value=value, count=notes))
+        db.commit()
+    catalog_cache.invalidate()
+    drawer_cache.invalidate()
+    return {"catalog": catalog, "drawer": {value: notes for value in NOTES}}
+
+
+def make_order(rng: random.Random, catalog: Dict[str, Dict], weights: List[float]):
+    """A cart drawn from the hot-SKU distribution, paid in 500s"""
+    skus = list(catalog)
+    lines: Dict[str, int] = Counter()
+    for sku in rng.choices(skus, weights=weights, k=rng.randint(1, 5)):
+        lines[sku] += rng.randint(1, 3)
+    total = Decimal("0")
+    for sku, quantity in lines.items():
+        _, line_total = price_line(
+            catalog[sku]["unit_price"], catalog[sku]["tax_percentage"], quantity
+        )
+        total = add_amount(total, line_total)
+    notes = int(round_total(total)) // 500 + 1
+    return BillCreate(
+        customer_email=f"stress{rng.randint(1, 200)}@example.com",
+        items=[{"product_id": sku, "quantity": q} for sku, q in lines.items()],
+        paid_amount=notes * 500,
+        denomination=[{"value": 500, "count": notes}],
+    )
+
+
+def check_invariants(session_factory, seeded: Dict[str, Dict], received: Counter) -> List[str]:
+    violations = []
+    with session_factory() as db:
+        stocks = dict(
+            db.query(Product.product_id, Product.available_stocks).filter(
+                Product.product_id.in_(seeded["catalog"])
+            )
+        )
+        sold = dict(
+            db.query(Product.product_id, func.sum(BillItem.quantity))
+            .join(BillItem, BillItem.product_id == Product.id)
+            .filter(Product.product_id.in_(seeded["catalog"]))
+            .group_by(Product.product_id)
+        )
+        for sku, data in seeded["catalog"].items():
+            if stocks[sku] < 0:
+                violations.append(f"{sku}: negative stock {stocks[sku]}")
+            if stocks[sku] + (sold.get(sku) or 0) != data["stock"]:
+                violations.append(
+                    f"{sku}: stock {stocks[sku]} + sold {sold.get(sku) or 0} != seeded {data['stock']}"
+                )
+
+        paid_out = dict(
+            db.query(Denomination.value, func.sum(BillDenomination.count))
+            .join(BillDenomination, BillDenomination.denomination_id == Denomination.id)
+            .group_by(Denomination.value)
+        )
+        for value, count in db.query(Denomination.value, Denomination.count):
+            expected = seeded["drawer"].get(value, 0) + received[value] - (paid_out.get(value) or 0)
+            if count != expected:
+                violations.append(f"drawer {value}: {count} != expected {expected}")
+
+        change = dict(
+            db.query(BillDenomination.bill_id, func.sum(BillDenomination.count * Denomination.value))
+            .join(Denomination, BillDenomination.denomination_id == Denomination.id)
+            .group_by(BillDenomination.bill_id)
+        )
+        for bill_id, balance in db.query(Bill.id, Bill.balance_amount):
+            if (change.get(bill_id) or 0) != int(balance):
+                violations.append(
+                    f"bill {bill_id}: change {change.get(bill_id) or 0} != balance {balance}"
+                )
+    return violations
+
+
+def run_stress(
+    engine: Engine,
+    bills: int = 500,
+    concurrency: int = 8,
+    skus: int = 20,
+    skew: float = 1.1,
+    stock: int = 200,
+    notes: int = 10_000,
+    max_retries: int = 5,
+    seed_value: int = 42,
+) -> StressReport:
+    """Seed, hammer ``create_bill`` from ``concurrency`` threads, then verify"""
+    Base.metadata.create_all(bind=engine)
+    # The service's own helpers (the mail flag update) use the app's factory
+    previous_bind = SessionLocal.kw.get("bind")
+    SessionLocal.configure(bind=engine)
+    try:
+        seeded = seed(SessionLocal, skus, stock, notes)
+        timer = LockTimer(engine)
+        weights = [1 / (rank ** skew) for rank in range(1, skus + 1)]
+        report = StressReport()
+        received: Counter = Counter()
+        ledger_lock = threading.Lock()
+
+        def checkout(n: int) -> None:
+            order = make_order(random.Random(seed_value + n), seeded["catalog"], weights)
+            started = time.perf_counter()
+            for attempt in range(max_retries + 1):
+                db = SessionLocal()
+                try:
+                    asyncio.run(BillingService(db).create_bill(order, BackgroundTasks()))
+                except InsufficientStockError:
+                    with ledger_lock:
+                        report.out_of_stock += 1
+                    return
+                except (DBAPIError, StaleDataError) as e:
+                    # StaleDataError is create_bill's own retries running out
+                    db.rollback()
+                    if not is_retryable(e) or attempt == max_retries:
+                        with ledger_lock:
+                            report.failed += 1
+                        return
+                    with ledger_lock:
+                        report.retries += 1
+                        pgcode = getattr(getattr(e, "orig", None), "pgcode", None)
+                        report.deadlocks += pgcode == "40P01"
+                    time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+                    continue
+                finally:
+                    db.close()
+                with ledger_lock:
+                    report.bills += 1
+                    report.latencies.append(time.perf_counter() - started)
+                    for denomination in order.denomination:
+                        received[denomination.value] += denomination.count
+                return
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(checkout, range(bills)))
+        report.seconds = time.perf_counter() - started
+        report.lock_wait_seconds = timer.seconds
+        report.violations = check_invariants(SessionLocal, seeded, received)
+        return report
+    finally:
+        SessionLocal.configure(bind=previous_bind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Defaults to a temporary SQLite file")
+    parser.add_argument("--bills", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--skus", type=int, default=20)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent; 0 is uniform")
+    parser.add_argument("--stock", type=int, default=500, help="Seed stock per SKU")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    url = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(prefix="billing-stress-"), "stress.db"
+    )
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(
+        url, pool_size=args.concurrency, max_overflow=0, connect_args=connect_args
+    )
+    if engine.dialect.name == "sqlite":
+        configure_sqlite(engine)
+    report = run_stress(
+        engine,
+        bills=args.bills,
+        concurrency=args.concurrency,
+        skus=args.skus,
+        skew=args.skew,
+        stock=args.stock,
+        seed_value=args.seed,
+    )
+    print(json.dumps(report.summary(), indent=2))
+    sys.exit(1 if report.violations else 0)
+
+
+if __name__ == "__main__":
+    main()
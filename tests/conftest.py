@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+
+import pytest
+
+from app.db.instrumentation import capture_queries
+
+
+@pytest.fixture
+def max_queries():
+    """Assert an upper bound on the SQL statements a block issues.
+
+    Usage: ``with max_queries(8): client.post(...)``
+    """
+
+    @contextmanager
+    def check(limit: int):
+        with capture_queries() as stats:
+            yield stats
+        assert stats.count <= limit, (
+            f"{stats.count} queries issued, expected at most {limit}:\n"
+            + "\n".join(stats.statements)
+        )
+
+    return check
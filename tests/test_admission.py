@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from app.core.admission import (BILLS, READS, WRITES, AdmissionController,
+                                AdmissionRejected, RouteClass, classify)
+
+
+def make_controller(capacity=1, max_wait=1.0):
+    return AdmissionController(
+        capacity=capacity,
+        classes=[
+            RouteClass(BILLS, 0, limit=5, max_queue=5),
+            RouteClass(READS, 2, limit=5, max_queue=1),
+        ],
+        max_wait=max_wait,
+    )
+
+
+def test_classify():
+    assert classify("POST", "/api/v1/bills/") == BILLS
+    assert classify("POST", "/api/v1/carts/abc/checkout") == BILLS
+    assert classify("GET", "/api/v1/bills/customer/a@b.com") == READS
+    assert classify("GET", "/api/v1/admin/stats") == READS
+    assert classify("PUT", "/api/v1/products/1") == WRITES
+    assert classify("GET", "/api/v1/admin/events") is None
+    assert classify("GET", "/billing") is None
+
+
+def test_bills_are_admitted_before_queued_reads():
+    async def scenario():
+        controller = make_controller()
+        order = []
+
+        async def request(name):
+            await controller.acquire(name)
+            order.append(name)
+            await asyncio.sleep(0)
+            controller.release(name)
+
+        await controller.acquire(READS)
+        waiting = [asyncio.create_task(request(READS))]
+        await asyncio.sleep(0)
+        waiting.append(asyncio.create_task(request(BILLS)))
+        await asyncio.sleep(0)
+        controller.release(READS)
+        await asyncio.gather(*waiting)
+        return order, controller.metrics()
+
+    order, metrics = asyncio.run(scenario())
+    assert order == [BILLS, READS]
+    assert metrics["in_flight"] == 0
+    assert metrics["queued"] == 0
+
+
+def test_full_queue_and_timeouts_are_rejected():
+    async def scenario():
+        controller = make_controller(max_wait=0.05)
+        await controller.acquire(BILLS)
+        queued = asyncio.create_task(controller.acquire(READS))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(READS)  # Queue of one is already taken
+        with pytest.raises(AdmissionRejected):
+            await queued
+        return controller.metrics()
+
+    metrics = asyncio.run(scenario())
+    reads = metrics["classes"][READS]
+    assert reads["rejected"] == 2
+    assert reads["timed_out"] == 1
+    assert reads["queued"] == 0
+    assert metrics["in_flight"] == 1
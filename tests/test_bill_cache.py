@@ -0,0 +1,38 @@
+import os
+import sys
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.bill_cache import BillCache
+
+
+def test_evicts_least_recently_used_within_byte_budget():
+    cache = BillCache(max_bytes=30)
+    cache.put(1, b"x" * 10)
+    cache.put(2, b"y" * 10)
+    cache.put(3, b"z" * 10)
+    assert cache.get(1) is not None
+    cache.put(4, b"w" * 10)
+
+    assert cache.get(2) is None
+    assert set(cache.get_many([1, 3, 4])) == {1, 3, 4}
+    assert cache.size == 30
+
+
+def test_mark_mail_sent_patches_document():
+    cache = BillCache(max_bytes=1024)
+    cache.put(7, b'{"id":7,"mail_sent":false,"items":[]}')
+    cache.mark_mail_sent(7)
+    assert cache.get(7) == b'{"id":7,"mail_sent":true,"items":[]}'
+    assert cache.size == len(b'{"id":7,"mail_sent":true,"items":[]}')
+
+
+def test_with_mail_sent_follows_the_row_either_way():
+    cache = BillCache(max_bytes=1024)
+    sent = b'{"id":7,"mail_sent":true,"items":[]}'
+    cache.put(7, sent)
+    pending = cache.with_mail_sent(7, sent, False)
+    assert pending == b'{"id":7,"mail_sent":false,"items":[]}'
+    assert cache.get(7) == pending
+    assert cache.with_mail_sent(7, pending, False) is pending
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 
@@ -6,14 +7,34 @@ import pytest
 # Add the project root directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from fastapi import BackgroundTasks
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from fastapi_mail import FastMail
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.pool import StaticPool
 
+from app.core.config import settings
+from app.core.events import RESYNC, event_bus
 from app.db.base_class import Base
 from app.db.session import get_db
 from app.main import app
+from app.models.models import Product, StockConflict, SyncOutbox
+from app.schemas.schemas import BillCreate
+from app.services import email_service
+from app.services.analytics_cache import analytics_cache
+from app.services.bill_cache import bill_cache
+from app.services.billing_service import BillingService
+from app.services.catalog_cache import catalog_cache
+from app.services.customer_cache import customer_cache
+from app.services.drawer_cache import drawer_cache
+from app.services import edge_sync
+from app.services.edge_sync import EdgeSync
+from app.services.low_stock import low_stock_tracker
+from app.services.popularity import popularity_index
+from app.services.receipts import receipt_renderer
+from app.services.stock_ledger import StockLedgerService
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -66,6 +87,13 @@ def test_db():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    # Bill ids are reused once the tables are dropped
+    bill_cache.clear()
+    customer_cache.clear()
+    analytics_cache.clear()
+    popularity_index.clear()
+    low_stock_tracker.invalidate()
+    drawer_cache.invalidate()
 
 
 @pytest.fixture
@@ -170,6 +198,97 @@ def test_delete_product(test_db):
     assert get_response.status_code == 404
 
 
+def test_import_products_csv(test_db):
+    client.post("/api/v1/products/", json=test_product)
+    csv_body = (
+        "name,product_id,available_stocks,unit_price,tax_percentage\n"
+        "Renamed Product,TEST001,5,10.50,5\n"
+        "Bulk Product,BULK001,20,1.25,12\n"
+        "Broken Product,BULK002,not-a-number,1.00,5\n"
+    )
+    response = client.post(
+        "/api/v1/products/import",
+        files={"file": ("catalog.csv", csv_body, "text/csv")},
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["received"] == 3
+    assert report["imported"] == 2
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 3
+    assert report["errors"][0]["product_id"] == "BULK002"
+
+    products = {p["product_id"]: p for p in client.get("/api/v1/products/").json()}
+    assert len(products) == 2
+    assert products["TEST001"]["name"] == "Renamed Product"
+    assert products["TEST001"]["available_stocks"] == 5
+
+
+def test_import_counts_products_repeated_across_chunks_once(test_db, monkeypatch):
+    monkeypatch.setattr(settings, "PRODUCT_IMPORT_CHUNK_SIZE", 2)
+    csv_body = (
+        "name,product_id,available_stocks,unit_price,tax_percentage\n"
+        "First,DUP001,1,1.00,0\n"
+        "Other,ONE001,2,1.00,0\n"
+        "Last,DUP001,3,1.00,0\n"
+    )
+    report = client.post(
+        "/api/v1/products/import",
+        files={"file": ("catalog.csv", csv_body, "text/csv")},
+    ).json()
+    assert (report["received"], report["imported"], report["failed"]) == (3, 2, 0)
+    products = {p["product_id"]: p for p in client.get("/api/v1/products/").json()}
+    assert len(products) == 2
+    assert (products["DUP001"]["name"], products["DUP001"]["available_stocks"]) == ("Last", 3)
+
+
+def test_import_products_ndjson(test_db):
+    ndjson_body = (
+        '{"name": "A", "product_id": "NDJ001", "available_stocks": 1, '
+        '"unit_price": 2, "tax_percentage": 0}\n'
+        "not json\n"
+    )
+    response = client.post(
+        "/api/v1/products/import",
+        files={"file": ("catalog.ndjson", ndjson_body, "application/x-ndjson")},
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 1
+    assert report["errors"][0]["row"] == 2
+
+
+def test_bulk_update_stock(test_db):
+    client.post("/api/v1/products/", json=test_product)
+    product2 = {**test_product, "product_id": "TEST002", "available_stocks": 5}
+    client.post("/api/v1/products/", json=product2)
+
+    response = client.post(
+        "/api/v1/products/stock/bulk",
+        json={
+            "adjustments": [
+                {"product_id": "TEST001", "delta": 25},
+                {"product_id": "TEST002", "absolute": 40, "expected_stock": 4},
+                {"product_id": "MISSING", "delta": 1},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["updated"] == [
+        {"id": 1, "product_id": "TEST001", "available_stocks": 125}
+    ]
+    reasons = {r["product_id"]: r["reason"] for r in data["rejected"]}
+    assert reasons["TEST002"].startswith("Stock changed")
+    assert reasons["MISSING"] == "Product not found"
+
+    response = client.post(
+        "/api/v1/products/stock/bulk",
+        json={"adjustments": [{"product_id": "TEST002", "delta": -6}]},
+    )
+    assert response.json()["rejected"][0]["reason"].startswith("Stock cannot go negative")
+
+
 # Bill Tests
 def test_create_bill(setup_test_data):
     response = client.post("/api/v1/bills/", json=test_bill)
@@ -295,3 +414,671 @@ def test_bill_not_found(test_db):
 def test_customer_not_found(test_db):
     response = client.get("/api/v1/bills/customer/nonexistent@example.com")
     assert response.status_code == 404
+
+
+def test_quote_bill(setup_test_data):
+    quote = {
+        "items": [{"product_id": "TEST001", "quantity": 2}],
+        "paid_amount": "500",
+        "denomination": [{"value": 500, "count": 1}],
+    }
+    response = client.post("/api/v1/bills/quote", json=quote)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_amount"] == "235.98"
+    assert data["rounded_total_amount"] == "235"
+    assert data["balance_amount"] == "265.00"
+    assert data["balance_denominations"] == [
+        {"value": 200, "count": 1},
+        {"value": 50, "count": 1},
+        {"value": 10, "count": 1},
+        {"value": 5, "count": 1},
+    ]
+    assert data["problems"] == []
+
+    # Nothing was written
+    product = client.get("/api/v1/products/").json()[0]
+    assert product["available_stocks"] == test_product["available_stocks"]
+    assert client.get("/api/v1/denominations/500").json()["count"] == 10
+
+
+def test_quote_bill_reports_problems(setup_test_data):
+    quote = {
+        "items": [
+            {"product_id": "TEST001", "quantity": 1000},
+            {"product_id": "MISSING", "quantity": 1},
+        ],
+        "paid_amount": "10",
+        "denomination": [{"value": 5, "count": 1}],
+    }
+    response = client.post("/api/v1/bills/quote", json=quote)
+    assert response.status_code == 200
+    problems = response.json()["problems"]
+    assert any("Product not found" in p for p in problems)
+    assert any("Insufficient stock" in p for p in problems)
+    assert any("does not match paid amount" in p for p in problems)
+    assert any("Insufficient payment" in p for p in problems)
+
+
+def test_cart_checkout_uses_locked_prices(setup_test_data, monkeypatch):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    response = client.post(
+        "/api/v1/carts/", json={"items": [{"product_id": "TEST001", "quantity": 1}]}
+    )
+    assert response.status_code == 201
+    cart_id = response.json()["id"]
+
+    response = client.patch(
+        f"/api/v1/carts/{cart_id}/items",
+        json={"items": [{"product_id": "TEST001", "quantity": 2}]},
+    )
+    assert response.status_code == 200
+    assert response.json()["total_amount"] == "235.98"
+
+    # A later price change doesn't affect a line already in the cart
+    client.put(
+        "/api/v1/products/1",
+        json={"product_id": "TEST001", "unit_price": "10.00"},
+    )
+
+    response = client.post(
+        f"/api/v1/carts/{cart_id}/checkout",
+        json={
+            "customer_email": "test@example.com",
+            "paid_amount": "500",
+            "denomination": [{"value": 500, "count": 1}],
+        },
+    )
+    assert response.status_code == 201
+    bill = response.json()["bill"]
+    assert bill["total_amount"] == "235.98"
+    assert bill["items"][0]["unit_price"] == "99.99"
+
+    # The cart is gone once it has been billed
+    assert client.get(f"/api/v1/carts/{cart_id}").status_code == 404
+
+
+def test_cart_unknown_product(setup_test_data):
+    cart_id = client.post("/api/v1/carts/", json={}).json()["id"]
+    response = client.patch(
+        f"/api/v1/carts/{cart_id}/items",
+        json={"items": [{"product_id": "MISSING", "quantity": 1}]},
+    )
+    assert response.status_code == 404
+
+    # Removing a line the cart doesn't have is a no-op, not an error
+    response = client.patch(
+        f"/api/v1/carts/{cart_id}/items",
+        json={"items": [{"product_id": "MISSING", "quantity": 0}]},
+    )
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+
+    response = client.patch(
+        f"/api/v1/carts/{cart_id}/items",
+        json={
+            "items": [
+                {"product_id": "TEST001", "quantity": 1},
+                {"product_id": "MISSING", "quantity": 1},
+            ]
+        },
+    )
+    assert response.status_code == 404
+    assert client.get(f"/api/v1/carts/{cart_id}").json()["items"] == []
+
+
+def test_create_bill_query_count_is_independent_of_cart_size(
+    setup_test_data, monkeypatch, max_queries
+):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    skus = ["TEST001"]
+    for i in range(2, 31):
+        product = dict(test_product, product_id=f"TEST{i:03}", name=f"Product {i}")
+        assert client.post("/api/v1/products/", json=product).status_code == 201
+        skus.append(f"TEST{i:03}")
+
+    # Carts of 1, 6 and 30 lines paid in 500s, each giving change from the
+    # drawer; a statement per line would blow the bound on the big cart
+    counts = []
+    for n, size in enumerate([1, 6, 30]):
+        items = [{"product_id": sku, "quantity": 1 + k % 3} for k, sku in enumerate(skus[:size])]
+        total = sum(117.99 * item["quantity"] for item in items)
+        notes = int(total // 500) + 1
+        bill = {
+            "customer_email": f"cart{n}@example.com",
+            "items": items,
+            "paid_amount": str(500 * notes),
+            "denomination": [{"value": 500, "count": notes}],
+        }
+        with max_queries(20) as stats:
+            response = client.post("/api/v1/bills/", json=bill)
+        assert response.status_code == 201, response.text
+        assert response.json()["balance_denominations"]
+        assert len(response.json()["bill"]["items"]) == size
+        counts.append(stats.count)
+    assert len(set(counts)) == 1, counts
+
+
+def test_edge_till_syncs_offline_bills(setup_test_data, monkeypatch):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    edge_engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=edge_engine)
+    EdgeSession = sessionmaker(autocommit=False, autoflush=False, bind=edge_engine)
+    # The test client talks to the central app, standing in for the WAN link
+    edge = EdgeSync(EdgeSession, client, "till-1")
+    assert edge.seed_drawer()
+    # Pages are keyed on id, so every product arrives exactly once
+    monkeypatch.setattr(edge_sync, "_PAGE_SIZE", 2)
+    for i in range(2, 6):
+        product = dict(test_product, product_id=f"EDGE{i}", name=f"Edge {i}")
+        assert client.post("/api/v1/products/", json=product).status_code == 201
+    assert edge.pull_catalog() == 5
+    for id in range(2, 6):
+        assert client.delete(f"/api/v1/products/{id}").status_code == 200
+    assert edge.pull_catalog() == 1
+    with EdgeSession() as db:
+        assert [sku for (sku,) in db.query(Product.product_id)] == ["TEST001"]
+
+    # Central sells most of the stock while the till is offline
+    client.put("/api/v1/products/1", json={"product_id": "TEST001", "available_stocks": 1})
+
+    monkeypatch.setattr(settings, "EDGE_MODE", True)
+    catalog_cache.invalidate()
+    drawer_cache.invalidate()
+    with EdgeSession() as db:
+        bill, _ = asyncio.run(
+            BillingService(db).create_bill(
+                BillCreate(
+                    customer_email="offline@example.com",
+                    items=[{"product_id": "TEST001", "quantity": 2}],
+                    paid_amount="500",
+                    denomination=[{"value": 500, "count": 1}],
+                ),
+                BackgroundTasks(),
+            )
+        )
+        sync_id = bill.sync_id
+        assert db.query(SyncOutbox).count() == 1
+    monkeypatch.setattr(settings, "EDGE_MODE", False)
+    # Both databases share this process's caches; a real till is its own process
+    catalog_cache.invalidate()
+    customer_cache.clear()
+
+    result = edge.push()
+    assert result["accepted"] == [sync_id]
+    assert result["conflicts"] == [
+        {"sync_id": sync_id, "product_id": "TEST001", "requested": 2, "shortfall": 1}
+    ]
+    assert edge.push() is None
+
+    bills = client.get("/api/v1/bills/customer/offline@example.com").json()["bills"]
+    assert [b["total_amount"] for b in bills] == ["235.98"]
+    with TestingSessionLocal() as db:
+        assert db.query(Product.available_stocks).scalar() == 0
+        assert db.query(StockConflict).one().shortfall == 1
+
+    # A push retried after a lost response is recognised, not billed twice
+    with EdgeSession() as db:
+        db.query(SyncOutbox).update({"synced_at": None})
+        db.commit()
+    assert edge.push()["duplicates"] == [sync_id]
+
+
+def test_repeat_customer_costs_no_customer_queries(
+    setup_test_data, monkeypatch, max_queries
+):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    bill = dict(
+        test_bill,
+        items=[{"product_id": "TEST001", "quantity": 1}],
+        paid_amount="117",
+        denomination=[{"value": v, "count": 1} for v in (100, 10, 5, 2)],
+    )
+    assert client.post("/api/v1/bills/", json=bill).status_code == 201
+
+    with max_queries(20) as stats:
+        assert client.post("/api/v1/bills/", json=bill).status_code == 201
+        response = client.get(f"/api/v1/bills/customer/{bill['customer_email']}")
+    assert len(response.json()["bills"]) == 2
+    assert not [s for s in stats.statements if "customers" in s]
+
+
+def test_customer_upsert_returns_existing_id(test_db):
+    with TestingSessionLocal() as db:
+        first = customer_cache.resolve(db, "upsert@example.com")
+        db.commit()
+    customer_cache.clear()
+    with TestingSessionLocal() as db:
+        # A racing first purchase lands on the same row instead of a unique violation
+        assert customer_cache.resolve(db, "upsert@example.com") == first
+        db.rollback()
+        assert customer_cache.lookup(db, "missing@example.com") is None
+
+
+def test_create_bill_response_matches_stored_bill(
+    setup_test_data, monkeypatch, max_queries
+):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    client.post("/api/v1/products/", json=dict(test_product, product_id="TEST002"))
+    bill = dict(
+        test_bill,
+        items=[
+            {"product_id": "TEST001", "quantity": 2},
+            {"product_id": "TEST002", "quantity": 1},
+        ],
+        paid_amount="500",
+        denomination=[{"value": 500, "count": 1}],
+    )
+    with max_queries(20) as stats:
+        response = client.post("/api/v1/bills/", json=bill)
+    assert response.status_code == 201
+    # Header, all lines and all change rows: one INSERT each, and no reload
+    inserts = [s for s in stats.statements if s.lstrip().startswith("INSERT INTO bill")]
+    assert len(inserts) == 3
+    assert not [s for s in stats.statements if s.lstrip().startswith("SELECT bills")]
+
+    created = response.json()["bill"]
+    bill_cache.clear()
+    stored = client.get(f"/api/v1/bills/{created['id']}").json()
+    # The mail is queued after the bill is serialised for the response
+    assert stored.pop("mail_sent") is True
+    assert created.pop("mail_sent") is False
+    assert created == stored
+
+
+def test_customer_analytics_are_aggregated_and_refreshed(
+    setup_test_data, monkeypatch, max_queries
+):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    client.post("/api/v1/products/", json=dict(test_product, product_id="TEST002", name="Other"))
+    for items in (
+        [{"product_id": "TEST001", "quantity": 2}, {"product_id": "TEST002", "quantity": 1}],
+        [{"product_id": "TEST001", "quantity": 1}],
+    ):
+        bill = dict(
+            test_bill, items=items, paid_amount="500", denomination=[{"value": 500, "count": 1}]
+        )
+        assert client.post("/api/v1/bills/", json=bill).status_code == 201
+    url = f"/api/v1/bills/customer/{test_bill['customer_email']}/analytics"
+
+    analytics = client.get(url).json()
+    # 99.99 + 18% tax = 117.99 per unit; bills of 353.97 and 117.99
+    assert analytics["bill_count"] == 2
+    assert analytics["total_spent"] == "470.00"
+    assert analytics["average_basket"] == {"amount": "235.00", "lines": "1.50", "units": "2.00"}
+    top = [(p["product_id"], p["quantity"], p["spent"], p["bills"]) for p in analytics["top_products"]]
+    assert top == [
+        ("TEST001", 3, "353.97", 2),
+        ("TEST002", 1, "117.99", 1),
+    ]
+    assert [(m["bills"], m["spent"]) for m in analytics["monthly_spend"]] == [(2, "470.00")]
+
+    with max_queries(0):
+        assert client.get(url).json() == analytics
+
+    bill = dict(
+        test_bill,
+        items=[{"product_id": "TEST002", "quantity": 1}],
+        paid_amount="117",
+        denomination=[{"value": v, "count": 1} for v in (100, 10, 5, 2)],
+    )
+    assert client.post("/api/v1/bills/", json=bill).status_code == 201
+    assert client.get(url).json()["bill_count"] == 3
+    assert client.get("/api/v1/bills/customer/nobody@example.com/analytics").status_code == 404
+
+
+def test_top_and_related_products_follow_committed_bills(setup_test_data, monkeypatch):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    for sku in ("TEST002", "TEST003"):
+        client.post("/api/v1/products/", json=dict(test_product, product_id=sku, name=sku))
+    for items in (
+        [{"product_id": "TEST001", "quantity": 1}, {"product_id": "TEST002", "quantity": 1}],
+        [{"product_id": "TEST001", "quantity": 2}, {"product_id": "TEST003", "quantity": 1}],
+        [{"product_id": "TEST001", "quantity": 1}, {"product_id": "TEST002", "quantity": 1}],
+    ):
+        bill = dict(test_bill, items=items, paid_amount="500", denomination=[{"value": 500, "count": 1}])
+        assert client.post("/api/v1/bills/", json=bill).status_code == 201
+
+    top = client.get("/api/v1/products/top?limit=2").json()
+    assert [(r["product"]["product_id"], r["count"]) for r in top] == [("TEST001", 4), ("TEST002", 2)]
+    related = client.get(f"/api/v1/products/{top[0]['product']['id']}/related").json()
+    assert [(r["product"]["product_id"], r["count"]) for r in related] == [("TEST002", 2), ("TEST003", 1)]
+    assert client.get("/api/v1/products/999/related").status_code == 404
+
+
+def test_low_stock_follows_reorder_thresholds(setup_test_data, monkeypatch, max_queries):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    product = client.post(
+        "/api/v1/products/",
+        json=dict(test_product, product_id="TEST002", available_stocks=3, reorder_threshold=2),
+    ).json()
+    assert product["reorder_threshold"] == 2
+    assert client.get("/api/v1/products/low-stock").json() == []
+    with TestingSessionLocal() as db:
+        assert low_stock_tracker.count(db) == 0
+
+    # A sale takes it under its own threshold; the default of 10 is not used
+    bill = dict(
+        test_bill,
+        items=[{"product_id": "TEST002", "quantity": 2}],
+        paid_amount="500",
+        denomination=[{"value": 500, "count": 1}],
+    )
+    assert client.post("/api/v1/bills/", json=bill).status_code == 201
+    assert [p["product_id"] for p in client.get("/api/v1/products/low-stock").json()] == ["TEST002"]
+    with max_queries(0), TestingSessionLocal() as db:
+        assert low_stock_tracker.count(db) == 1
+
+    # Lowering the threshold alone clears it, as does restocking
+    update = {"product_id": "TEST002", "reorder_threshold": 1}
+    assert client.put(f"/api/v1/products/{product['id']}", json=update).status_code == 200
+    with max_queries(0), TestingSessionLocal() as db:
+        assert low_stock_tracker.count(db) == 0
+    update["reorder_threshold"] = 5
+    client.put(f"/api/v1/products/{product['id']}", json=update)
+    client.post(
+        "/api/v1/products/stock/bulk",
+        json={"adjustments": [{"product_id": "TEST001", "absolute": 4}]},
+    )
+    with max_queries(0), TestingSessionLocal() as db:
+        assert low_stock_tracker.count(db) == 2
+    client.put(f"/api/v1/products/{product['id']}/stock?quantity=50")
+    low = client.get("/api/v1/products/low-stock").json()
+    assert [p["product_id"] for p in low] == ["TEST001"]
+    with max_queries(0), TestingSessionLocal() as db:
+        assert low_stock_tracker.ids(db) == {p["id"] for p in low}
+
+
+def test_low_stock_count_recovers_from_lost_events(setup_test_data, monkeypatch):
+    with TestingSessionLocal() as db:
+        assert low_stock_tracker.count(db) == 0
+        # Stock taken on another host: no event ever reaches this worker
+        db.execute(text("UPDATE products SET available_stocks = 1"))
+        db.commit()
+        assert low_stock_tracker.count(db) == 0
+        event_bus.dispatch(RESYNC)
+        assert low_stock_tracker.count(db) == 1
+
+        db.execute(text("UPDATE products SET available_stocks = 50"))
+        db.commit()
+        assert low_stock_tracker.count(db) == 1
+        monkeypatch.setattr(low_stock_tracker, "ttl_seconds", 0.0)
+        assert low_stock_tracker.count(db) == 0
+
+
+def test_low_stock_query_uses_partial_index(test_db):
+    with TestingSessionLocal() as db:
+        query = db.query(Product.id).filter(Product.available_stocks < Product.reorder_threshold)
+        compiled = query.statement.compile(compile_kwargs={"literal_binds": True})
+        plan = db.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    assert "ix_products_low_stock" in " ".join(str(row) for row in plan)
+
+
+def test_stock_ledger_records_every_change(setup_test_data, monkeypatch):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    id = client.get("/api/v1/products/").json()[0]["id"]
+    bill = dict(
+        test_bill,
+        items=[{"product_id": "TEST001", "quantity": 1}],
+        paid_amount="500",
+        denomination=[{"value": 500, "count": 1}],
+    )
+    assert client.post("/api/v1/bills/", json=bill).status_code == 201
+    for movement in (
+        {"kind": "receipt", "quantity": 20},
+        {"kind": "return", "quantity": 1, "note": "Unopened"},
+        {"kind": "adjustment", "quantity": -5, "note": "Shrinkage"},
+    ):
+        assert client.post(f"/api/v1/products/{id}/movements", json=movement).status_code == 200
+    assert client.post(
+        f"/api/v1/products/{id}/movements", json={"kind": "receipt", "quantity": -1}
+    ).status_code == 422
+    refused = client.post(
+        f"/api/v1/products/{id}/movements", json={"kind": "adjustment", "quantity": -1000}
+    )
+    assert refused.status_code == 400
+    client.post(
+        "/api/v1/products/stock/bulk",
+        json={"adjustments": [{"product_id": "TEST001", "absolute": 50}]},
+    )
+    client.put(f"/api/v1/products/{id}/stock?quantity=60")
+
+    movements = client.get(f"/api/v1/products/{id}/movements").json()
+    assert [(m["kind"], m["quantity"]) for m in movements] == [
+        ("adjustment", 10),
+        ("adjustment", -65),
+        ("adjustment", -5),
+        ("return", 1),
+        ("receipt", 20),
+        ("sale", -1),
+        ("receipt", 100),
+    ]
+    assert movements[5]["bill_id"] is not None
+    assert client.get(f"/api/v1/products/{id}/stock").json()["available_stocks"] == 60
+
+    # Point in time: the opening receipt and the sale happened in January
+    with TestingSessionLocal() as db:
+        db.execute(
+            text("UPDATE stock_movements SET created_at = '2026-01-01 10:00:00' WHERE id <= 2")
+        )
+        db.commit()
+    assert client.get(
+        f"/api/v1/products/{id}/stock", params={"at": "2026-01-02T00:00:00Z"}
+    ).json()["available_stocks"] == 99
+    assert client.get(
+        f"/api/v1/products/{id}/stock", params={"at": "2025-12-31T00:00:00Z"}
+    ).json()["available_stocks"] == 0
+
+
+def test_stock_ledger_compaction(setup_test_data):
+    id = client.get("/api/v1/products/").json()[0]["id"]
+    client.post(f"/api/v1/products/{id}/movements", json={"kind": "receipt", "quantity": 5})
+    with TestingSessionLocal() as db:
+        db.execute(text("UPDATE stock_movements SET created_at = '2026-01-01 10:00:00' WHERE id = 1"))
+        db.commit()
+        ledger = StockLedgerService(db)
+        assert ledger.compact(settle_seconds=0) == {
+            "snapshots": 1, "opened": 1, "pruned": 0, "drift": []
+        }
+        # Nothing new to roll up
+        assert ledger.compact(settle_seconds=0)["snapshots"] == 0
+
+    client.post(f"/api/v1/products/{id}/movements", json={"kind": "adjustment", "quantity": -2})
+    assert client.get(f"/api/v1/products/{id}/stock").json()["available_stocks"] == 103
+    assert client.get(
+        f"/api/v1/products/{id}/stock", params={"at": "2026-06-01T00:00:00Z"}
+    ).json()["available_stocks"] == 100
+
+    # A change that bypassed the ledger shows up as drift
+    with TestingSessionLocal() as db:
+        db.execute(text("UPDATE products SET available_stocks = 101"))
+        db.commit()
+        result = StockLedgerService(db).compact(settle_seconds=0, retention_days=30)
+    assert result["snapshots"] == 1
+    assert result["pruned"] == 1
+    assert result["drift"] == [
+        {"id": id, "product_id": "TEST001", "ledger": 103, "available_stocks": 101}
+    ]
+    assert client.get(f"/api/v1/products/{id}/stock").json()["available_stocks"] == 103
+    assert len(client.get(f"/api/v1/products/{id}/movements").json()) == 2
+
+
+def test_stock_ledger_without_an_opening_receipt(setup_test_data, monkeypatch):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    # Stock set outside the ledger, as for products that predate it
+    with TestingSessionLocal() as db:
+        product = Product(
+            product_id="LEGACY", name="Legacy", available_stocks=100,
+            unit_price=10, tax_percentage=0,
+        )
+        db.add(product)
+        db.commit()
+        id = product.id
+    bill = dict(
+        test_bill, items=[{"product_id": "LEGACY", "quantity": 3}],
+        paid_amount="30", denomination=[{"value": 10, "count": 3}],
+    )
+    assert client.post("/api/v1/bills/", json=bill).status_code == 201
+    with TestingSessionLocal() as db:
+        db.execute(
+            text("UPDATE stock_movements SET created_at = '2026-01-01 10:00:00' WHERE product_id = :id"),
+            {"id": id},
+        )
+        db.commit()
+
+    def stock(**params):
+        response = client.get(f"/api/v1/products/{id}/stock", params=params)
+        return response.json()["available_stocks"] if response.status_code == 200 else response
+
+    assert stock() == 97
+    assert stock(at="2025-12-31T00:00:00Z") == 100
+
+    with TestingSessionLocal() as db:
+        result = StockLedgerService(db).compact(settle_seconds=0, retention_days=30)
+    assert result["pruned"] == 1 and result["drift"] == []
+    assert stock() == 97
+    # After pruning, times before both the first snapshot and the horizon are refused
+    assert stock(at="2025-12-31T00:00:00Z").status_code == 422
+    client.post(f"/api/v1/products/{id}/movements", json={"kind": "receipt", "quantity": 5})
+    assert stock() == 102
+
+
+def test_cached_bills_take_mail_sent_from_the_row(setup_test_data, monkeypatch):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    bill = dict(
+        test_bill, items=[{"product_id": "TEST001", "quantity": 1}],
+        paid_amount="500", denomination=[{"value": 500, "count": 1}],
+    )
+    id = client.post("/api/v1/bills/", json=bill).json()["bill"]["id"]
+    # Cached by a peer before its mail was marked, with the notice lost
+    with TestingSessionLocal() as db:
+        db.execute(text("UPDATE bills SET mail_sent = 0"))
+        db.commit()
+    bill_cache.clear()
+    assert client.get(f"/api/v1/bills/{id}").json()["mail_sent"] is False
+    with TestingSessionLocal() as db:
+        db.execute(text("UPDATE bills SET mail_sent = 1"))
+        db.commit()
+
+    assert bill_cache.get(id) is not None
+    assert client.get(f"/api/v1/bills/{id}").json()["mail_sent"] is True
+    customer = client.get(f"/api/v1/bills/customer/{test_bill['customer_email']}").json()
+    assert [b["mail_sent"] for b in customer["bills"]] == [True]
+    found = client.get("/api/v1/bills/search", params={"mail_sent": True}).json()["bills"]
+    assert [(b["id"], b["mail_sent"]) for b in found] == [(id, True)]
+
+
+def test_search_bills(setup_test_data, monkeypatch):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    client.post("/api/v1/products/", json=dict(test_product, product_id="TEST002", name="Other"))
+    ids = []
+    for items in (
+        [{"product_id": "TEST001", "quantity": 1}],
+        [{"product_id": "TEST002", "quantity": 1}, {"product_id": "TEST001", "quantity": 1}],
+        [{"product_id": "TEST002", "quantity": 3}],
+    ):
+        bill = dict(test_bill, items=items, paid_amount="500", denomination=[{"value": 500, "count": 1}])
+        response = client.post("/api/v1/bills/", json=bill)
+        assert response.status_code == 201
+        ids.append(response.json()["bill"]["id"])
+
+    def search(**params):
+        response = client.get("/api/v1/bills/search", params=params)
+        assert response.status_code == 200
+        return response.json()
+
+    def found(**params):
+        return [bill["id"] for bill in search(**params)["bills"]]
+
+    assert found() == ids[::-1]
+    # One row per bill even when several of its lines match
+    assert found(product_id="TEST002") == [ids[2], ids[1]]
+    assert found(product_id="TEST001", min_total=200) == [ids[1]]
+    assert found(max_total=200) == [ids[0]]
+    assert found(product_id="NOPE") == []
+    assert found(created_from="2100-01-01T00:00:00Z") == []
+    with TestingSessionLocal() as db:
+        db.execute(text("UPDATE bills SET mail_sent = 0 WHERE id = :id"), {"id": ids[0]})
+        db.commit()
+    assert found(mail_sent=False) == [ids[0]]
+    # Served from the cache, yet the flag agrees with the filter
+    assert [bill["mail_sent"] for bill in search(mail_sent=False)["bills"]] == [False]
+    assert all(bill["mail_sent"] for bill in search(mail_sent=True)["bills"])
+
+    pages, cursor = [], None
+    while True:
+        page = search(limit=1, **({"cursor": cursor} if cursor else {}))
+        pages.append([bill["id"] for bill in page["bills"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == [[ids[2]], [ids[1]], [ids[0]]]
+    assert client.get("/api/v1/bills/search?cursor=nonsense").status_code == 400
+
+    # Only two bills are walked per call; a short page says so and carries on
+    monkeypatch.setattr(settings, "BILL_SEARCH_MAX_SCAN", 2)
+    first = search(product_id="TEST001")
+    assert [bill["id"] for bill in first["bills"]] == [ids[1]]
+    assert first["scan_capped"] and first["next_cursor"]
+    rest = search(product_id="TEST001", cursor=first["next_cursor"])
+    assert [bill["id"] for bill in rest["bills"]] == [ids[0]]
+    assert not rest["scan_capped"] and rest["next_cursor"] is None
+
+
+def test_bill_receipt_pdf(setup_test_data, monkeypatch, tmp_path):
+    monkeypatch.setattr(email_service.conf, "SUPPRESS_SEND", 1)
+    monkeypatch.setattr(receipt_renderer, "cache_dir", tmp_path)
+    monkeypatch.setattr(settings, "RECEIPT_EMAIL_ATTACHMENT", True)
+    bill = dict(
+        test_bill,
+        items=[{"product_id": "TEST001", "quantity": 2}],
+        paid_amount="500",
+        denomination=[{"value": 500, "count": 1}],
+    )
+    with FastMail(email_service.conf).record_messages() as outbox:
+        response = client.post("/api/v1/bills/", json=bill)
+    assert response.status_code == 201
+    bill_id = response.json()["bill"]["id"]
+    # The email carries the receipt, which is then kept for the endpoint
+    assert [part.get_content_type() for part in outbox[0].walk()].count("application/pdf") == 1
+    renders = receipt_renderer.renders
+
+    response = client.get(f"/api/v1/bills/{bill_id}/receipt.pdf")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content.startswith(b"%PDF-1.4")
+    assert client.get(f"/api/v1/bills/{bill_id}/receipt.pdf").content == response.content
+    assert receipt_renderer.renders == renders
+    assert client.get("/api/v1/bills/999/receipt.pdf").status_code == 404
+
+
+def test_drawer_updates_only_guard_the_change_paid_out(setup_test_data, monkeypatch):
+    with TestingSessionLocal() as db:
+        ids = dict(db.execute(text("SELECT value, id FROM denominations")).all())
+        # Another checkout paid with a 500 after this one read the drawer
+        db.execute(
+            text(
+                "UPDATE denominations SET count = count + 1, version = version + 1 "
+                "WHERE value = 500"
+            )
+        )
+        counts = BillingService(db)._apply_drawer_deltas({ids[500]: 1, ids[100]: -30})
+        assert counts == {ids[500]: 12, ids[100]: 0}
+
+        # Change the drawer no longer holds fails the whole update
+        with pytest.raises(StaleDataError):
+            BillingService(db)._apply_drawer_deltas({ids[500]: 1, ids[100]: -1})
+        db.rollback()
+
+    # Conflicts that outlast the retries are a 409 the till can retry
+    async def always_stale(self, bill_create, background_tasks, prices=None):
+        raise StaleDataError("drawer changed concurrently")
+
+    monkeypatch.setattr(BillingService, "create_bill", always_stale)
+    response = client.post("/api/v1/bills/", json=test_bill)
+    assert response.status_code == 409
+    assert response.headers["retry-after"] == "1"
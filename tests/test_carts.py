@@ -0,0 +1,140 @@
+import time
+from decimal import Decimal
+
+import pytest
+
+from app.core.exceptions import (CartConflictError, CartNotFoundError,
+                                 ProductNotFoundError)
+from app.schemas.schemas import CartItemUpdate
+from app.services.cart_service import Cart, CartJournal, CartStore
+from app.services.catalog_cache import PriceSnapshot
+from app.services.pricing import price_line
+
+TEA = PriceSnapshot(1, "TEA", 7.5, 5.0)
+SUGAR = PriceSnapshot(2, "SUGAR", 42.25, 12.0)
+
+
+def test_running_totals_match_full_reprice():
+    cart = Cart(id="c", expires_at=time.time() + 60)
+    cart.set_quantity(TEA, 3)
+    cart.set_quantity(SUGAR, 2)
+    cart.set_quantity(TEA, 5)
+    cart.set_quantity(SUGAR, 0)
+
+    tax, total = price_line(TEA.unit_price, TEA.tax_percentage, 5)
+    assert list(cart.lines) == ["TEA"]
+    assert cart.total_amount == total
+    assert cart.tax_amount == tax
+
+    cart.set_quantity(TEA, 0)
+    assert cart.total_amount == Decimal("0.00")
+
+
+def test_carts_recover_from_journal(tmp_path):
+    path = str(tmp_path / "carts.sqlite3")
+    store = CartStore(CartJournal(path), max_carts=10, ttl_seconds=60)
+    cart = store.create()
+    store.update(
+        cart,
+        {"TEA": TEA, "SUGAR": SUGAR},
+        [CartItemUpdate(product_id="TEA", quantity=2), CartItemUpdate(product_id="SUGAR", quantity=1)],
+    )
+    store.update(cart, {}, [CartItemUpdate(product_id="TEA", quantity=4)])
+
+    # A fresh store stands in for a restarted worker
+    restarted = CartStore(CartJournal(path), max_carts=10, ttl_seconds=60)
+    recovered = restarted.get(cart.id)
+    assert list(recovered.lines) == ["TEA", "SUGAR"]
+    assert recovered.lines["TEA"].quantity == 4
+    assert recovered.lines["SUGAR"].price == SUGAR
+    assert recovered.total_amount == cart.total_amount
+
+
+def test_evicted_carts_reload_and_expired_carts_vanish():
+    store = CartStore(CartJournal(":memory:"), max_carts=1, ttl_seconds=60)
+    first = store.create()
+    store.create()
+    assert store.get(first.id).id == first.id
+
+    expired = store.create()
+    expired.expires_at = time.time() - 1
+    store.journal.save_cart(expired)
+    with pytest.raises(CartNotFoundError):
+        store.get(expired.id)
+
+
+def test_batches_apply_whole_or_not_at_all(tmp_path):
+    path = str(tmp_path / "carts.sqlite3")
+    store = CartStore(CartJournal(path), max_carts=10, ttl_seconds=60)
+    cart = store.create()
+    store.update(
+        cart,
+        {"TEA": TEA},
+        [CartItemUpdate(product_id="TEA", quantity=2), CartItemUpdate(product_id="MILK", quantity=0)],
+    )
+    assert list(cart.lines) == ["TEA"]
+
+    # SUGAR is valid, but MILK is unknown, so neither the cart nor its journal change
+    total = cart.total_amount
+    with pytest.raises(ProductNotFoundError):
+        store.update(
+            cart,
+            {"SUGAR": SUGAR},
+            [
+                CartItemUpdate(product_id="TEA", quantity=9),
+                CartItemUpdate(product_id="SUGAR", quantity=1),
+                CartItemUpdate(product_id="MILK", quantity=1),
+            ],
+        )
+    assert list(cart.lines) == ["TEA"] and cart.lines["TEA"].quantity == 2
+    assert cart.total_amount == total
+    recovered = CartStore(CartJournal(path), max_carts=10, ttl_seconds=60).get(cart.id)
+    assert list(recovered.lines) == ["TEA"] and recovered.lines["TEA"].quantity == 2
+
+    # Lines removed and re-added go to the end
+    store.update(
+        cart,
+        {"SUGAR": SUGAR},
+        [CartItemUpdate(product_id="SUGAR", quantity=1), CartItemUpdate(product_id="TEA", quantity=0)],
+    )
+    store.update(cart, {"TEA": TEA}, [CartItemUpdate(product_id="TEA", quantity=1)])
+    recovered = CartStore(CartJournal(path), max_carts=10, ttl_seconds=60).get(cart.id)
+    assert list(recovered.lines) == list(cart.lines) == ["SUGAR", "TEA"]
+
+
+def test_workers_sharing_a_journal_never_use_a_stale_cart(tmp_path):
+    # Two stores on one journal stand in for two worker processes
+    path = str(tmp_path / "carts.sqlite3")
+    a = CartStore(CartJournal(path), max_carts=10, ttl_seconds=60)
+    b = CartStore(CartJournal(path), max_carts=10, ttl_seconds=60)
+    cart = a.create()
+    a.update(cart, {"TEA": TEA}, [CartItemUpdate(product_id="TEA", quantity=1)])
+    copy = b.get(cart.id)
+
+    a.update(cart, {}, [CartItemUpdate(product_id="TEA", quantity=5)])
+    assert b.get(cart.id).lines["TEA"].quantity == 5
+
+    # An edit based on an outdated copy is refused rather than merged
+    with pytest.raises(CartConflictError):
+        b.update(copy, {}, [CartItemUpdate(product_id="TEA", quantity=2)])
+    assert a.get(cart.id).lines["TEA"].quantity == 5
+
+    # Once one worker starts checking out, the other can neither edit nor
+    # check out the cart, and after the bill it is gone everywhere
+    a.claim(a.get(cart.id))
+    with pytest.raises(CartConflictError):
+        b.claim(b.get(cart.id))
+    with pytest.raises(CartConflictError):
+        b.update(b.get(cart.id), {}, [CartItemUpdate(product_id="TEA", quantity=2)])
+    a.discard(cart.id)
+    with pytest.raises(CartNotFoundError):
+        b.get(cart.id)
+
+
+def test_failed_checkout_gives_the_cart_back():
+    store = CartStore(CartJournal(":memory:"), max_carts=10, ttl_seconds=60)
+    cart = store.create()
+    store.claim(cart)
+    store.release(cart.id)
+    store.update(cart, {"TEA": TEA}, [CartItemUpdate(product_id="TEA", quantity=1)])
+    store.claim(store.get(cart.id))
@@ -0,0 +1,94 @@
+import os
+import sys
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base_class import Base
+from app.models.models import Product
+from app.schemas.schemas import ProductUpdate
+from app.services.catalog_cache import CatalogCache, bump_catalog_version, read_catalog_version
+from app.services.product_service import ProductService
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def setup_function():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add(
+        Product(
+            name="Tea",
+            product_id="TEA",
+            available_stocks=10,
+            unit_price=5.0,
+            tax_percentage=5.0,
+        )
+    )
+    db.commit()
+    db.close()
+
+
+def teardown_function():
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_prices_served_from_cache():
+    cache = CatalogCache(max_entries=10, poll_seconds=60)
+    db = TestingSessionLocal()
+    assert cache.get_prices(db, ["TEA"])["TEA"].unit_price == 5.0
+    assert cache.get_prices(db, ["TEA", "MISSING"]).keys() == {"TEA"}
+    assert cache.hits == 1
+    db.close()
+
+
+def test_other_process_update_seen_through_version_row():
+    # A cache in another worker only learns about updates via the version row
+    remote_cache = CatalogCache(max_entries=10, poll_seconds=0)
+    db = TestingSessionLocal()
+    assert remote_cache.get_prices(db, ["TEA"])["TEA"].unit_price == 5.0
+
+    ProductService(db).update_product(1, ProductUpdate(product_id="TEA", unit_price="7.5"))
+    assert read_catalog_version(db) == 1
+    assert remote_cache.get_prices(db, ["TEA"])["TEA"].unit_price == 7.5
+    db.close()
+
+
+def test_lru_eviction_bounds_entries():
+    db = TestingSessionLocal()
+    for i in range(5):
+        db.add(
+            Product(
+                name=f"P{i}",
+                product_id=f"P{i}",
+                available_stocks=1,
+                unit_price=1.0,
+                tax_percentage=0.0,
+            )
+        )
+    db.commit()
+
+    cache = CatalogCache(max_entries=3, poll_seconds=60)
+    cache.get_prices(db, ["P0", "P1", "P2"])
+    cache.get_prices(db, ["P0"])
+    cache.get_prices(db, ["P3"])
+    assert list(cache._entries) == ["P2", "P0", "P3"]
+    db.close()
+
+
+def test_version_bumps_upsert_the_row():
+    db = TestingSessionLocal()
+    assert read_catalog_version(db) == 0
+    assert [bump_catalog_version(db) for _ in range(3)] == [1, 2, 3]
+    db.commit()
+    assert read_catalog_version(db) == 3
+    db.close()
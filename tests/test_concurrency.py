@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.db.session import begin_write, configure_sqlite
+from app.models.models import Base, Denomination
+from app.services.bill_cache import bill_cache
+from app.services.billing_service import BillingService
+from app.services.catalog_cache import catalog_cache
+from app.services.customer_cache import customer_cache
+from app.services.drawer_cache import drawer_cache
+from scripts.stress_checkout import run_stress
+
+
+@pytest.fixture
+def stress_engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'stress.db'}",
+        pool_size=8,
+        connect_args={"check_same_thread": False},
+    )
+    configure_sqlite(engine)
+    yield engine
+    engine.dispose()
+    # The harness fills the process-wide caches from its own database
+    for cache in (bill_cache, customer_cache):
+        cache.clear()
+    catalog_cache.invalidate()
+    drawer_cache.invalidate()
+
+
+def test_concurrent_checkouts_keep_stock_and_drawer_consistent(stress_engine):
+    # Little stock on a steep distribution, so hot SKUs run out mid-run
+    report = run_stress(
+        stress_engine, bills=120, concurrency=8, skus=10, skew=1.5, stock=40
+    )
+    assert report.violations == []
+    assert report.failed == 0
+    assert report.bills > 0
+    assert report.out_of_stock > 0
+    assert report.bills + report.out_of_stock == 120
+
+
+def test_exhausted_version_conflicts_are_counted_not_fatal(stress_engine, monkeypatch):
+    async def always_stale(self, bill_create, background_tasks, prices=None):
+        raise StaleDataError("drawer changed concurrently")
+
+    monkeypatch.setattr(BillingService, "create_bill", always_stale)
+    report = run_stress(stress_engine, bills=4, concurrency=2, skus=3, max_retries=1)
+    assert (report.bills, report.failed, report.retries) == (0, 4, 4)
+
+
+def test_only_write_transactions_take_the_sqlite_write_lock(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'locks.db'}", connect_args={"timeout": 0.2}
+    )
+    configure_sqlite(engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as writer, Session() as reader:
+        begin_write(writer)
+        writer.add(Denomination(value=500, count=1))
+        writer.flush()
+        # A read doesn't queue behind the open write transaction
+        assert reader.query(Denomination).count() == 0
+        reader.rollback()
+        # A second writer does
+        with pytest.raises(OperationalError, match="locked"):
+            begin_write(reader)
+        writer.commit()
+    engine.dispose()
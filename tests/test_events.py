@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.events import RESYNC, EventBus
+from app.core.invalidation import InvalidationChannel
+
+
+def test_events_delivered_in_order():
+    async def scenario():
+        bus = EventBus(maxsize=10)
+        subscription = bus.subscribe()
+        bus.publish("stock_changed", id=1, available_stocks=5)
+        bus.publish("denomination_changed", value=500, count=3)
+        first = await subscription.get()
+        second = await subscription.get()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.type == "stock_changed"
+    assert first.data == {"id": 1, "available_stocks": 5}
+    assert second.type == "denomination_changed"
+    assert second.encode().startswith("event: denomination_changed\ndata: ")
+
+
+def test_slow_subscriber_gets_resync():
+    async def scenario():
+        bus = EventBus(maxsize=2)
+        subscription = bus.subscribe()
+        for i in range(5):
+            bus.publish("stock_changed", id=i, available_stocks=i)
+        resync = await subscription.get()
+        bus.publish("stock_changed", id=99, available_stocks=1)
+        after = await subscription.get()
+        return resync, after
+
+    resync, after = asyncio.run(scenario())
+    assert resync is RESYNC
+    assert after.data["id"] == 99
+
+
+def test_unsubscribed_receives_nothing():
+    async def scenario():
+        bus = EventBus()
+        subscription = bus.subscribe()
+        bus.unsubscribe(subscription)
+        bus.publish("bill_created", id=1)
+        try:
+            await asyncio.wait_for(subscription.get(), timeout=0.05)
+        except asyncio.TimeoutError:
+            return None
+        return "delivered"
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_invalidation_batches_share_one_datagram(tmp_path):
+    directory = str(tmp_path / "sockets")
+    channel = InvalidationChannel()
+    channel.start(directory)
+    peer = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    peer.bind(os.path.join(directory, "peer.sock"))
+    peer.settimeout(5)
+    try:
+        with channel.batch():
+            channel.broadcast("event", type="bill_created", data={"id": 1})
+            with channel.batch():
+                channel.broadcast("event", type="stock_changed", data={"id": 2})
+            channel.broadcast("bill_mailed", id=1)
+        channel.broadcast("catalog", version=3)
+
+        batch = json.loads(peer.recv(65536))
+        assert [m["topic"] for m in batch["messages"]] == ["event", "event", "bill_mailed"]
+        single = json.loads(peer.recv(65536))
+        assert single["messages"] == [{"topic": "catalog", "data": {"version": 3}}]
+        assert channel.sent == 2
+    finally:
+        peer.close()
+        channel.stop()
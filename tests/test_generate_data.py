@@ -0,0 +1,45 @@
+from sqlalchemy import create_engine, func, select
+
+from app.models.models import Bill, BillDenomination, BillItem, Customer, Denomination, Product
+from scripts.generate_data import generate
+
+
+def dump(engine):
+    with engine.connect() as conn:
+        bills = conn.execute(select(Bill).order_by(Bill.id)).all()
+        items = conn.execute(
+            select(BillItem.bill_id, BillItem.product_id, BillItem.quantity, BillItem.total_amount)
+            .order_by(BillItem.id)
+        ).all()
+        change = dict(
+            conn.execute(
+                select(BillDenomination.bill_id, func.sum(BillDenomination.count * Denomination.value))
+                .join(Denomination, BillDenomination.denomination_id == Denomination.id)
+                .group_by(BillDenomination.bill_id)
+            ).all()
+        )
+        products = conn.execute(select(func.count(Product.id))).scalar()
+        customers = conn.execute(select(func.count(Customer.id))).scalar()
+    return bills, items, change, products, customers
+
+
+def test_generated_data_is_consistent_and_repeatable(tmp_path):
+    dumps = []
+    for workers, name in ((1, "a.db"), (2, "b.db")):
+        engine = create_engine(f"sqlite:///{tmp_path / name}")
+        rows = generate(
+            engine, products=50, customers=30, bills=200, seed=7,
+            workers=workers, chunk_size=64, log=lambda message: None,
+        )
+        assert rows["bills"] == 200 and rows["products"] == 50 and rows["customers"] == 30
+        dumps.append(dump(engine))
+        engine.dispose()
+
+    assert dumps[0] == dumps[1]
+    bills, items, change, products, customers = dumps[0]
+    assert (len(bills), products, customers) == (200, 50, 30)
+    assert {item.bill_id for item in items} == {bill.id for bill in bills}
+    for bill in bills:
+        assert bill.paid_amount - bill.rounded_total_amount == bill.balance_amount
+        assert change.get(bill.id, 0) == bill.balance_amount
+    assert [bill.created_at for bill in bills] == sorted(bill.created_at for bill in bills)
@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, text
+
+from app.db.instrumentation import install, statement_shape, track_queries
+
+
+def test_statement_shape_ignores_parameter_counts():
+    one = statement_shape("SELECT * FROM p WHERE id IN (?)")
+    three = statement_shape("SELECT *\n  FROM p WHERE id IN (?, ?, ?)")
+    assert three == "SELECT * FROM p WHERE id IN (?, ...)"
+    assert one != three  # A single parameter is still its own shape
+    assert statement_shape("INSERT INTO t VALUES (?, ?)") != statement_shape(
+        "INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)"
+    )
+    assert statement_shape("INSERT INTO t VALUES (?, ?), (?, ?)") == statement_shape(
+        "INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)"
+    )
+
+
+def test_track_queries_reports_repeated_shapes():
+    engine = create_engine("sqlite://")
+    install()
+    with track_queries() as stats, engine.connect() as conn:
+        for i in range(3):
+            conn.execute(text("SELECT :i"), {"i": i})
+        conn.execute(text("SELECT 1, 2"))
+    assert stats.count == 4
+    assert stats.repeated(3) == {"SELECT ?": 3}
@@ -0,0 +1,25 @@
+import json
+import logging
+
+from app.core.logging import (ContextFilter, JSONFormatter, bill_id_var,
+                              request_id_var)
+
+
+def test_json_lines_carry_request_and_bill_ids():
+    record = logging.makeLogRecord(
+        {"name": "app.test", "levelname": "INFO", "msg": "bill %s", "args": (7,)}
+    )
+    record.duration_ms = 1.5
+    request_token = request_id_var.set("req-1")
+    bill_token = bill_id_var.set(7)
+    try:
+        ContextFilter().filter(record)
+    finally:
+        bill_id_var.reset(bill_token)
+        request_id_var.reset(request_token)
+
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry["msg"] == "bill 7"
+    assert entry["request_id"] == "req-1"
+    assert entry["bill_id"] == 7
+    assert entry["duration_ms"] == 1.5
@@ -0,0 +1,126 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"),
+    reason="prefork serving needs fork and Unix sockets",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def workers(tmp_path):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'billing.db'}",
+        CART_JOURNAL_PATH=str(tmp_path / "carts.sqlite3"),
+        # Only the invalidation channel may make the caches coherent here
+        CATALOG_VERSION_POLL_SECONDS="3600",
+        DRAWER_CACHE_TTL_SECONDS="3600",
+        ADMISSION_MAX_WAIT_SECONDS="10",
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(ROOT / "scripts" / "serve.py"),
+            "--workers", "3",
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "--socket-dir", str(tmp_path / "sockets"),
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}/api/v1"
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                if httpx.get(f"{base_url}/products/").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            assert time.monotonic() < deadline, "workers did not start"
+            time.sleep(0.1)
+        # Every worker has bound its invalidation socket
+        while len(list((tmp_path / "sockets").glob("*.sock"))) < 3:
+            assert time.monotonic() < deadline, "workers did not join the channel"
+            time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def quote(base_url):
+    # A fresh connection per request lets the kernel spread them over workers
+    response = httpx.post(
+        f"{base_url}/bills/quote",
+        json={
+            "items": [{"product_id": "PROD001", "quantity": 1}],
+            "paid_amount": "2000",
+            "denomination": [{"value": 500, "count": 4}],
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_workers_stay_coherent_after_updates(workers):
+    # Warm every worker's price and drawer caches
+    for _ in range(30):
+        assert quote(workers)["items"][0]["unit_price"] == "999.99"
+
+    product = httpx.get(f"{workers}/products/").json()[0]
+    response = httpx.put(
+        f"{workers}/products/{product['id']}",
+        json={"product_id": "PROD001", "unit_price": "500.00"},
+    )
+    assert response.status_code == 200
+    response = httpx.put(f"{workers}/denominations/500", json={"count": 0})
+    assert response.status_code == 200
+    time.sleep(0.2)
+
+    for _ in range(30):
+        data = quote(workers)
+        assert data["items"][0]["unit_price"] == "500.0"
+        assert all(d["value"] != 500 for d in data["balance_denominations"])
+
+
+def test_carts_are_consistent_across_workers(workers):
+    cart_id = httpx.post(f"{workers}/carts/", json={}).json()["id"]
+    # Each request may land on a different worker; none may serve an old copy
+    for quantity in range(1, 16):
+        response = httpx.patch(
+            f"{workers}/carts/{cart_id}/items",
+            json={"items": [{"product_id": "PROD001", "quantity": quantity}]},
+        )
+        assert response.status_code == 200
+        cart = httpx.get(f"{workers}/carts/{cart_id}").json()
+        assert cart["items"][0]["quantity"] == quantity
+
+    checkout = {
+        "customer_email": "carts@example.com",
+        "paid_amount": "20000",
+        "denomination": [{"value": 500, "count": 40}],
+    }
+    response = httpx.post(f"{workers}/carts/{cart_id}/checkout", json=checkout)
+    assert response.status_code == 201, response.text
+    for _ in range(6):
+        response = httpx.post(f"{workers}/carts/{cart_id}/checkout", json=checkout)
+        assert response.status_code == 404
@@ -0,0 +1,100 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base_class import Base
+from app.services.popularity import PopularityIndex
+
+HOUR = 3600
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000 * HOUR):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_index(clock, top_capacity=3):
+    return PopularityIndex(
+        window_seconds=24 * HOUR,
+        bucket_seconds=HOUR,
+        top_capacity=top_capacity,
+        related_capacity=2,
+        clock=clock,
+    )
+
+
+def test_leaderboard_rolls_over_the_window():
+    clock = FakeClock()
+    index = make_index(clock)
+    index.record(1, [(1, 5), (2, 1)])
+    clock.now += 12 * HOUR
+    index.record(2, [(2, 3), (3, 2), (4, 1)])
+    # Four products compete for three places
+    assert index.top(10) == [(1, 5), (2, 4), (3, 2)]
+    index.record(3, [(4, 2)])
+    assert index.top(10) == [(1, 5), (2, 4), (4, 3)]
+
+    # The first bill's hour falls out of the window
+    clock.now += 13 * HOUR
+    assert index.top(10) == [(2, 3), (4, 3), (3, 2)]
+    assert index.top(1) == [(2, 3)]
+
+
+def test_related_products_are_bounded_and_ranked():
+    index = make_index(FakeClock())
+    index.record(1, [(1, 1), (2, 1), (3, 1)])
+    index.record(2, [(1, 1), (2, 1)])
+    for bill_id, other in enumerate(range(10, 16), start=3):
+        index.record(bill_id, [(1, 1), (other, 1)])
+    related = index.related(1, 10)
+    assert related[0] == (2, 2)
+    assert len(related) <= 2 * index.related_capacity
+    assert index.related(99, 5) == []
+
+
+def test_checkpoint_round_trip(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'popularity.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    clock = FakeClock()
+    index = make_index(clock)
+    index.record(7, [(1, 2), (2, 1)])
+    with Session() as db:
+        assert index.checkpoint(db) is True
+        assert index.checkpoint(db) is False  # Nothing changed since
+
+    restored = make_index(clock)
+    with Session() as db:
+        assert restored.load(db) == 0
+    assert restored.top(5) == index.top(5)
+    assert restored.related(1, 5) == [(2, 1)]
+    assert restored.last_bill_id == 7
+
+
+def test_late_pairs_can_still_climb_and_old_pairs_fade():
+    clock = FakeClock()
+    index = make_index(clock)
+    # Product 1's slots fill with partners that each sold with it three times
+    bill_id = 0
+    for other in (10, 11, 12, 13):
+        for _ in range(3):
+            bill_id += 1
+            index.record(bill_id, [(1, 1), (other, 1)])
+    # A pair that only starts now takes over a slot instead of being
+    # dropped, and is ranked on the co-purchases actually seen
+    for _ in range(4):
+        bill_id += 1
+        index.record(bill_id, [(1, 1), (20, 1)])
+    assert index.related(1, 1) == [(20, 4)]
+    assert len(index.related(1, 10)) == 2 * index.related_capacity
+
+    # A window later the old counts have halved, so current pairs lead
+    clock.now += 24 * HOUR
+    for _ in range(3):
+        bill_id += 1
+        index.record(bill_id, [(1, 1), (30, 1)])
+    related = dict(index.related(1, 10))
+    assert related[30] == 3 and related[20] == 2
+    assert all(count == 1 for other, count in related.items() if other not in (20, 30))
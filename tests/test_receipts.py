@@ -0,0 +1,144 @@
+import asyncio
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import Future
+
+import pytest
+
+from app.core.exceptions import ReceiptQueueFullError
+from app.services.receipt_pdf import render_receipt, write_receipt
+from app.services.receipts import ReceiptRenderer, receipt_data
+
+DOCUMENT = {
+    "id": 7,
+    "customer_email": "test@example.com",
+    "created_at": "2026-03-04T05:06:07Z",
+    "items": [
+        {
+            "product_id": "1",
+            "quantity": 2,
+            "unit_price": "99.99",
+            "tax_percentage": "18.0",
+            "total_amount": "235.98",
+        },
+        {
+            "product_id": "2",
+            "quantity": 1,
+            "unit_price": "10.0",
+            "tax_percentage": "0.0",
+            "total_amount": "10.0",
+        },
+    ],
+    "total_amount": "245.98",
+    "tax_amount": "36.0",
+    "paid_amount": "250.0",
+    "balance_amount": "4.0",
+}
+
+
+def page_text(pdf: bytes) -> bytes:
+    streams = re.findall(rb"stream\n(.*?)\nendstream", pdf, re.S)
+    return b"\n".join(zlib.decompress(stream) for stream in streams)
+
+
+def test_receipt_data_mirrors_the_email():
+    receipt = receipt_data(DOCUMENT, {1: "Widget"})
+    assert receipt["created_at"] == "2026-03-04 05:06:07"
+    assert [item["name"] for item in receipt["items"]] == ["Widget", "Product ID: 2"]
+    assert receipt["items"][0]["unit_price"] == "99.99"
+    assert (receipt["subtotal"], receipt["total_amount"]) == ("209.98", "245.98")
+
+
+def test_render_receipt_is_a_wellformed_deterministic_pdf():
+    receipt = receipt_data(DOCUMENT, {1: "Café (large) ₹"})
+    pdf = render_receipt(receipt)
+    assert pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n")
+    assert pdf == render_receipt(receipt)
+
+    # Every xref entry points at its object
+    xref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    offsets = re.findall(rb"(\d{10}) 00000 n ", pdf[xref:])
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[int(offset):].startswith(b"%d 0 obj" % number)
+
+    text = page_text(pdf)
+    assert b"(Bill Details)" in text
+    assert b"(Caf\xe9 \\(large\\) ?)" in text  # WinAnsi, escaped, unmappable replaced
+    assert b"(Rs. 245.98)" in text
+
+
+def test_long_receipts_continue_on_more_pages():
+    document = dict(DOCUMENT, items=DOCUMENT["items"] * 60)
+    pdf = render_receipt(receipt_data(document, {}))
+    assert int(re.search(rb"/Count (\d+)", pdf).group(1)) >= 3
+    assert page_text(pdf).count(b"(Unit Price)") >= 3
+
+
+def test_renderer_renders_each_bill_once(tmp_path):
+    renderer = ReceiptRenderer(tmp_path, workers=1, max_pending=4)
+    receipt = receipt_data(DOCUMENT, {})
+
+    async def render_twice():
+        return await asyncio.gather(
+            renderer.render(7, receipt), renderer.render(7, receipt)
+        )
+
+    try:
+        first, second = asyncio.run(render_twice())
+        assert first == second == renderer.cached(7)
+        assert first.read_bytes() == render_receipt(receipt)
+        asyncio.run(renderer.render(7, receipt))
+        assert renderer.renders == 1
+    finally:
+        renderer.shutdown()
+
+
+def test_renderer_refuses_work_past_its_queue(tmp_path):
+    renderer = ReceiptRenderer(tmp_path, workers=1, max_pending=0)
+    with pytest.raises(ReceiptQueueFullError):
+        asyncio.run(renderer.render(7, receipt_data(DOCUMENT, {})))
+    assert renderer.rejected == 1 and renderer.cached(7) is None
+
+
+class InlineExecutor:
+    """Renders on submit, so the future is done before render() sees it"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_renderer_survives_a_render_that_finishes_at_once(tmp_path, monkeypatch):
+    renderer = ReceiptRenderer(tmp_path, workers=1, max_pending=4)
+    monkeypatch.setattr(renderer, "_executor", InlineExecutor)
+    receipt = receipt_data(DOCUMENT, {})
+    done = []
+    thread = threading.Thread(
+        target=lambda: done.append(asyncio.run(renderer.render(7, receipt))), daemon=True
+    )
+    thread.start()
+    thread.join(timeout=10)
+    assert done == [renderer.path(7)]
+    assert renderer._pending == {}
+
+
+def test_renderer_evicts_the_oldest_receipts(tmp_path, monkeypatch):
+    renderer = ReceiptRenderer(tmp_path, workers=1, max_pending=4, max_files=3)
+    monkeypatch.setattr(renderer, "_executor", InlineExecutor)
+    receipt = receipt_data(DOCUMENT, {})
+    for bill_id in range(1, 4):
+        write_receipt(str(renderer.path(bill_id)), receipt)
+        os.utime(renderer.path(bill_id), (bill_id, bill_id))
+    (tmp_path / "unrelated.txt").write_text("kept")
+
+    asyncio.run(renderer.render(4, receipt))
+    assert renderer.evicted == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "receipt-2.pdf", "receipt-3.pdf", "receipt-4.pdf", "unrelated.txt"
+    ]
+    # An evicted receipt is simply rendered again
+    asyncio.run(renderer.render(1, receipt))
+    assert renderer.cached(1) is not None and renderer.cached(2) is None
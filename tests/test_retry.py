@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.core.config import settings
+from app.core.exceptions import DatabaseError
+from app.core.retry import retry_on_conflict, retry_reason, retry_stats
+from app.models.models import Base, Denomination
+from app.schemas.schemas import DenominationUpdate
+from app.services.denomination_service import DenominationService
+
+
+@pytest.fixture(autouse=True)
+def reset_stats(monkeypatch):
+    monkeypatch.setattr(settings, "RETRY_BASE_DELAY_SECONDS", 0)
+    retry_stats.reset()
+    yield
+    retry_stats.reset()
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retry.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+def test_retry_reason_looks_through_wrapped_errors():
+    try:
+        try:
+            raise StaleDataError("row changed")
+        except StaleDataError as e:
+            raise DatabaseError(f"Failed to update: {e}")
+    except DatabaseError as wrapped:
+        assert retry_reason(wrapped) == "stale"
+    assert retry_reason(ValueError("nope")) is None
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "RETRY_MAX_ATTEMPTS", 3)
+
+    class Service:
+        calls = 0
+        rollbacks = 0
+
+        class db:
+            @staticmethod
+            def rollback():
+                Service.rollbacks += 1
+
+        @retry_on_conflict
+        def work(self):
+            Service.calls += 1
+            raise StaleDataError("always stale")
+
+    with pytest.raises(StaleDataError):
+        Service().work()
+    assert (Service.calls, Service.rollbacks) == (3, 2)
+    name = "test_gives_up_after_max_attempts.<locals>.Service.work"
+    assert retry_stats.snapshot() == {
+        "retries": {f"{name}:stale": 2},
+        "exhausted": {f"{name}:stale": 1},
+    }
+
+
+def test_stale_update_is_rerun_against_current_row(session_factory):
+    with session_factory() as setup:
+        setup.add(Denomination(value=500, count=10))
+        setup.commit()
+
+    with session_factory() as db, session_factory() as other:
+        service = DenominationService(db)
+        # Held, so it stays in db's identity map at version 1
+        loaded = service.get_denomination(500)
+
+        row = other.query(Denomination).one()
+        row.count = 3
+        other.commit()
+        assert row.version == 2
+
+        updated = service.update_denomination_count(500, DenominationUpdate(count=7))
+        assert updated is loaded
+        assert (updated.count, updated.version) == (7, 3)
+
+    assert sum(retry_stats.snapshot()["retries"].values()) == 1
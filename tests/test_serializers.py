@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+# Add the project root directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.models import Base, Bill, BillItem, Customer, Product
+from app.schemas.schemas import Bill as BillSchema
+from app.schemas.serializers import dumps, serialize_bill
+from app.services.bill_cache import bill_cache
+from app.services.billing_service import BillingService
+
+
+def make_session():
+    bill_cache.clear()
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_fast_serializer_matches_schema():
+    db = make_session()
+    product = Product(
+        name="Pen", product_id="PEN", available_stocks=5, unit_price=0.1, tax_percentage=18.0
+    )
+    customer = Customer(email="pen@example.com")
+    db.add_all([product, customer])
+    db.flush()
+    bill = Bill(
+        customer_id=customer.id,
+        total_amount=0.1 + 0.2,
+        rounded_total_amount=0.0,
+        tax_amount=1e-05,
+        paid_amount=1.0,
+        balance_amount=1,
+        created_at=datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        items=[
+            BillItem(
+                product_id=product.id,
+                quantity=3,
+                unit_price=0.1,
+                tax_percentage=18.0,
+                tax_amount=0.05,
+                total_amount=0.35,
+                created_at=datetime(2024, 5, 1, 12, 30, 15),
+            )
+        ],
+    )
+    db.add(bill)
+    db.commit()
+
+    expected = json.loads(BillSchema.model_validate(bill).model_dump_json())
+    assert json.loads(dumps(serialize_bill(bill))) == expected
+
+    documents = BillingService(db).get_customer_bill_documents("pen@example.com")
+    assert [json.loads(d) for d in documents] == [expected]
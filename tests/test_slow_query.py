@@ -0,0 +1,67 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from app.db.slow_query import SlowQueryLog, fingerprint, install
+
+
+def test_fingerprint_strips_literals():
+    assert fingerprint("SELECT * FROM p WHERE name = 'tea' AND id = 42") == (
+        "SELECT * FROM p WHERE name = ? AND id = ?"
+    )
+    assert fingerprint("SELECT * FROM p WHERE id IN (?, ?, ?)") == fingerprint(
+        "SELECT * FROM p WHERE id IN (?, ?)"
+    )
+
+
+def test_top_aggregates_and_explains_slow_statements():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    log = SlowQueryLog(size=100, threshold_seconds=0.0)
+    install(log, engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE p (id INTEGER PRIMARY KEY, name TEXT)"))
+        for i in range(3):
+            conn.execute(text("SELECT name FROM p WHERE id = :id"), {"id": i})
+
+    rows = {row["fingerprint"]: row for row in log.top(limit=10)}
+    select = rows["SELECT name FROM p WHERE id = ?"]
+    assert select["count"] == 3
+    assert select["slow_count"] == 3
+    assert select["max_ms"] >= select["mean_ms"]
+    assert "SEARCH p USING INTEGER PRIMARY KEY" in select["plan"]
+
+
+def test_ring_keeps_only_recent_statements():
+    log = SlowQueryLog(size=2, threshold_seconds=1.0)
+    for statement in ("SELECT 1", "SELECT a", "SELECT b"):
+        log.record(statement, 0.001, None, None)
+    assert {row["fingerprint"] for row in log.top()} == {"SELECT a", "SELECT b"}
+    assert all(row["plan"] is None for row in log.top())
+
+
+def test_samples_are_kept_per_fingerprint_and_released_once_explained():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    log = SlowQueryLog(size=10, threshold_seconds=0.0)
+    install(log, engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE p (id INTEGER PRIMARY KEY, name TEXT)"))
+        # IN-list variants share one sample, whichever of them ran slowest
+        for n in range(2, 30):
+            conn.exec_driver_sql(
+                f"SELECT name FROM p WHERE id IN ({', '.join('?' * n)})", tuple(range(n))
+            )
+        conn.exec_driver_sql("SELECT id FROM p WHERE name = ?", ("tea",))
+
+    assert len(log._slow_samples) == 3
+    rows = {row["fingerprint"]: row for row in log.top(limit=10)}
+    in_list = rows["SELECT name FROM p WHERE id IN (?, ...)"]
+    assert "SEARCH p USING INTEGER PRIMARY KEY" in in_list["plan"]
+    assert "SCAN p" in rows["SELECT id FROM p WHERE name = ?"]["plan"]
+    # Only the table creation, long gone from the ring, is still waiting
+    assert list(log._slow_samples) == ["CREATE TABLE p (id INTEGER PRIMARY KEY, name TEXT)"]
+    # Explained fingerprints take no new samples
+    log.record("SELECT name FROM p WHERE id IN (?, ?)", 1.0, (1, 2), engine)
+    assert len(log._slow_samples) == 1